@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Probes N loopback targets (127.0.0.0/8) once a second each from one thread.
+
+Usage: sudo python3 benchmarks/icmp_bench.py [targets] [seconds]
+"""
+import ipaddress
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.network.icmp import IcmpEngine  # noqa: E402
+
+
+def main(targets=5000, seconds=10):
+    engine = IcmpEngine()
+    rtts = []
+    addresses = [str(ipaddress.IPv4Address('127.1.0.1') + i) for i in range(targets)]
+    probes = [engine.probe(address, count=None, interval=1.0, timeout=1.0,
+                           callback=lambda target, rtt: rtts.append(rtt)) for address in addresses]
+    started, cpu = time.monotonic(), time.process_time()
+    while time.monotonic() - started < seconds:
+        engine.poll()
+    elapsed, cpu = time.monotonic() - started, time.process_time() - cpu
+    for target in probes:
+        engine.cancel(target)
+    sent = sum(target.sent for target in probes)
+    replies = [rtt for rtt in rtts if rtt is not None]
+    replies.sort()
+    print(f"targets={targets} sent={sent} ({sent / elapsed:.0f}/s) replies={len(replies)} "
+          f"lost={len(rtts) - len(replies)} cpu={cpu / elapsed * 100:.0f}% of one core")
+    if replies:
+        print(f"rtt ms p50={replies[len(replies) // 2]:.3f} p99={replies[int(len(replies) * 0.99)]:.3f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
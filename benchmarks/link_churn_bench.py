@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Interface churn: create, bring up, address and delete links.
+
+Compares the previous `ip` subprocess path with the netlink Links layer.
+Run as root, preferably in a scratch namespace:
+
+    ip netns add bench && ip netns exec bench python3 benchmarks/link_churn_bench.py [count] [kind]
+
+kind defaults to wireguard; use veth where the wireguard module is missing.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from pyroute2 import IPRoute
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.routes.links import Links  # noqa: E402
+
+
+def link_args(kind, i):
+    return ['type', 'veth', 'peer', 'name', f"bench{i}"] if kind == 'veth' else ['type', kind]
+
+
+def subprocess_create(names, kind):
+    for i, ifname in enumerate(names):
+        subprocess.run(['ip', 'link', 'add', 'dev', ifname] + link_args(kind, i), check=True)
+        subprocess.run(['ip', 'link', 'set', 'up', ifname], check=True)
+        subprocess.run(['ip', 'address', 'add', 'dev', ifname, f"10.200.{i >> 8 & 255}.{i & 255}/32"], check=True)
+
+
+def subprocess_delete(names):
+    for ifname in names:
+        subprocess.run(['ip', 'link', 'del', ifname], check=True)
+
+
+def netlink_create(links, names, kind):
+    for i, ifname in enumerate(names):
+        kwargs = {'peer': f"bench{i}"} if kind == 'veth' else {}
+        links.ensure(ifname, kind=kind, address=f"10.200.{i >> 8 & 255}.{i & 255}/32", **kwargs)
+
+
+def netlink_delete(links, names):
+    for ifname in names:
+        links.delete(ifname)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    kind = sys.argv[2] if len(sys.argv) > 2 else 'wireguard'
+    names = [f"{i:010d}p0gNo" for i in range(count)]
+    with IPRoute() as ip_route:
+        links = Links(ip_route)
+        for label, create, delete in (
+                ('ip subprocess', lambda: subprocess_create(names, kind), lambda: subprocess_delete(names)),
+                ('netlink', lambda: netlink_create(links, names, kind), lambda: netlink_delete(links, names)),
+        ):
+            started = time.perf_counter()
+            create()
+            created = time.perf_counter()
+            delete()
+            deleted = time.perf_counter()
+            print(
+                f"{label:14} {count} {kind} links: create {count / (created - started):.0f}/s, "
+                f"delete {count / (deleted - created):.0f}/s"
+            )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Diffs an unchanged CONFIG_INFO payload against matching kernel state.
+
+Usage: python3 benchmarks/reconcile_bench.py [peers] [interfaces]
+"""
+import os
+import sys
+import time
+
+import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.wireguard.reconciler import Reconciler, ActualState  # noqa: E402
+
+
+def make_config(peers, interfaces):
+    vpn = []
+    links, devices, routes = {}, {}, {}
+    for n in range(interfaces):
+        ifname = f"p2p_{n}_bench"
+        vpn.append({'fn': 'create_interface', 'args': {
+            'ifname': ifname, 'internal_ip': f"10.69.{n}.1/24", 'listen_port': 51820 + n,
+        }})
+        links[ifname] = {'index': n + 10, 'up': True, 'addrs': {f"10.69.{n}.1/24"}}
+        devices[ifname] = {'public_key': f"key-{ifname}", 'listen_port': 51820 + n, 'peers': []}
+        routes[ifname] = set()
+    for i in range(peers):
+        ifname = f"p2p_{i % interfaces}_bench"
+        allowed_ips = [f"10.{100 + (i >> 16 & 127)}.{i >> 8 & 255}.{i & 255}/32", f"172.{16 + (i >> 16 & 15)}.{i >> 8 & 255}.{i & 255}/32"]
+        vpn.append({'fn': 'add_peer', 'args': {
+            'ifname': ifname, 'public_key': f"peer-{i}", 'allowed_ips': allowed_ips,
+            'endpoint_ipv4': '192.0.2.1', 'endpoint_port': 51820, 'gw_ipv4': '10.69.0.1',
+        }})
+        devices[ifname]['peers'].append({
+            'public_key': f"peer-{i}", 'allowed_ips': list(allowed_ips),
+            'endpoint': '192.0.2.1:51820', 'keep_alive_interval': 15,
+        })
+        routes[ifname] |= set(allowed_ips)
+    return vpn, ActualState(links, devices, routes, None)
+
+
+def main():
+    peers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    interfaces = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    vpn, state = make_config(peers, interfaces)
+    reconciler = Reconciler(mock.Mock())
+    with mock.patch.object(Reconciler, 'public_key', staticmethod(lambda ifname: f"key-{ifname}")):
+        started = time.perf_counter()
+        changes = reconciler.diff(vpn, state)
+        elapsed = time.perf_counter() - started
+    print(f"{peers} peers on {interfaces} interfaces: {len(changes)} changes, diff {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
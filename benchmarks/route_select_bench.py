@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Times one rerouting decision cycle per destination and over the path matrix.
+
+Usage: python3 benchmarks/route_select_bench.py [destinations] [paths] [cycles]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.rerouting import path_matrix  # noqa: E402
+from platform_agent.rerouting.path_matrix import PathMatrix  # noqa: E402
+from platform_agent.rerouting.path_selector import PathSelector  # noqa: E402
+
+
+def measurements(addresses, rng):
+    latency = [rng.uniform(5, 80) for _ in addresses]
+    loss = [1.0 if rng.random() < 0.01 else 0.0 for _ in addresses]
+    return latency, loss
+
+
+def per_destination(routing_info, addresses, cycles, rng):
+    selector = PathSelector()
+    position = {address: i for i, address in enumerate(addresses)}
+    timings = []
+    for cycle in range(cycles):
+        latency, loss = measurements(addresses, rng)
+        started = time.perf_counter()
+        for dest, routes in routing_info.items():
+            candidates = {}
+            for iface, data in routes['ifaces'].items():
+                i = position[data['internal_ip'].split('/')[0]]
+                candidates[iface] = (latency[i], loss[i])
+            selector.decide(dest, candidates, now=cycle)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def matrix(routing_info, addresses, cycles, rng, vectorised):
+    selector = PathSelector()
+    paths = PathMatrix(routing_info, vectorised=vectorised)
+    assert paths.addresses == addresses
+    timings = []
+    for cycle in range(cycles):
+        latency, loss = measurements(addresses, rng)
+        started = time.perf_counter()
+        selector.decide_matrix(paths, latency, loss, now=cycle)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main(destinations=10000, paths=8, cycles=20):
+    # Every path is a peer on its own interface, each destination is reachable over all of them
+    addresses = [f"10.69.{i}.1" for i in range(paths)]
+    routing_info = {
+        f"10.{dest // 256}.{dest % 256}.0/24": {
+            'ifaces': {f"{i:010d}p0gNo": {'internal_ip': f"{address}/16"} for i, address in enumerate(addresses)}
+        }
+        for dest in range(destinations)
+    }
+    runs = [('per destination', lambda rng: per_destination(routing_info, addresses, cycles, rng))]
+    if path_matrix.np is not None:
+        runs.append(('matrix, numpy', lambda rng: matrix(routing_info, addresses, cycles, rng, True)))
+    runs.append(('matrix, python', lambda rng: matrix(routing_info, addresses, cycles, rng, False)))
+    print(f"{destinations} destinations x {paths} paths, {cycles} cycles")
+    for name, run in runs:
+        # The first cycle installs every route, steady state is what runs every second
+        timings = sorted(run(random.Random(1))[1:])
+        print(f"{name:16} median {timings[len(timings) // 2] * 1000:8.2f} ms  max {timings[-1] * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compares the config_dump file rewrite path with StateStore.
+
+Usage: python3 benchmarks/state_store_bench.py [peers] [legacy_peers]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.files.state_store import StateStore  # noqa: E402
+
+
+def make_cmd(i):
+    return {
+        'fn': 'add_peer',
+        'args': {
+            'ifname': f"{i % 16:010d}p0gNo",
+            'public_key': f"peer-{i}",
+            'allowed_ips': [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/32"],
+            'endpoint_ipv4': '192.0.2.1',
+            'endpoint_port': 51820,
+            'gw_ipv4': '10.69.0.1',
+        },
+        'metadata': {'agent_id': i, 'connection_id': i, 'device_name': f"device-{i}"},
+    }
+
+
+def legacy(path, cmds):
+    """The previous read-parse-rewrite path of update_tmp_config_dump."""
+    for cmd in cmds:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        data.setdefault('vpn', []).append(cmd)
+        with open(path, 'w+') as f:
+            json.dump(data, f, indent=4)
+    with open(path) as f:
+        data = json.load(f)
+    return {cmd['args']['public_key']: cmd['metadata'] for cmd in data['vpn']}
+
+
+def main():
+    peers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    legacy_peers = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        cmds = [make_cmd(i) for i in range(legacy_peers)]
+        start = time.perf_counter()
+        legacy(f"{tmp}/legacy_dump", cmds)
+        elapsed = time.perf_counter() - start
+        print(f"legacy apply  {legacy_peers:>6} peers: {elapsed:8.3f}s ({elapsed / legacy_peers * 1e6:8.1f} us/peer)")
+
+        cmds = [make_cmd(i) for i in range(peers)]
+        store = StateStore(path=f"{tmp}/config_dump")
+        start = time.perf_counter()
+        for cmd in cmds:
+            store.apply(cmd)
+        elapsed = time.perf_counter() - start
+        print(f"store apply   {peers:>6} peers: {elapsed:8.3f}s ({elapsed / peers * 1e6:8.1f} us/peer)")
+
+        start = time.perf_counter()
+        for i in range(peers):
+            store.peer_metadata(f"peer-{i}")
+            store.agent_id(cmds[i]['args']['allowed_ips'][0])
+        elapsed = time.perf_counter() - start
+        print(f"store lookup  {peers:>6} peers: {elapsed:8.3f}s ({elapsed / peers * 1e6:8.1f} us/peer)")
+
+        start = time.perf_counter()
+        StateStore(path=f"{tmp}/config_dump")
+        print(f"store reload  {peers:>6} peers: {time.perf_counter() - start:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
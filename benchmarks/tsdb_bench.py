@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Fills the telemetry store with 10k series to capacity and reports memory and query cost.
+
+Usage: python3 benchmarks/tsdb_bench.py [series] [hours]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platform_agent.lib.tsdb import TimeSeriesStore  # noqa: E402
+
+
+def main(series=10000, hours=50):
+    tracemalloc.start()
+    store = TimeSeriesStore(max_series=series)
+    names = [f"peer.{i:05d}.latency_ms" for i in range(series)]
+    # One point every 5 minutes per series, enough to fill every tier with the defaults
+    start = 1_600_000_000
+    points = 0
+    started = time.perf_counter()
+    for step in range(hours * 12):
+        ts = start + step * 300
+        if step == 360:
+            # Raw ring is full from here on, memory no longer grows with time
+            before = tracemalloc.get_traced_memory()[0]
+        for i, name in enumerate(names):
+            store.record(name, (i + step) % 97, ts)
+        points += series
+    elapsed = time.perf_counter() - started
+    traced = tracemalloc.get_traced_memory()[0]
+    memory = store.memory()
+    end = start + hours * 3600
+    started = time.perf_counter()
+    store.query(names[:100], end - 1800, end, step=300)
+    store.query(names[:100], end - 24 * 3600, end, step=3600)
+    query = (time.perf_counter() - started) / 200
+    print(f"series={memory['series']} points={points} record={points / elapsed:.0f}/s")
+    print(f"arrays={memory['bytes'] / 2 ** 20:.1f} MiB ({memory['bytes'] / series:.0f} B/series) "
+          f"traced={traced / 2 ** 20:.1f} MiB growth after raw ring filled={(traced - before) / 2 ** 20:.1f} MiB")
+    print(f"query={query * 1000:.2f} ms/series")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
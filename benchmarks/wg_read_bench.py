@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Compares `wg show` parsing with the generic netlink reader.
+
+Needs root, the wireguard kernel module and the `wg` tool. Creates a
+temporary interface with 1k and 10k peers and reads it with both paths.
+
+Usage: python3 benchmarks/wg_read_bench.py [peers ...]
+"""
+import base64
+import ipaddress
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nacl.public import PrivateKey  # noqa: E402
+from pyroute2 import IPRoute  # noqa: E402
+
+from platform_agent.cmd.wg_info import WireGuardRead  # noqa: E402
+from platform_agent.wireguard.wg_netlink import WireGuardNetlink  # noqa: E402
+
+IFNAME = 'wgbench0'
+
+
+def add_peers(wg, count):
+    base = ipaddress.ip_address('10.200.0.0')
+    for i in range(count):
+        wg.set(IFNAME, peer={
+            'public_key': base64.b64encode(bytes(PrivateKey.generate().public_key)).decode('ascii'),
+            'endpoint_addr': '192.0.2.1',
+            'endpoint_port': 51820,
+            'persistent_keepalive': 15,
+            'allowed_ips': [f"{base + i}/32"],
+        })
+
+
+def timed(fn, rounds=5):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return (time.perf_counter() - start) / rounds, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    wg = WireGuardNetlink()
+    with IPRoute() as ip_route:
+        ip_route.link('add', ifname=IFNAME, kind='wireguard')
+        try:
+            wg.set(IFNAME, private_key=base64.b64encode(bytes(PrivateKey.generate())).decode('ascii'))
+            peers = 0
+            for size in sizes:
+                add_peers(wg, size - peers)
+                peers = size
+                wg_show, parsed = timed(lambda: WireGuardRead().wg_info(IFNAME))
+                netlink, device = timed(lambda: wg.device(IFNAME))
+                print(f"{size:>6} peers: wg show {wg_show * 1000:9.1f} ms ({len(parsed[0]['peers'])} peers), "
+                      f"netlink {netlink * 1000:9.1f} ms ({len(device['peers'])} peers)")
+        finally:
+            ip_route.link('del', ifname=IFNAME)
+
+
+if __name__ == '__main__':
+    main()
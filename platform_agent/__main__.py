@@ -12,9 +12,11 @@ import argparse
 import atexit
 import logging
 
+from platform_agent.lib.startup import cached_device_id, run_parallel
 from platform_agent.config.logger import configure_logger
 from platform_agent.config.settings import Config, AGENT_PATH_TMP, ConfigException
 from platform_agent.agent_websocket import WebSocketClient
+from platform_agent.lib.capabilities import CAPABILITIES
 
 from pyroute2 import WireGuard
 
@@ -32,14 +34,18 @@ def exit_handler():
 atexit.register(exit_handler)
 
 
-def main(args=None):
-    """ This is executed when run from the command line """
-
+def load_wireguard():
     try:
         WireGuard()
     except:
         # Wireguard module load failed
         pass
+    # Loading the module above may have changed what is available
+    CAPABILITIES.refresh()
+
+
+def main(args=None):
+    """ This is executed when run from the command line """
 
     parser = argparse.ArgumentParser()
 
@@ -77,10 +83,17 @@ def agent(args):
         # Configuring logger globally
         configure_logger()
 
+        # Module loading and the device id lookup (may go to the network) do not depend on each other
+        started = run_parallel({
+            'wireguard': load_wireguard,
+            'device_id': lambda: cached_device_id(WebSocketClient.generate_device_id),
+        })
+
         # Initiating WS client
         client = WebSocketClient(
             os.environ.get('SYNTROPY_CONTROLLER_URL', 'controller-prod-platform-agents.syntropystack.com'),
-            os.environ['SYNTROPY_API_KEY']
+            os.environ['SYNTROPY_API_KEY'],
+            device_id=started['device_id'],
         )
 
         # Starting WS client main thread
@@ -2,21 +2,21 @@ import json
 import logging
 import threading
 import os
+import time
 
 from platform_agent.lib.ctime import now
-from platform_agent.cmd.lsmod import module_loaded
-from platform_agent.files.tmp_files import update_tmp_file
+from platform_agent.lib.capabilities import CAPABILITIES
+from platform_agent.lib.tsdb import TSDB
+from platform_agent.lib.startup import load, network_watcher_class, run_parallel, start
+from platform_agent.files.tmp_files import replace_tmp_config_dump
 from platform_agent.lib.get_info import gather_initial_info
-from platform_agent.network.exporter import NetworkExporter
-from platform_agent.network.kubernetes_watcher import KubernetesNetworkWatcher
 from platform_agent.wireguard import WgConfException, WgConf, WireguardPeerWatcher
-from platform_agent.docker_api.docker_api import DockerNetworkWatcher
-from platform_agent.network.dummy_watcher import DummyNetworkWatcher
+from platform_agent.wireguard.reconciler import Reconciler
 from platform_agent.executors.wg_exec import WgExecutor
 from platform_agent.network.network_info import BWDataCollect
-from platform_agent.network.autoping import AutopingClient
-from platform_agent.network.iperf import IperfServer
 from platform_agent.network.iface_watcher import InterfaceWatcher
+from platform_agent.network.failure_detector import EchoResponder, failure_detection_enabled
+from platform_agent.routes.route_cache import RouteWatcher
 from platform_agent.rerouting.rerouting import Rerouting
 
 logger = logging.getLogger()
@@ -29,23 +29,28 @@ class AgentApi:
         self.wg_peers = None
         self.autoping = None
         self.wgconf = WgConf(self.runner)
+        self.reconciler = Reconciler(self.wgconf)
         self.wg_executor = WgExecutor(self.runner)
         self.bw_data_collector = BWDataCollect(self.runner)
         if prod_mode:
             threading.Thread(target=self.wg_executor.run).start()
             threading.Thread(target=self.bw_data_collector.run).start()
-            self.network_exporter = NetworkExporter().start()
-            self.wg_peers = WireguardPeerWatcher(self.runner).start()
-            self.interface_watcher = InterfaceWatcher().start()
-            if module_loaded("wireguard"):
+            if CAPABILITIES.kernel_wireguard:
                 os.environ["SYNTROPY_WIREGUARD"] = "true"
-            if os.environ.get("SYNTROPY_NETWORK_API", '').lower() == "docker" and prod_mode:
-                self.network_watcher = DockerNetworkWatcher(self.runner).start()
-            if os.environ.get("SYNTROPY_NETWORK_API", '').lower() == "host" and prod_mode:
-                self.network_watcher = DummyNetworkWatcher(self.runner).start()
-            if os.environ.get("SYNTROPY_NETWORK_API", '').lower() == "kubernetes" and prod_mode:
-                self.network_watcher = KubernetesNetworkWatcher(self.runner).start()
-            self.rerouting = Rerouting(self.runner).start()
+            watcher_class = network_watcher_class()
+            # Independent of each other, started at once so none delays the connection
+            started = run_parallel({
+                'network_exporter': lambda: start(load('platform_agent.network.exporter', 'NetworkExporter')()),
+                'wg_peers': lambda: start(WireguardPeerWatcher(self.runner)),
+                'interface_watcher': lambda: start(InterfaceWatcher()),
+                'route_watcher': lambda: start(RouteWatcher()),
+                'network_watcher': lambda: start(watcher_class(self.runner)) if watcher_class else None,
+                'rerouting': lambda: start(Rerouting(self.runner)),
+                # Peers' failure detectors need an answer whether or not this agent runs one
+                'echo_responder': lambda: start(EchoResponder()) if failure_detection_enabled() else None,
+            })
+            for name, subsystem in started.items():
+                setattr(self, name, subsystem)
 
     def call(self, type, data, request_id):
         result = None
@@ -81,26 +86,37 @@ class AgentApi:
         if self.autoping:
             self.autoping.join(timeout=1)
             self.autoping = None
-        self.autoping = AutopingClient(self.runner, **data)
+        self.autoping = load('platform_agent.network.autoping', 'AutopingClient')(self.runner, **data)
         self.autoping.start()
         return False
 
     def CONFIG_INFO(self, data, **kwargs):
-        update_tmp_file(data, 'config_dump')
-        self.wgconf.clear_interfaces(data.get('vpn', []))
-        self.wgconf.clear_peers(data.get('vpn', []))
-        self.wgconf.clear_unused_routes(data.get('vpn', []))
-        response = []
-        for vpn_cmd in data.get('vpn', []):
+        vpn = data.get('vpn', [])
+        state, changes, elapsed = self.reconciler.plan(vpn)
+        if data.get('dry_run'):
+            return {'dry_run': True, **self.reconciler.describe(changes, elapsed)}
+        replace_tmp_config_dump(data)
+        logger.debug(f"[CONFIG_INFO] {len(changes)} changes, state read in {elapsed:.3f}s")
+        results = {}
+        for change in changes:
             try:
-                fn = getattr(self.wgconf, vpn_cmd['fn'])
-                result = fn(**vpn_cmd['args'])
-                if vpn_cmd['fn'] == 'create_interface' and result and\
-                        (vpn_cmd['args'].get('public_key') != result.get('public_key') or
-                         vpn_cmd['args'].get('listen_port') != result.get('listen_port')):
-                    response.append({'fn': vpn_cmd['fn'], 'data': result})
+                result = self.reconciler.apply_change(change)
+                if change.action == 'create_interface':
+                    results[change.ifname] = result
             except WgConfException as e:
                 logger.error(f"[CONFIG_INFO] [{str(e)}]")
+        response = []
+        for vpn_cmd in vpn:
+            if vpn_cmd['fn'] != 'create_interface':
+                continue
+            ifname = vpn_cmd['args']['ifname']
+            result = results.get(ifname)
+            if ifname not in results and state.devices.get(ifname):
+                device = state.devices[ifname]
+                result = {'public_key': device['public_key'], 'listen_port': device['listen_port'], 'ifname': ifname}
+            if result and (vpn_cmd['args'].get('public_key') != result.get('public_key') or
+                           vpn_cmd['args'].get('listen_port') != result.get('listen_port')):
+                response.append({'fn': vpn_cmd['fn'], 'data': result})
         self.runner.send(json.dumps({
             'id': kwargs['request_id'],
             'executed_at': now(),
@@ -108,19 +124,35 @@ class AgentApi:
             'data': response
         }))
 
+    def TELEMETRY_QUERY(self, data, **kwargs):
+        names = data.get('series') or TSDB.names(data.get('prefix', ''))
+        end = data.get('end') or time.time()
+        start = data.get('start') or end - int(data.get('window', 3600))
+        return {
+            'series': TSDB.query(names, start, end, data.get('step')),
+            'memory': TSDB.memory(),
+        }
+
+    def TELEMETRY_ACK(self, data, **kwargs):
+        spool = self.runner.outbound.spool
+        if spool and data.get('seq') is not None:
+            spool.ack(int(data['seq']))
+        return False
+
     def IPERF_SERVER(self, data, **kwargs):
         if self.iperf and data.get('status') == 'off':
             self.iperf.join(timeout=1)
             self.iperf = None
             return 'ok'
         if data.get('status'):
-            self.iperf = IperfServer()
-            IperfServer.start(self.runner)
+            iperf_server = load('platform_agent.network.iperf', 'IperfServer')
+            self.iperf = iperf_server()
+            iperf_server.start(self.runner)
             return 'ok'
 
     def IPERF_TEST(self, data, **kwargs):
         if data.get('hosts') and isinstance(data['hosts'], list):
-            result = IperfServer.test_speed(**data)
+            result = load('platform_agent.network.iperf', 'IperfServer').test_speed(**data)
             return result
         else:
             return {"error": "must be list"}
\ No newline at end of file
@@ -11,6 +11,9 @@ import requests
 import websocket
 
 from platform_agent.lib.ctime import now
+from platform_agent.lib.outbound import OutboundWriter, CONTROL, TELEMETRY
+from platform_agent.lib.spool import open_spool
+from platform_agent.lib.startup import cached_device_id, connected
 from platform_agent.agent_api import AgentApi
 from platform_agent.config.logger import PublishLogToSessionHandler
 from platform_agent.wireguard.helpers import check_if_wireguard_installled
@@ -27,6 +30,8 @@ class AgentRunner:
         self.ws = ws
         self.queue = queue.Queue()
         self.active = None
+        self.outbound = OutboundWriter(ws, spool=open_spool())
+        self.outbound.start()
         self.agent_api = AgentApi(self)
 
         logging.root.addHandler(PublishLogToSessionHandler(self))
@@ -70,28 +75,16 @@ class AgentRunner:
         return json.dumps(payload)
 
     def send(self, message):
-        status = getattr(self.ws, 'sock')
-        if status and status.status:
-            logger.debug(f"[SENDING]: {message}")
-            try:
-                self.ws.send(message)
-            except:
-                pass
-        else:
-            logger.error("[SENDING]: websocket offline")
+        logger.debug(f"[SENDING]: {message}")
+        self.outbound.put(message, CONTROL)
 
     def send_log(self, message):
-        status = getattr(self.ws, 'sock')
-        if status and status.status:
-            try:
-                self.ws.send(message)
-            except:
-                pass
+        self.outbound.put(message, TELEMETRY)
 
 
 class WebSocketClient(threading.Thread):
 
-    def __init__(self, host, api_key, ssl="wss"):
+    def __init__(self, host, api_key, ssl="wss", device_id=None):
         threading.Thread.__init__(self)
 
         if check_if_wireguard_installled():
@@ -107,7 +100,7 @@ class WebSocketClient(threading.Thread):
             self.connection_url,
             header={
                 'authorization': api_key,
-                'x-deviceid': self.generate_device_id(),
+                'x-deviceid': device_id or cached_device_id(self.generate_device_id),
                 'x-devicename': os.environ.get('SYNTROPY_AGENT_NAME', socket.gethostname()),
                 'x-devicestatus': status,
                 'x-agentversion': __version__,
@@ -148,11 +141,13 @@ class WebSocketClient(threading.Thread):
     def on_open(self):
         logger.debug("[WEBSOCKET] Connection open")
         self.agent_runner.active = True
+        connected()
 
     def stop(self):
         self.ws.close()
         self.agent_runner.active = False
         self.agent_runner.queue.put(self.agent_runner.STOP_MESSAGE)
+        self.agent_runner.outbound.join(timeout=1)
 
     @staticmethod
     def getserial():
@@ -166,16 +161,17 @@ class WebSocketClient(threading.Thread):
 
         return cpuserial
 
-    def generate_device_id(self):
+    @classmethod
+    def generate_device_id(cls):
         try:
             with open('/sys/class/dmi/id/product_uuid', 'r') as file:
                 machine_id = file.read().replace('\n', '')
         except FileNotFoundError:
             try:
                 with open('/etc/machine-id', 'r') as file:
-                    machine_id = file.read().replace('\n', '') + requests.get("https://ip.syntropystack.com/").json()
+                    machine_id = file.read().replace('\n', '') + requests.get("https://ip.syntropystack.com/", timeout=10).json()
             except FileNotFoundError:
-                machine_id = self.getserial()
+                machine_id = cls.getserial()
 
         return machine_id
 
@@ -1,17 +1,12 @@
-import subprocess
+import os
+import shutil
 
 
 def module_loaded(module_name):
-    """Checks if module is loaded"""
-    lsmod_proc = subprocess.Popen(['lsmod'], stdout=subprocess.PIPE)
-    grep_proc = subprocess.Popen(['grep', module_name], stdin=lsmod_proc.stdout, stdout=subprocess.PIPE)
-    grep_proc.communicate()  # Block until finished
-    return grep_proc.returncode == 0
+    """Checks if module is loaded, built-in modules with parameters are listed as well"""
+    return os.path.isdir(f"/sys/module/{module_name}")
+
 
 def is_tool(name):
     """Check whether `name` is on PATH and marked as executable."""
-
-    from shutil import which
-
-    return which(name) is not None
-
+    return shutil.which(name) is not None
@@ -1,4 +1,8 @@
+import datetime
 import logging
+import queue
+import threading
+import time
 import uuid
 import json
 import os
@@ -6,7 +10,7 @@ import os
 from logging.config import dictConfig
 from pathlib import Path
 
-from platform_agent.lib.ctime import now
+from platform_agent.lib.metrics import METRICS
 
 logger = logging.getLogger()
 
@@ -25,22 +29,121 @@ class CustomLoggerAdapter(logging.LoggerAdapter):
             kwargs["extra"] = self.extra
         return msg, kwargs
 
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        current = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LogShipper(threading.Thread):
+    """Ships queued log records to the controller in batches.
+
+    Records below SYNTROPY_REMOTE_LOG_LEVEL are not shipped, every severity
+    has its own token bucket (SYNTROPY_REMOTE_LOG_RATE per second, bursts of
+    SYNTROPY_REMOTE_LOG_BURST) and identical records within one flush interval
+    are sent once with a count.
+    """
+
+    def __init__(self, session, flush_interval=0.5, batch_size=500):
+        super().__init__()
+        self.session = session
+        self.log_id = str(uuid.uuid4())
+        self.queue = queue.Queue(maxsize=int(os.environ.get('SYNTROPY_REMOTE_LOG_QUEUE', 10000)))
+        self.level = logging.getLevelName(os.environ.get('SYNTROPY_REMOTE_LOG_LEVEL', 'DEBUG').upper())
+        if not isinstance(self.level, int):
+            self.level = logging.DEBUG
+        self.rate = float(os.environ.get('SYNTROPY_REMOTE_LOG_RATE', 20))
+        self.burst = float(os.environ.get('SYNTROPY_REMOTE_LOG_BURST', 100))
+        self.buckets = {}
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.stop_log_shipper = threading.Event()
+        self.daemon = True
+
+    def put(self, levelno, levelname, message, metadata, created):
+        if levelno < self.level:
+            METRICS.inc('agent_log_suppressed_total', 1, 'Log records not shipped', reason='level')
+            return
+        try:
+            self.queue.put_nowait((levelname, message, metadata, created))
+        except queue.Full:
+            METRICS.inc('agent_log_dropped_total', 1, 'Log records dropped before shipping', reason='queue_full')
+
+    def drain(self):
+        records = []
+        try:
+            records.append(self.queue.get(timeout=self.flush_interval))
+            deadline = time.monotonic() + self.flush_interval
+            while len(records) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                records.append(self.queue.get(timeout=remaining))
+        except queue.Empty:
+            pass
+        return records
+
+    def ship(self, records):
+        grouped = {}
+        for levelname, message, metadata, created in records:
+            key = (levelname, message)
+            if key in grouped:
+                grouped[key][2] += 1
+                METRICS.inc('agent_log_suppressed_total', 1, 'Log records not shipped', reason='duplicate')
+                continue
+            bucket = self.buckets.get(levelname)
+            if bucket is None:
+                bucket = self.buckets[levelname] = TokenBucket(self.rate, self.burst)
+            if not bucket.take():
+                METRICS.inc('agent_log_suppressed_total', 1, 'Log records not shipped', reason='rate_limit')
+                continue
+            grouped[key] = [metadata, created, 1]
+        for (levelname, message), (metadata, created, count) in grouped.items():
+            data = {'severity': levelname, 'message': message, 'metadata': metadata}
+            if count > 1:
+                data['count'] = count
+            self.session.send_log(json.dumps({
+                'id': self.log_id,
+                'executed_at': datetime.datetime.fromtimestamp(created).isoformat(),
+                'type': 'LOGGER',
+                'data': data
+            }))
+
+    def run(self):
+        while not self.stop_log_shipper.is_set():
+            records = self.drain()
+            if records:
+                self.ship(records)
+
+    def join(self, timeout=None):
+        self.stop_log_shipper.set()
+        super().join(timeout)
+
+
 class PublishLogToSessionHandler(logging.Handler):
     def __init__(self, session):
         logging.Handler.__init__(self)
         self.session = session
-        self.log_id = str(uuid.uuid4())
+        self.shipper = LogShipper(session)
+        self.shipper.start()
 
     def emit(self, record):
         if not self.session.active:
             return
         metadata = getattr(record, "metadata", {})
-        self.session.send_log(json.dumps({
-            'id': self.log_id,
-            'executed_at': now(),
-            'type': 'LOGGER',
-            'data': {'severity': record.levelname, 'message': record.getMessage(), 'metadata': metadata}
-        }))
+        self.shipper.put(record.levelno, record.levelname, record.getMessage(), metadata, record.created)
 
 
 def configure_logger():
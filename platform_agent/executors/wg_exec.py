@@ -1,12 +1,12 @@
 import json
 import logging
 import threading
-import time
 import queue
 import traceback
 
 from platform_agent.files.tmp_files import update_tmp_config_dump
 from platform_agent.lib.ctime import now
+from platform_agent.executors.wg_plan import WgPlan
 from platform_agent.wireguard import WgConfException, WgConf
 
 logger = logging.getLogger()
@@ -27,74 +27,82 @@ class WgExecutor(threading.Thread):
         threading.Thread.__init__(self)
 
     def get_from_queue(self):
-        payloads = {}
-        t_end = time.time() + 0.2  # run for 1 second
-        while time.time() < t_end:
+        """Blocks for the next message, then takes everything else already queued."""
+        plan = WgPlan()
+        try:
+            messages = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return plan
+        while True:
             try:
-                message = self.queue.get(timeout=0.1)
+                messages.append(self.queue.get_nowait())
             except queue.Empty:
-                continue
+                break
+        for message in messages:
             request_id = message['request_id']
-            payloads[request_id] = []
             data = message['data'] if type(message['data']) == list else [message['data']]
             for payload in data:
-                try:
-                    payloads[request_id].append(
-                        {
-                            "fn_name": payload['fn'],
-                            "fn_args": payload['args'],
-                            "request_id": request_id
-                        }
-                    )
+                op = plan.add(request_id, payload)
+                if op.status != 'ERROR':
                     update_tmp_config_dump(payload)
-                except AttributeError as e:
-                    logger.warning(e)
-                    payloads[request_id].append(
-                        {"request_id": request_id, "error": f"{e}"})
-        return payloads
+                else:
+                    logger.warning(op.error)
+        return plan
 
     def run(self):
-        while True:
-            payloads = self.get_from_queue()
-            if not payloads:
+        while not self.stop_wg_executor.is_set():
+            plan = self.get_from_queue()
+            if not plan.requests:
                 continue
-            logger.debug(f"[WG_EXECUTOR] - Received {payloads}")
-            for request_id in list(payloads.keys()):
-                try:
-                    self.execute_payload(request_id, payloads)
-                except:  # noqa Catch all errors and report to controller
-                    # Catch all exceptions that not handled
-                    logger.debug(f"[WG_EXECUTOR] - catched error")
+            received = sum(len(operations) for operations in plan.requests.values())
+            logger.debug(f"[WG_EXECUTOR] - Received {received} operations, running {len(plan)}")
+            try:
+                self.execute_plan(plan)
+            except:  # noqa Catch all errors and report to controller
+                # Catch all exceptions that not handled
+                logger.debug(f"[WG_EXECUTOR] - catched error")
+                for request_id in plan.requests:
                     self.send_error(request_id)
+                continue
+            for request_id, operations in plan.requests.items():
+                self.send_response(request_id, operations)
+
+    def execute_plan(self, plan):
+        for op in plan.steps():
+            try:
+                fn = getattr(self.wgconf, op.fn)
+                result = fn(**op.args)
+                op.finish('OK', result)
+            except WgConfException as e:
+                logger.error(f"[WG_EXECUTOR] failed. exception = {str(e)}, data = {op.to_dict()}")
+                op.finish('ERROR', error=str(e))
+            except Exception as e:
+                # Only this operation failed, the others of the plan may already be applied
+                logger.error(
+                    f"[WG_EXECUTOR] failed. exception = {e!r}, data = {op.to_dict()}\n{traceback.format_exc()}"
+                )
+                op.finish('ERROR', error=f"{e!r}")
+            logger.debug(f"[WG_EXECUTOR] - Results {op.result}")
 
-    def execute_payload(self, request_id, payloads):
-        result = {}
+    def send_response(self, request_id, operations):
         ok = {}
         errors = []
-        for payload in payloads[request_id]:
-            if payload.get('error'):
-                errors.append(payload['error'])
-            else:
-                try:
-                    fn = getattr(self.wgconf, payload['fn_name'])
-                    result = fn(**payload['fn_args'])
-                    ok.update(
-                        {"fn": payload['fn_name'], "data": result, "args": payload['fn_args']})
-                except WgConfException as e:
-                    logger.error(f"[WG_EXECUTOR] failed. exception = {str(e)}, data = {payload}")
-                    errors.append({payload['fn_name']: str(e), "args": payload['fn_args']})
-            logger.debug(f"[WG_EXECUTOR] - Results {result}")
-            response = {
-                'id': request_id,
-                'executed_at': now(),
-                'type': self.CMD_TYPE,
-            }
-            if errors:
-                response.update({'error': errors, 'data': {}})
-            elif ok:
-                response.update({'data': ok})
-
-            self.client.send(json.dumps(response))
+        for op in operations:
+            if op.status == 'OK':
+                ok = {"fn": op.fn, "data": op.result, "args": op.args}
+            elif op.status == 'ERROR':
+                errors.append({op.fn: op.error, "args": op.args} if op.fn else op.error)
+        response = {
+            'id': request_id,
+            'executed_at': now(),
+            'type': self.CMD_TYPE,
+        }
+        if errors:
+            response.update({'error': errors, 'data': {}})
+        elif ok:
+            response.update({'data': ok})
+        response['operations'] = [op.to_dict() for op in operations]
+        self.client.send(json.dumps(response))
 
     def join(self, timeout=None):
         self.stop_wg_executor.set()
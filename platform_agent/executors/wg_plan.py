@@ -0,0 +1,110 @@
+PEER_FUNCTIONS = ('add_peer', 'remove_peer')
+INTERFACE_FUNCTIONS = ('create_interface', 'remove_interface')
+REMOVE_FUNCTIONS = ('remove_peer', 'remove_interface')
+
+
+class Operation:
+    __slots__ = ('request_id', 'fn', 'args', 'status', 'result', 'error', 'merged')
+
+    def __init__(self, request_id, fn, args, error=None):
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.status = 'ERROR' if error else None
+        self.result = None
+        self.error = error
+        # Queued operations of the same kind this one stands in for
+        self.merged = []
+
+    def finish(self, status, result=None, error=None):
+        for op in [self] + self.merged:
+            op.status, op.result, op.error = status, result, error
+
+    def to_dict(self):
+        operation = {'fn': self.fn, 'args': self.args, 'status': self.status}
+        if self.status == 'OK':
+            operation['data'] = self.result
+        elif self.error:
+            operation['error'] = self.error
+        return operation
+
+
+class WgPlan:
+    """Coalesces queued WG_CONF operations into the smallest equivalent set.
+
+    Operations are grouped per interface and per (interface, peer). Within a
+    group an add/create replaces earlier adds/creates, a remove replaces
+    everything before it, and a remove followed by an add keeps both.
+    `remove_interface` also cancels queued peer adds on that interface.
+    Groups run in the order they first appeared.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.requests = {}
+        self.calls = 0
+
+    @staticmethod
+    def merge_allowed_ips(args, ops):
+        allowed_ips = list(args.get('allowed_ips') or [])
+        for op in ops:
+            allowed_ips += [ip for ip in op.args.get('allowed_ips') or [] if ip not in allowed_ips]
+        return {**args, 'allowed_ips': allowed_ips}
+
+    def group_key(self, fn, args):
+        if fn in PEER_FUNCTIONS:
+            return 'peer', args.get('ifname'), args.get('public_key')
+        if fn in INTERFACE_FUNCTIONS:
+            return 'iface', args.get('ifname')
+        # Anything else runs as queued
+        self.calls += 1
+        return 'call', self.calls
+
+    def add(self, request_id, payload):
+        try:
+            op = Operation(request_id, payload['fn'], payload['args'])
+        except (AttributeError, KeyError, TypeError) as e:
+            op = Operation(request_id, None, None, error=f"{e}")
+        self.requests.setdefault(request_id, []).append(op)
+        if op.status == 'ERROR':
+            return op
+
+        peer_removes = []
+        if op.fn == 'remove_interface':
+            for key in [key for key in self.groups if key[0] == 'peer' and key[1] == op.args.get('ifname')]:
+                for queued in self.groups.pop(key):
+                    if queued.fn == 'remove_peer':
+                        # Still needed for the firewall clean up, before the interface goes
+                        peer_removes.append(queued)
+                    else:
+                        queued.finish('SUPERSEDED')
+
+        key = self.group_key(op.fn, op.args)
+        group = self.groups.setdefault(key, [])
+        if op.fn in REMOVE_FUNCTIONS:
+            if op.fn == 'remove_peer':
+                # Clean up routes of every add this remove cancels as well
+                op.args = self.merge_allowed_ips(op.args, group)
+            carried = [queued for queued in group if queued.fn == 'remove_peer' and op.fn == 'remove_interface']
+            self.absorb(op, [queued for queued in group if queued not in carried])
+            group[:] = carried + peer_removes + [op]
+        else:
+            keep = [queued for queued in group if queued.fn in REMOVE_FUNCTIONS]
+            self.absorb(op, [queued for queued in group if queued not in keep])
+            group[:] = keep + [op]
+        return op
+
+    @staticmethod
+    def absorb(op, ops):
+        for queued in ops:
+            if queued.fn == op.fn:
+                op.merged += [queued] + queued.merged
+                queued.merged = []
+            else:
+                queued.finish('SUPERSEDED')
+
+    def steps(self):
+        return [op for group in self.groups.values() for op in group]
+
+    def __len__(self):
+        return sum(len(group) for group in self.groups.values())
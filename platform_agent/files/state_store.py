@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+
+from platform_agent.config.settings import AGENT_PATH_TMP
+from platform_agent.lib.generation import CONFIG_GENERATION
+from platform_agent.lib.prefix_tree import PrefixTree
+
+logger = logging.getLogger()
+
+JOURNAL_SUFFIX = '.journal'
+COMPACT_EVERY = 1000
+
+
+class StateStore:
+    """Interface and peer config kept in memory and indexed for O(1) lookups.
+
+    Every change is appended to a journal next to the snapshot file. Once the
+    journal holds `compact_every` entries it is folded into a new snapshot,
+    written to a temporary file and atomically renamed over the old one.
+    """
+
+    def __init__(self, path=None, compact_every=COMPACT_EVERY):
+        self.path = path or f"{AGENT_PATH_TMP}/config_dump"
+        self.journal_path = self.path + JOURNAL_SUFFIX
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
+        self.journal_size = 0
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self.extra = {}
+        self.interfaces = {}
+        self.peers = {}
+        self.peers_by_ifname = {}
+        self.peers_by_agent_id = {}
+        self.ifname_metadata = {}
+        self.prefixes = PrefixTree()
+
+    def load(self):
+        with self.lock:
+            self._reset()
+            try:
+                with open(self.path) as snapshot:
+                    data = json.load(snapshot)
+            except (FileNotFoundError, json.JSONDecodeError):
+                data = {}
+            self._replace(data)
+            self.journal_size = 0
+            try:
+                with open(self.journal_path, 'r+b') as journal:
+                    good = 0
+                    for line in journal:
+                        try:
+                            entry = json.loads(line) if line.endswith(b'\n') else None
+                        except ValueError:
+                            entry = None
+                        if entry is None:
+                            # Torn write at the end of the journal, cut it off so the next entry starts on its own line
+                            journal.truncate(good)
+                            break
+                        self._apply(entry)
+                        self.journal_size += 1
+                        good += len(line)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"[STATE_STORE] journal read failed {e}")
+
+    def replace(self, data):
+        """Replaces the whole state with a CONFIG_INFO dump."""
+        with self.lock:
+            self._reset()
+            self._replace(data)
+            CONFIG_GENERATION.bump()
+            self.compact()
+
+    def apply(self, cmd):
+        """Applies a single WG_CONF command and journals it."""
+        with self.lock:
+            self._apply(cmd)
+            CONFIG_GENERATION.bump()
+            self._append(cmd)
+            if self.journal_size >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        with self.lock:
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as snapshot:
+                    json.dump(self.dump(), snapshot)
+                os.replace(tmp_path, self.path)
+                open(self.journal_path, 'w').close()
+            except OSError as e:
+                logger.warning(f"[STATE_STORE] compaction failed {e}")
+                return
+            self.journal_size = 0
+
+    def _append(self, cmd):
+        try:
+            with open(self.journal_path, 'a') as journal:
+                journal.write(json.dumps(cmd) + '\n')
+        except OSError as e:
+            logger.warning(f"[STATE_STORE] journal write failed {e}")
+            return
+        self.journal_size += 1
+
+    def _replace(self, data):
+        self.extra = {k: v for k, v in data.items() if k != 'vpn'}
+        for cmd in data.get('vpn', []):
+            self._apply(cmd)
+
+    def _apply(self, cmd):
+        fn = cmd.get('fn')
+        args = cmd.get('args') or {}
+        if fn == 'create_interface':
+            self.interfaces[args['ifname']] = cmd
+        elif fn == 'remove_interface':
+            ifname = args.get('ifname')
+            self.interfaces.pop(ifname, None)
+            for public_key in list(self.peers_by_ifname.get(ifname, {})):
+                self._remove_peer(public_key)
+            self.ifname_metadata.pop(ifname, None)
+        elif fn == 'add_peer':
+            self._remove_peer(args['public_key'])
+            self._add_peer(cmd)
+        elif fn == 'remove_peer':
+            peer = self.peers.get(args.get('public_key'))
+            if peer and peer['args'].get('ifname') == args.get('ifname'):
+                self._remove_peer(args['public_key'])
+
+    def _add_peer(self, cmd):
+        args = cmd['args']
+        public_key = args['public_key']
+        metadata = cmd.get('metadata', {})
+        self.peers[public_key] = cmd
+        self.peers_by_ifname.setdefault(args.get('ifname'), {})[public_key] = cmd
+        self.ifname_metadata[args.get('ifname')] = metadata
+        agent_id = metadata.get('agent_id') if metadata else None
+        if agent_id is not None:
+            self.peers_by_agent_id.setdefault(agent_id, set()).add(public_key)
+        owner = {
+            'agent_id': agent_id,
+            'connection_id': metadata.get('connection_id') if metadata else None,
+            'ifname': args.get('ifname'),
+            'public_key': public_key,
+        }
+        for allowed_ip in args.get('allowed_ips', []):
+            try:
+                self.prefixes.insert(allowed_ip, owner, key=public_key)
+            except ValueError:
+                continue
+
+    def _remove_peer(self, public_key):
+        cmd = self.peers.pop(public_key, None)
+        if not cmd:
+            return
+        args = cmd['args']
+        self.peers_by_ifname.get(args.get('ifname'), {}).pop(public_key, None)
+        agent_id = (cmd.get('metadata') or {}).get('agent_id')
+        self.peers_by_agent_id.get(agent_id, set()).discard(public_key)
+        for allowed_ip in args.get('allowed_ips', []):
+            try:
+                self.prefixes.remove(allowed_ip, key=public_key)
+            except ValueError:
+                continue
+
+    def dump(self):
+        with self.lock:
+            vpn = list(self.interfaces.values()) + list(self.peers.values())
+            return {**self.extra, 'vpn': vpn}
+
+    def peer_metadata(self, public_key):
+        with self.lock:
+            cmd = self.peers.get(public_key)
+            return cmd.get('metadata', {}) if cmd else {}
+
+    def peers_metadata(self, identifier='public_key'):
+        with self.lock:
+            if identifier == 'ifname':
+                return dict(self.ifname_metadata)
+            return {cmd['args'][identifier]: cmd.get('metadata', {}) for cmd in self.peers.values()}
+
+    def interface(self, ifname):
+        with self.lock:
+            return self.interfaces.get(ifname)
+
+    def interface_peers(self, ifname):
+        with self.lock:
+            return list(self.peers_by_ifname.get(ifname, {}).values())
+
+    def agent_peers(self, agent_id):
+        with self.lock:
+            return [self.peers[key] for key in self.peers_by_agent_id.get(agent_id, ())]
+
+    def owners(self, cidr):
+        """Owners of `cidr`, or of the most specific allowed ip containing it."""
+        with self.lock:
+            owners = self.prefixes.owners(cidr)
+            if not owners:
+                _, owners = self.prefixes.longest_match(cidr)
+            return owners
+
+    def agent_id(self, text):
+        """Finds owning agent by allowed ip, public key or ifname."""
+        with self.lock:
+            try:
+                owners = self.owners(text)
+            except ValueError:
+                owners = []
+            if owners and owners[0]['agent_id'] is not None:
+                return owners[0]['agent_id']
+            metadata = self.peer_metadata(text) or self.ifname_metadata.get(text)
+            if metadata and metadata.get('agent_id') is not None:
+                return metadata['agent_id']
+            return "UNKNOWN"
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store():
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = StateStore()
+        return _state_store
@@ -1,6 +1,7 @@
 import json
 
 from platform_agent.config.settings import AGENT_PATH_TMP
+from platform_agent.files.state_store import get_state_store
 
 
 def read_tmp_file(file_type='iface_info'):
@@ -24,31 +25,20 @@ def update_tmp_file(data, file_name):
         file.close()
 
 
-def update_tmp_config_dump(cmd, file_name="config_dump"):
-    data = read_tmp_file(file_name)
-    cmds = data.get('vpn', [])
-    cmds.append(cmd)
-    data['vpn'] = cmds
-    update_tmp_file(data, file_name)
+def replace_tmp_config_dump(data):
+    get_state_store().replace(data)
 
 
-def get_peer_metadata(file_name="config_dump", public_key=None, identifier='public_key'):
-    data = read_tmp_file(file_name)
-    cmds = data.get('vpn', [])
-    peer_metadata = {}
-    for cmd in cmds:
-        if cmd['fn'] != 'add_peer':
-            continue
-        peer_metadata[cmd['args'][identifier]] = cmd['metadata']
+def update_tmp_config_dump(cmd):
+    get_state_store().apply(cmd)
+
+
+def get_peer_metadata(public_key=None, identifier='public_key'):
+    store = get_state_store()
     if public_key:
-        return peer_metadata.get(public_key, {})
-    return peer_metadata
+        return store.peer_metadata(public_key)
+    return store.peers_metadata(identifier)
 
 
-def get_agent_id_by_text(text, file_name="config_dump"):
-    data = read_tmp_file(file_name)
-    cmds = data.get('vpn', [])
-    for cmd in cmds:
-        if cmd.get('metadata') and text in str(cmd):
-            return cmd['metadata'].get('agent_id')
-    return "UNKNOWN"
+def get_agent_id_by_text(text):
+    return get_state_store().agent_id(text)
@@ -0,0 +1,106 @@
+import logging
+import os
+import shutil
+import socket
+import struct
+import threading
+
+from pyroute2.netlink import NETLINK_GENERIC, NETLINK_ROUTE, NLMSG_ERROR, NLM_F_REQUEST, NLM_F_DUMP, GENL_ID_CTRL
+from pyroute2.netlink.generic import CTRL_CMD_GETFAMILY
+
+logger = logging.getLogger()
+
+TOOLS = ('wireguard-go', 'wg', 'iptables', 'iptables-restore', 'nft', 'ipset')
+
+CTRL_ATTR_FAMILY_NAME = 2
+RTM_GETNEXTHOP = 106
+NLMSG_HEADER = struct.Struct('IHHII')
+
+
+def netlink_probe(protocol, msg_type, flags, payload):
+    """Sends one request, returns 0 when the kernel answers with data or the errno it failed with."""
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol) as sock:
+        sock.settimeout(1)
+        sock.bind((0, 0))
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), msg_type, flags, 1, 0) + payload)
+        data = sock.recv(65536)
+    _, reply_type, _, _, _ = NLMSG_HEADER.unpack_from(data)
+    if reply_type == NLMSG_ERROR:
+        return -struct.unpack_from('i', data, NLMSG_HEADER.size)[0]
+    return 0
+
+
+def genl_family_exists(name):
+    encoded = name.encode('utf-8') + b'\0'
+    attr = struct.pack('HH', 4 + len(encoded), CTRL_ATTR_FAMILY_NAME) + encoded
+    attr += b'\0' * (-len(attr) % 4)
+    payload = struct.pack('BBH', CTRL_CMD_GETFAMILY, 1, 0) + attr
+    try:
+        return netlink_probe(NETLINK_GENERIC, GENL_ID_CTRL, NLM_F_REQUEST, payload) == 0
+    except OSError:
+        return False
+
+
+def nexthop_objects_supported():
+    """Nexthop objects (RTM_*NEXTHOP) exist since Linux 5.3."""
+    try:
+        return netlink_probe(
+            NETLINK_ROUTE, RTM_GETNEXTHOP, NLM_F_REQUEST | NLM_F_DUMP, struct.pack('BBBBI', socket.AF_INET, 0, 0, 0, 0)
+        ) == 0
+    except OSError:
+        return False
+
+
+class Capabilities:
+    """What this host supports, detected once and shared by every component.
+
+    Detection reads /sys, probes netlink and walks PATH without spawning
+    processes. Call `refresh()` after something changed, e.g. a module was
+    loaded.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None
+
+    @staticmethod
+    def detect():
+        wireguard_module = os.path.isdir('/sys/module/wireguard')
+        wireguard_genl = genl_family_exists('wireguard')
+        tools = {name: shutil.which(name) is not None for name in TOOLS}
+        return {
+            'kernel_wireguard': wireguard_module or wireguard_genl,
+            'wireguard_module': wireguard_module,
+            'wireguard_genl': wireguard_genl,
+            'wireguard_go': tools['wireguard-go'],
+            'tools': tools,
+            'nexthop_objects': nexthop_objects_supported(),
+            'kernel_release': os.uname().release,
+        }
+
+    def refresh(self):
+        data = self.detect()
+        with self.lock:
+            self.data = data
+        logger.debug(f"[CAPABILITIES] {data}")
+        return data
+
+    def get(self, name):
+        with self.lock:
+            data = self.data
+        if data is None:
+            data = self.refresh()
+        return data[name]
+
+    @property
+    def kernel_wireguard(self):
+        return self.get('kernel_wireguard')
+
+    def has_tool(self, name):
+        tools = self.get('tools')
+        if name not in tools:
+            return shutil.which(name) is not None
+        return tools[name]
+
+
+CAPABILITIES = Capabilities()
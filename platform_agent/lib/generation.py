@@ -0,0 +1,18 @@
+import threading
+
+
+class Generation:
+    """Counter bumped on every change of an input, so derived data can tell when it is stale."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+
+# Interfaces, peers or their config changed through the agent
+CONFIG_GENERATION = Generation()
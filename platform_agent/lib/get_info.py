@@ -3,11 +3,9 @@ import logging
 import socket
 import requests
 
-import docker
 from requests.exceptions import ConnectionError, SSLError
 from urllib3.exceptions import ProtocolError, NewConnectionError
 
-from platform_agent.docker_api.helpers import format_networks_result, format_container_result
 from platform_agent.config.settings import Config
 
 logger = logging.getLogger()
@@ -33,6 +31,9 @@ def get_location():
 def get_network_info():
     network_info = []
     if os.environ.get("SYNTROPY_NETWORK_API", '').lower() == "docker":
+        # Only docker agents need the docker client
+        import docker
+        from platform_agent.docker_api.helpers import format_networks_result
         try:
             docker_client = docker.from_env()
             networks = docker_client.networks()
@@ -48,6 +49,8 @@ def get_network_info():
 def get_container_results():
     container_info = []
     if os.environ.get("SYNTROPY_NETWORK_API", '').lower() == "docker":
+        import docker
+        from platform_agent.docker_api.helpers import format_container_result
         try:
             docker_client = docker.from_env()
             networks = docker_client.containers()
@@ -0,0 +1,53 @@
+import threading
+
+
+class Metrics:
+    """Process-wide counters, gauges and summaries.
+
+    Kept free of prometheus_client so any thread can record values cheaply;
+    the network exporter translates them when it is scraped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.types = {}
+        self.descriptions = {}
+        self.values = {}
+
+    def _key(self, name, metric_type, description, labels):
+        if name not in self.types:
+            self.types[name] = metric_type
+            self.descriptions[name] = description or name
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, description=None, **labels):
+        with self.lock:
+            key = self._key(name, 'counter', description, labels)
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, description=None, **labels):
+        with self.lock:
+            self.values[self._key(name, 'gauge', description, labels)] = value
+
+    def observe(self, name, value, description=None, **labels):
+        with self.lock:
+            key = self._key(name, 'summary', description, labels)
+            count, total = self.values.get(key, (0, 0.0))
+            self.values[key] = (count + 1, total + value)
+
+    def get(self, name, **labels):
+        with self.lock:
+            return self.values.get((name, tuple(sorted(labels.items()))))
+
+    def collect(self):
+        """Returns [(name, type, description, [(labels, value)])]."""
+        with self.lock:
+            grouped = {}
+            for (name, labels), value in self.values.items():
+                grouped.setdefault(name, []).append((dict(labels), value))
+            return [
+                (name, self.types[name], self.descriptions[name], samples) for name, samples in grouped.items()
+            ]
+
+
+METRICS = Metrics()
@@ -0,0 +1,172 @@
+import collections
+import logging
+import os
+import threading
+import time
+import zlib
+
+import websocket
+
+from platform_agent.lib.ctime import now
+from platform_agent.lib.metrics import METRICS
+
+logger = logging.getLogger()
+
+CONTROL = 'control'
+TELEMETRY = 'telemetry'
+
+
+class OutboundWriter(threading.Thread):
+    """Single writer for everything the agent sends over the websocket.
+
+    Messages wait in two bounded lanes. Control messages (command responses,
+    config updates) always go first; telemetry and log records fill the gaps
+    and, with SYNTROPY_OUTBOUND_BATCH enabled, are coalesced into BATCH frames.
+    When a lane is full its oldest message is dropped.
+
+    While the websocket is offline telemetry goes to the optional spool and
+    is replayed as TELEMETRY_REPLAY frames at SYNTROPY_SPOOL_REPLAY_RATE
+    messages per second once it is back. With SYNTROPY_SPOOL_ACK enabled
+    replayed entries are kept until the controller sends TELEMETRY_ACK.
+    """
+
+    def __init__(self, ws, control_limit=None, telemetry_limit=None, batch=None, compress=None, spool=None):
+        super().__init__()
+        self.ws = ws
+        self.limits = {
+            CONTROL: control_limit or int(os.environ.get('SYNTROPY_OUTBOUND_CONTROL_QUEUE', 1000)),
+            TELEMETRY: telemetry_limit or int(os.environ.get('SYNTROPY_OUTBOUND_QUEUE', 5000)),
+        }
+        if batch is None:
+            batch = os.environ.get('SYNTROPY_OUTBOUND_BATCH', '').lower() == 'true'
+        if compress is None:
+            compress = os.environ.get('SYNTROPY_OUTBOUND_COMPRESS', '').lower() == 'true'
+        self.batch_size = int(os.environ.get('SYNTROPY_OUTBOUND_BATCH_SIZE', 100)) if batch else 1
+        self.compress = compress
+        self.compress_min = int(os.environ.get('SYNTROPY_OUTBOUND_COMPRESS_MIN', 1024))
+        self.spool = spool
+        self.replay_rate = float(os.environ.get('SYNTROPY_SPOOL_REPLAY_RATE', 50))
+        self.replay_batch = int(os.environ.get('SYNTROPY_SPOOL_REPLAY_BATCH', 50))
+        self.replay_ack = os.environ.get('SYNTROPY_SPOOL_ACK', '').lower() == 'true'
+        self.replay_at = 0
+        self.was_online = False
+        self.lanes = {CONTROL: collections.deque(), TELEMETRY: collections.deque()}
+        self.pending = threading.Condition()
+        self.stop_outbound_writer = threading.Event()
+        self.daemon = True
+
+    def online(self):
+        sock = getattr(self.ws, 'sock', None)
+        return bool(sock and sock.status)
+
+    def put(self, message, lane=TELEMETRY):
+        with self.pending:
+            queue = self.lanes[lane]
+            if len(queue) >= self.limits[lane]:
+                queue.popleft()
+                self._dropped(lane, 'queue_full')
+                if lane == CONTROL:
+                    logger.warning("[OUTBOUND] control queue full, dropped oldest message")
+            queue.append((time.monotonic(), message))
+            METRICS.set('agent_outbound_queue_depth', len(queue), 'Messages waiting to be sent', lane=lane)
+            self.pending.notify()
+
+    def _dropped(self, lane, reason, count=1):
+        METRICS.inc('agent_outbound_dropped_total', count, 'Outbound messages dropped', lane=lane, reason=reason)
+
+    def _next(self, timeout=1):
+        """Pops the next frame to send as (lane, [(enqueued_at, message)])."""
+        with self.pending:
+            self.pending.wait_for(
+                lambda: self.lanes[CONTROL] or self.lanes[TELEMETRY] or self.stop_outbound_writer.is_set(),
+                timeout=timeout,
+            )
+            for lane, size in ((CONTROL, 1), (TELEMETRY, self.batch_size)):
+                queue = self.lanes[lane]
+                if queue:
+                    items = [queue.popleft() for _ in range(min(size, len(queue)))]
+                    METRICS.set('agent_outbound_queue_depth', len(queue), 'Messages waiting to be sent', lane=lane)
+                    return lane, items
+        return None, None
+
+    @staticmethod
+    def batch_frame(messages):
+        # Messages are already serialized, join them instead of parsing them again
+        return f'{{"id": "UNKNOWN", "executed_at": "{now()}", "type": "BATCH", "data": [{", ".join(messages)}]}}'
+
+    def send(self, lane, items):
+        if not self.online():
+            if lane == CONTROL:
+                logger.error("[SENDING]: websocket offline")
+                self._dropped(lane, 'offline', len(items))
+            elif self.spool:
+                for _, message in items:
+                    self.spool.append(message)
+            else:
+                self._dropped(lane, 'offline', len(items))
+            return
+        messages = [message for _, message in items]
+        frame = messages[0] if len(messages) == 1 else self.batch_frame(messages)
+        started = time.monotonic()
+        try:
+            if self.compress and len(frame) >= self.compress_min:
+                self.ws.send(zlib.compress(frame.encode('utf-8')), opcode=websocket.ABNF.OPCODE_BINARY)
+            else:
+                self.ws.send(frame)
+        except Exception as e:  # noqa Socket errors are handled by the websocket reconnect loop
+            logger.debug(f"[OUTBOUND] send failed {e}")
+            self._dropped(lane, 'send_error', len(items))
+            return
+        sent = time.monotonic()
+        METRICS.observe('agent_outbound_send_seconds', sent - started, 'Time spent in websocket send', lane=lane)
+        METRICS.observe(
+            'agent_outbound_wait_seconds', sent - items[0][0], 'Time from enqueue to sent', lane=lane
+        )
+        METRICS.inc('agent_outbound_sent_total', len(items), 'Outbound messages sent', lane=lane)
+
+    def replay(self):
+        """Sends the next spooled batch when online and the replay rate allows it."""
+        online = self.online()
+        if online and not self.was_online:
+            # Whatever was sent but not acked before the outage is sent again
+            self.spool.rewind()
+        self.was_online = online
+        if not online or time.monotonic() < self.replay_at:
+            return
+        entries = self.spool.read(self.replay_batch)
+        if not entries:
+            return
+        frame = (
+            f'{{"id": "UNKNOWN", "executed_at": "{now()}", "type": "TELEMETRY_REPLAY", '
+            f'"data": {{"first_seq": {entries[0][0]}, "last_seq": {entries[-1][0]}, '
+            f'"messages": [{", ".join(message for _, message in entries)}]}}}}'
+        )
+        try:
+            self.ws.send(frame)
+        except Exception as e:  # noqa Retried after the reconnect
+            logger.debug(f"[OUTBOUND] replay failed {e}")
+            self.spool.rewind()
+            return
+        if not self.replay_ack:
+            self.spool.ack(entries[-1][0])
+        METRICS.inc('agent_spool_replayed_total', len(entries), 'Spooled telemetry messages replayed')
+        self.replay_at = time.monotonic() + len(entries) / self.replay_rate
+
+    def run(self):
+        while not self.stop_outbound_writer.is_set():
+            timeout = 1
+            if self.spool and self.spool.pending() and self.online():
+                timeout = min(1, max(0, self.replay_at - time.monotonic()))
+            lane, items = self._next(timeout)
+            if items:
+                self.send(lane, items)
+            if self.spool:
+                self.replay()
+
+    def join(self, timeout=None):
+        self.stop_outbound_writer.set()
+        with self.pending:
+            self.pending.notify()
+        super().join(timeout)
+        if self.spool:
+            self.spool.close()
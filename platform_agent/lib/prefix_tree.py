@@ -0,0 +1,126 @@
+import ipaddress
+
+
+class _Node:
+    __slots__ = ('children', 'network', 'owners', 'count')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.network = None
+        self.owners = None
+        self.count = 0
+
+
+class PrefixTree:
+    """Binary radix tree of IPv4/IPv6 prefixes and their owners.
+
+    Every prefix can hold several owners, each stored under a key (e.g. the
+    peer public key) so it can be removed again. Lookups walk at most one bit
+    per prefix bit; every node counts the prefixes below it, so overlap
+    checks never have to enumerate subtrees.
+    """
+
+    def __init__(self):
+        self.roots = {4: _Node(), 6: _Node()}
+
+    @staticmethod
+    def parse(cidr):
+        if isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return cidr
+        return ipaddress.ip_network(cidr, False)
+
+    @staticmethod
+    def bits(network):
+        value = int(network.network_address)
+        max_len = network.max_prefixlen
+        for i in range(network.prefixlen):
+            yield (value >> (max_len - i - 1)) & 1
+
+    def _path(self, network, create=False):
+        node = self.roots[network.version]
+        path = [node]
+        for bit in self.bits(network):
+            child = node.children[bit]
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[bit] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def insert(self, cidr, owner, key=None):
+        network = self.parse(cidr)
+        path = self._path(network, create=True)
+        node = path[-1]
+        if node.owners is None:
+            node.owners = {}
+            node.network = network
+            for parent in path:
+                parent.count += 1
+        node.owners[key] = owner
+
+    def remove(self, cidr, key=None):
+        network = self.parse(cidr)
+        path = self._path(network)
+        if not path or path[-1].owners is None or key not in path[-1].owners:
+            return
+        node = path[-1]
+        del node.owners[key]
+        if node.owners:
+            return
+        node.owners = None
+        node.network = None
+        for parent in path:
+            parent.count -= 1
+        # Prune empty branches
+        for depth in range(len(path) - 1, 0, -1):
+            if path[depth].count:
+                break
+            path[depth - 1].children[path[depth - 1].children.index(path[depth])] = None
+
+    def owners(self, cidr):
+        """Owners of exactly this prefix."""
+        path = self._path(self.parse(cidr))
+        if not path or path[-1].owners is None:
+            return []
+        return list(path[-1].owners.values())
+
+    def longest_match(self, cidr):
+        """Returns (network, owners) of the most specific prefix containing `cidr`."""
+        network = self.parse(cidr)
+        node = self.roots[network.version]
+        best = node if node.owners is not None else None
+        for bit in self.bits(network):
+            node = node.children[bit]
+            if node is None:
+                break
+            if node.owners is not None:
+                best = node
+        if best is None:
+            return None, []
+        return best.network, list(best.owners.values())
+
+    def find_overlap(self, cidr, exclude_exact=True):
+        """Returns (network, owners) of a prefix overlapping `cidr`, or (None, [])."""
+        network = self.parse(cidr)
+        node = self.roots[network.version]
+        for bit in self.bits(network):
+            # Shorter prefixes on the way down contain `cidr`
+            if node.owners is not None:
+                return node.network, list(node.owners.values())
+            node = node.children[bit]
+            if node is None:
+                return None, []
+        if node.owners is not None and not exclude_exact:
+            return node.network, list(node.owners.values())
+        # Anything left below the exact prefix is contained by `cidr`
+        for child in node.children:
+            while child is not None:
+                if child.owners is not None:
+                    return child.network, list(child.owners.values())
+                child = child.children[0] if child.children[0] and child.children[0].count else child.children[1]
+        return None, []
+
+    def __len__(self):
+        return self.roots[4].count + self.roots[6].count
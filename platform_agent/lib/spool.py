@@ -0,0 +1,147 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from platform_agent.config.settings import AGENT_PATH
+from platform_agent.lib.metrics import METRICS
+
+logger = logging.getLogger()
+
+HEADER = struct.Struct('<4sIQQQQQQ')
+RECORD = struct.Struct('<IQ')
+MAGIC = b'SSPL'
+VERSION = 1
+DATA_START = 64
+WRAP = 0xFFFFFFFF
+
+
+class TelemetrySpool:
+    """Fixed size ring of telemetry messages in a memory-mapped file.
+
+    Records are `<length><seq><payload>`. `head` is the oldest record kept,
+    `tail` the next write offset and `cursor` the next record to replay. When
+    the ring is full the oldest records are overwritten. Records stay in the
+    ring until acknowledged, so a restart replays everything not yet acked.
+    """
+
+    def __init__(self, path, size):
+        self.lock = threading.Lock()
+        self.path = path
+        self.size = size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, version, capacity, head, tail, count, head_seq, next_seq = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or capacity != size:
+            head, tail, count, head_seq, next_seq = DATA_START, DATA_START, 0, 1, 1
+        self.head, self.tail, self.count = head, tail, count
+        self.head_seq, self.next_seq = head_seq, next_seq
+        self.cursor, self.cursor_seq = head, head_seq
+        self._store_header()
+
+    def _store_header(self):
+        HEADER.pack_into(
+            self.map, 0, MAGIC, VERSION, self.size, self.head, self.tail, self.count, self.head_seq, self.next_seq
+        )
+        METRICS.set('agent_spool_entries', self.count, 'Telemetry messages held in the spool')
+
+    def _record(self, offset):
+        """Returns (offset, length, seq) of the record at `offset`, following wrap markers."""
+        if self.size - offset < RECORD.size:
+            offset = DATA_START
+        length, seq = RECORD.unpack_from(self.map, offset)
+        if length == WRAP:
+            offset = DATA_START
+            length, seq = RECORD.unpack_from(self.map, offset)
+        return offset, length, seq
+
+    def _drop_head(self):
+        offset, length, seq = self._record(self.head)
+        self.head = offset + RECORD.size + length
+        self.head_seq = seq + 1
+        self.count -= 1
+        if self.cursor_seq < self.head_seq:
+            self.cursor, self.cursor_seq = self.head, self.head_seq
+
+    def _reserve(self, need):
+        while True:
+            if not self.count:
+                self.head = self.tail = self.cursor = DATA_START
+                self.head_seq = self.cursor_seq = self.next_seq
+            if not self.count or self.tail > self.head:
+                if self.tail + need <= self.size:
+                    return
+                if self.head - DATA_START >= need:
+                    if self.size - self.tail >= 4:
+                        struct.pack_into('<I', self.map, self.tail, WRAP)
+                    self.tail = DATA_START
+                    return
+            elif self.head - self.tail >= need:
+                return
+            self._drop_head()
+            METRICS.inc('agent_spool_dropped_total', 1, 'Spooled telemetry overwritten before replay')
+
+    def append(self, message):
+        payload = message.encode('utf-8')
+        need = RECORD.size + len(payload)
+        if need > self.size - DATA_START:
+            return None
+        with self.lock:
+            self._reserve(need)
+            seq = self.next_seq
+            RECORD.pack_into(self.map, self.tail, len(payload), seq)
+            self.map[self.tail + RECORD.size:self.tail + need] = payload
+            self.tail += need
+            self.count += 1
+            self.next_seq += 1
+            self._store_header()
+            return seq
+
+    def pending(self):
+        with self.lock:
+            return self.next_seq - self.cursor_seq if self.count else 0
+
+    def read(self, limit):
+        """Returns up to `limit` [(seq, message)] after the replay cursor and moves the cursor."""
+        entries = []
+        with self.lock:
+            while self.count and self.cursor_seq < self.next_seq and len(entries) < limit:
+                offset, length, seq = self._record(self.cursor)
+                start = offset + RECORD.size
+                entries.append((seq, self.map[start:start + length].decode('utf-8')))
+                self.cursor, self.cursor_seq = start + length, seq + 1
+        return entries
+
+    def rewind(self):
+        """Replays everything not acknowledged yet, e.g. after the connection dropped."""
+        with self.lock:
+            self.cursor, self.cursor_seq = self.head, self.head_seq
+
+    def ack(self, seq):
+        with self.lock:
+            while self.count and self.head_seq <= seq:
+                self._drop_head()
+            self._store_header()
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+
+
+def open_spool():
+    size = int(os.environ.get('SYNTROPY_SPOOL_SIZE', 8 * 1024 * 1024))
+    if size <= DATA_START:
+        return None
+    path = os.environ.get('SYNTROPY_SPOOL_FILE', f"{AGENT_PATH}/telemetry.spool")
+    try:
+        return TelemetrySpool(path, size)
+    except OSError as e:
+        logger.warning(f"[SPOOL] telemetry spool disabled {e}")
+        return None
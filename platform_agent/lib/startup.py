@@ -0,0 +1,95 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from platform_agent.config.settings import AGENT_PATH
+from platform_agent.lib.metrics import METRICS
+
+logger = logging.getLogger()
+
+# Taken when the package starts importing, as close to process start as we get
+STARTED_AT = time.monotonic()
+
+DEVICE_ID_FILE = f"{AGENT_PATH}/device-id"
+
+# Optional subsystems per SYNTROPY_NETWORK_API, imported only when selected
+NETWORK_WATCHERS = {
+    'docker': ('platform_agent.docker_api.docker_api', 'DockerNetworkWatcher'),
+    'host': ('platform_agent.network.dummy_watcher', 'DummyNetworkWatcher'),
+    'kubernetes': ('platform_agent.network.kubernetes_watcher', 'KubernetesNetworkWatcher'),
+}
+
+
+def elapsed():
+    return time.monotonic() - STARTED_AT
+
+
+def load(module, name):
+    return getattr(importlib.import_module(module), name)
+
+
+def network_watcher_class(network_api=None):
+    if network_api is None:
+        network_api = os.environ.get("SYNTROPY_NETWORK_API", '').lower()
+    if network_api not in NETWORK_WATCHERS:
+        return None
+    return load(*NETWORK_WATCHERS[network_api])
+
+
+def start(thread):
+    thread.start()
+    return thread
+
+
+def run_parallel(tasks):
+    """Runs independent start up steps at once, returns {name: result}.
+
+    A failing step is logged and its result is None, the others are unaffected.
+    """
+    results = {}
+
+    def run(name, fn):
+        started = time.monotonic()
+        try:
+            results[name] = fn()
+        except Exception as e:
+            logger.error(f"[STARTUP] {name} failed {e}")
+            results[name] = None
+        METRICS.set(
+            'agent_startup_step_seconds', time.monotonic() - started, 'Duration of agent start up steps', step=name
+        )
+
+    threads = [threading.Thread(target=run, args=(name, fn), daemon=True) for name, fn in tasks.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def cached_device_id(generate, path=DEVICE_ID_FILE):
+    """Returns the device id stored by an earlier start, generating and storing it otherwise."""
+    try:
+        device_id = Path(path).read_text().strip()
+        if device_id:
+            return device_id
+    except OSError:
+        pass
+    device_id = generate()
+    try:
+        Path(path).write_text(device_id)
+    except OSError as e:
+        logger.warning(f"[STARTUP] Could not cache device id {e}")
+    return device_id
+
+
+def connected():
+    """Records the time to the first controller connection, later reconnects are ignored."""
+    if METRICS.get('agent_time_to_connected_seconds') is not None:
+        return
+    seconds = elapsed()
+    METRICS.set('agent_time_to_connected_seconds', seconds, 'Seconds from process start to the first connection')
+    logger.info(f"[STARTUP] Connected {seconds:.3f}s after start")
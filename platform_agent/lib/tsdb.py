@@ -0,0 +1,242 @@
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+
+from platform_agent.lib.metrics import METRICS
+
+RAW = 'raw'
+MINUTE = '1m'
+HOUR = '1h'
+
+
+def percentile(values, q=0.95):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+def aggregate(values, mins=None, maxs=None, total=None, count=None):
+    """min/avg/p95/max of raw values, or of buckets when their mins/maxs/sums/counts are given."""
+    if count is None:
+        count, total, mins, maxs = len(values), sum(values), values, values
+    if not count:
+        return None
+    return {
+        'min': round(min(mins), 4),
+        'avg': round(total / count, 4),
+        'p95': round(percentile(values), 4),
+        'max': round(max(maxs), 4),
+        'count': count,
+    }
+
+
+class Ring:
+    """Parallel fixed-capacity arrays, the oldest entry is overwritten once full."""
+
+    def __init__(self, capacity, typecodes):
+        self.capacity = capacity
+        self.columns = [array(typecode) for typecode in typecodes]
+        self.pos = 0
+
+    def append(self, *row):
+        if len(self.columns[0]) < self.capacity:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+        else:
+            for column, value in zip(self.columns, row):
+                column[self.pos] = value
+            self.pos = (self.pos + 1) % self.capacity
+
+    def rows(self, start=0, end=None):
+        """Rows in time order with start <= first column < end."""
+        times = self.columns[0]
+        # Appended in time order, so [pos, len) and then [0, pos) are each sorted and
+        # the window is found by bisecting both halves in place
+        for lo, hi in ((self.pos, len(times)), (0, self.pos)):
+            first = bisect.bisect_left(times, start, lo, hi)
+            last = hi if end is None else bisect.bisect_left(times, end, first, hi)
+            if first < last:
+                yield from zip(*(column[first:last] for column in self.columns))
+
+    def oldest(self):
+        if not self.columns[0]:
+            return None
+        return self.columns[0][self.pos % len(self.columns[0])]
+
+    def memory(self):
+        return sum(sys.getsizeof(column) for column in self.columns)
+
+
+class Tier:
+    """Downsampled buckets of `step` seconds: start, min, max, sum, count and p95.
+
+    The p95 of a bucket is exact, over several buckets it is the p95 of
+    their p95s. The sum is a double, in float32 it would lose the small
+    values once it grows large.
+    """
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.ring = Ring(capacity, 'IffdHf')
+        self.bucket = None
+        self.values = []
+
+    def add(self, ts, value, low=None, high=None, total=None, count=1):
+        """Adds a raw value, or a finer bucket; returns the bucket it closed, if any."""
+        closed = None
+        bucket = ts - ts % self.step
+        if self.bucket is not None and bucket != self.bucket:
+            closed = self.close()
+        if self.bucket is None:
+            self.bucket, self.low, self.high, self.total, self.count = bucket, value, value, 0.0, 0
+        self.low = min(self.low, value if low is None else low)
+        self.high = max(self.high, value if high is None else high)
+        self.total += value if total is None else total
+        self.count += count
+        self.values.append(value)
+        return closed
+
+    def close(self):
+        row = (self.bucket, self.low, self.high, self.total, min(self.count, 0xFFFF), percentile(self.values))
+        self.ring.append(*row)
+        self.bucket, self.values = None, []
+        return row
+
+    def open_row(self, start=0, end=None):
+        if self.bucket is not None and self.bucket >= start and (end is None or self.bucket < end):
+            return self.bucket, self.low, self.high, self.total, self.count, percentile(self.values)
+        return None
+
+    def rows(self, start=0, end=None):
+        yield from self.ring.rows(start, end)
+        row = self.open_row(start, end)
+        if row:
+            yield row
+
+    def oldest(self):
+        oldest = self.ring.oldest()
+        return self.bucket if oldest is None else oldest
+
+    def memory(self):
+        return self.ring.memory() + sys.getsizeof(self.values)
+
+
+class Series:
+    __slots__ = ('raw', 'tiers')
+
+    def __init__(self, raw_points, minutes, hours):
+        # uint32 epoch seconds and float32 values, 8 bytes a point
+        self.raw = Ring(raw_points, 'If')
+        self.tiers = {MINUTE: Tier(60, minutes), HOUR: Tier(3600, hours)}
+
+    def add(self, ts, value):
+        self.raw.append(ts, value)
+        closed = self.tiers[MINUTE].add(ts, value)
+        if closed:
+            bucket, low, high, total, count, p95 = closed
+            self.tiers[HOUR].add(bucket, p95, low=low, high=high, total=total, count=count)
+
+    def tier_for(self, start):
+        """The finest tier that still holds `start`."""
+        oldest = self.raw.oldest()
+        if oldest is not None and oldest <= start:
+            return RAW
+        for name in (MINUTE, HOUR):
+            oldest = self.tiers[name].oldest()
+            if oldest is not None and oldest <= start:
+                return name
+        return HOUR
+
+    def window(self, tier, start, end):
+        if tier == RAW:
+            return aggregate([value for _, value in self.raw.rows(start, end)])
+        aligned = start - start % self.tiers[tier].step
+        rows = list(self.tiers[tier].rows(aligned, end))
+        if tier == HOUR:
+            # The open minute has not reached the hour tier yet
+            row = self.tiers[MINUTE].open_row(aligned, end)
+            if row:
+                rows.append(row)
+        if not rows:
+            return None
+        _, mins, maxs, sums, counts, p95s = zip(*rows)
+        return aggregate(list(p95s), mins, maxs, sum(sums), sum(counts))
+
+    def memory(self):
+        return self.raw.memory() + sum(tier.memory() for tier in self.tiers.values())
+
+
+class TimeSeriesStore:
+    """Bounded in-memory history of agent telemetry, queried by the controller.
+
+    Every series keeps raw points plus 1 minute and 1 hour buckets in ring
+    buffers sized by SYNTROPY_TSDB_RAW_POINTS, SYNTROPY_TSDB_MINUTES and
+    SYNTROPY_TSDB_HOURS. At most SYNTROPY_TSDB_MAX_SERIES series are kept,
+    values for further series are dropped.
+    """
+
+    def __init__(self, max_series=None, raw_points=None, minutes=None, hours=None):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.max_series = max_series or int(os.environ.get('SYNTROPY_TSDB_MAX_SERIES', 10000))
+        self.raw_points = raw_points or int(os.environ.get('SYNTROPY_TSDB_RAW_POINTS', 360))
+        self.minutes = minutes or int(os.environ.get('SYNTROPY_TSDB_MINUTES', 120))
+        self.hours = hours or int(os.environ.get('SYNTROPY_TSDB_HOURS', 48))
+
+    def record(self, name, value, ts=None):
+        if value is None:
+            return
+        ts = int(time.time() if ts is None else ts)
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                if len(self.series) >= self.max_series:
+                    METRICS.inc('agent_tsdb_dropped_total', description='Values dropped by the series limit')
+                    return
+                series = self.series[name] = Series(self.raw_points, self.minutes, self.hours)
+            series.add(ts, float(value))
+
+    def record_many(self, prefix, values, ts=None):
+        for field, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.record(f"{prefix}.{field}", value, ts)
+
+    def names(self, prefix=''):
+        with self.lock:
+            return sorted(name for name in self.series if name.startswith(prefix))
+
+    def query(self, names, start, end=None, step=None):
+        """Per series {'tier', 'windows': [{'start', 'min', 'avg', 'p95', 'max', 'count'}]}."""
+        end = int(time.time()) + 1 if end is None else int(end)
+        start = int(start)
+        step = int(step or end - start) or 1
+        result = {}
+        with self.lock:
+            for name in names:
+                series = self.series.get(name)
+                if series is None:
+                    continue
+                tier = series.tier_for(start)
+                windows = []
+                for window_start in range(start, end, step):
+                    window = series.window(tier, window_start, min(window_start + step, end))
+                    if window:
+                        windows.append({'start': window_start, **window})
+                result[name] = {'tier': tier, 'windows': windows}
+        return result
+
+    def memory(self):
+        with self.lock:
+            total = sum(series.memory() for series in self.series.values())
+            count = len(self.series)
+        METRICS.set('agent_tsdb_series', count, 'Series held by the telemetry store')
+        METRICS.set('agent_tsdb_bytes', total, 'Bytes held by the telemetry store arrays')
+        return {'series': count, 'bytes': total}
+
+
+TSDB = TimeSeriesStore()
@@ -3,9 +3,8 @@ import logging
 import threading
 import time
 
-from icmplib import multiping
-
 from platform_agent.lib.ctime import now
+from platform_agent.network.icmp import get_icmp_engine
 
 logger = logging.getLogger()
 
@@ -25,7 +24,7 @@ class AutopingClient(threading.Thread):
     def run(self):
         while not self.stop_autoping.is_set():
             pings = []
-            ping_res = multiping(self.hosts, count=5, interval=0.5, max_threads=2)
+            ping_res = get_icmp_engine().ping(self.hosts, count=5, interval=0.5)
             ping_res.sort(key=lambda x: x.avg_rtt)
             for res in ping_res:
                 if res.is_alive:
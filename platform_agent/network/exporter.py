@@ -5,41 +5,81 @@ import threading
 
 from prometheus_client import start_http_server, Metric, REGISTRY
 
-from platform_agent.cmd.lsmod import module_loaded
-from platform_agent.cmd.wg_info import WireGuardRead
-from platform_agent.files.tmp_files import get_peer_metadata
-from platform_agent.wireguard.helpers import merged_peer_info
-from pyroute2 import WireGuard
+from platform_agent.lib.metrics import METRICS
+from platform_agent.wireguard.peer_watcher import PEER_SNAPSHOT
 
 
-class JsonCollector(object):
-    def __init__(self, interval=10):
-        self.interval = interval
-        self.wg = WireGuard() if module_loaded("wireguard") else WireGuardRead()
+# Per peer value -> Prometheus type, byte counters only ever grow while the interface exists
+PEER_METRICS = {
+    'latency_ms': 'gauge',
+    'packet_loss': 'gauge',
+    'rx_bytes': 'counter',
+    'tx_bytes': 'counter',
+}
+
+
+class PeerCollector(object):
+    """Serves peer metrics from PEER_SNAPSHOT, a scrape never probes peers.
+
+    At most SYNTROPY_EXPORTER_MAX_PEERS peers are exported to bound label
+    cardinality, the rest are counted in agent_exporter_peers_omitted.
+    """
+
+    def __init__(self, snapshot=PEER_SNAPSHOT, max_peers=None):
+        self.snapshot = snapshot
+        self.max_peers = max_peers if max_peers is not None else int(os.environ.get('SYNTROPY_EXPORTER_MAX_PEERS', 1000))
+        self.hostname = os.environ.get('SYNTROPY_AGENT_NAME', socket.gethostname())
+
+    def collect(self):
+        peer_info, peer_metadata, age = self.snapshot.get()
+        families = {}
+        for key, metric_type in PEER_METRICS.items():
+            families[key] = Metric(f"iface_information_{key}", f"Peer {key.replace('_', ' ')}", metric_type)
+        peers = sorted(
+            (iface['iface'], peer['public_key'], peer) for iface in peer_info for peer in iface['peers']
+        )
+        for ifname, public_key, peer in peers[:self.max_peers]:
+            metadata = peer_metadata.get(public_key, {})
+            labels = {
+                'hostname': self.hostname,
+                'ifname': ifname,
+                'peer': public_key,
+                'internal_ip': peer['internal_ip'],
+                "device_id": str(metadata.get('device_id')),
+                "device_name": str(metadata.get('device_name')),
+                "device_public_ipv4": str(metadata.get('device_public_ipv4')),
+            }
+            for key, metric_type in PEER_METRICS.items():
+                if peer.get(key) is None:
+                    continue
+                name = f"iface_information_{key}_total" if metric_type == 'counter' else f"iface_information_{key}"
+                families[key].add_sample(name, value=float(peer[key]), labels=labels)
+        yield from families.values()
+
+        omitted = Metric('agent_exporter_peers_omitted', 'Peers left out by SYNTROPY_EXPORTER_MAX_PEERS', 'gauge')
+        omitted.add_sample('agent_exporter_peers_omitted', value=max(len(peers) - self.max_peers, 0), labels={})
+        yield omitted
+        if age is not None:
+            stale = Metric('agent_peer_snapshot_age_seconds', 'Seconds since peers were last probed', 'gauge')
+            stale.add_sample('agent_peer_snapshot_age_seconds', value=age, labels={})
+            yield stale
+
+
+class AgentMetricsCollector(object):
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
 
     def collect(self):
-        # Fetch the JSON
-        peer_info = merged_peer_info(self.wg)
-        peer_metadata = get_peer_metadata()
-        for iface in peer_info:
-            metric = Metric(f"interface_info_{iface['iface']}",
-                            'interface_information', 'summary')
-            for peer in iface['peers']:
-                peer.update(peer_metadata.get(peer['public_key'], {}))
-                for k, v in peer.items():
-                    if k not in ['latency_ms', 'packet_loss', 'rx_bytes', 'tx_bytes']:
-                        continue
-                    metric.add_sample(f"iface_information_{k}",
-                                      value=str(v),
-                                      labels={
-                                          'hostname': os.environ.get('SYNTROPY_AGENT_NAME', socket.gethostname()),
-                                          'ifname': iface['iface'],
-                                          'peer': peer['public_key'],
-                                          'internal_ip': peer['internal_ip'],
-                                          "device_id": peer.get('device_id'),
-                                          "device_name": peer.get('device_name'),
-                                          "device_public_ipv4": peer.get('device_public_ipv4')
-                                      })
+        for name, metric_type, description, samples in self.metrics.collect():
+            # Counter families are exposed without the _total suffix of their samples
+            family = name[:-len('_total')] if metric_type == 'counter' and name.endswith('_total') else name
+            metric = Metric(family, description, metric_type)
+            for labels, value in samples:
+                if metric_type == 'summary':
+                    metric.add_sample(f"{name}_count", value=value[0], labels=labels)
+                    metric.add_sample(f"{name}_sum", value=value[1], labels=labels)
+                else:
+                    metric.add_sample(name, value=value, labels=labels)
             yield metric
 
 
@@ -53,7 +93,8 @@ class  NetworkExporter(threading.Thread):
 
     def run(self):
         start_http_server(self.exporter_port)
-        REGISTRY.register(JsonCollector())
+        REGISTRY.register(PeerCollector())
+        REGISTRY.register(AgentMetricsCollector())
         while self.stop_network_exporter.is_set(): time.sleep(1)
 
     def join(self, timeout=None):
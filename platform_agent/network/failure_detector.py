@@ -0,0 +1,217 @@
+import logging
+import os
+import re
+import select
+import socket
+import struct
+import threading
+import time
+
+from platform_agent.lib.metrics import METRICS
+from platform_agent.wireguard.helpers import WG_NAME_PATTERN
+
+logger = logging.getLogger()
+
+# magic, sequence number and the sender's monotonic send time in ns, echoed back as is
+ECHO = struct.Struct('!4sIQ')
+MAGIC = b'SYFD'
+# The BFD echo port
+ECHO_PORT = 3785
+IP_PKTINFO = getattr(socket, 'IP_PKTINFO', 8)
+# Replies to this many of the latest echoes still count, the others are late
+WINDOW = 64
+UNKNOWN = 'unknown'
+UP = 'up'
+DOWN = 'down'
+
+
+def failure_detection_enabled():
+    return os.environ.get('SYNTROPY_FAILURE_DETECTION', '').lower() == 'true'
+
+
+def echo_port():
+    return int(os.environ.get('SYNTROPY_FAILURE_DETECTION_PORT', ECHO_PORT))
+
+
+class EchoResponder(threading.Thread):
+    """Answers the failure detector echoes of peer agents.
+
+    Only echoes that arrived over an interface matching `interfaces`, the
+    mesh WireGuard interfaces by default, are sent back, unchanged.
+    """
+
+    def __init__(self, port=None, address='0.0.0.0', interfaces=WG_NAME_PATTERN):
+        super().__init__()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+        self.sock.setblocking(False)
+        self.sock.bind((address, echo_port() if port is None else port))
+        self.port = self.sock.getsockname()[1]
+        self.interfaces = re.compile(interfaces)
+        self.allowed = {}
+        self.stop_echo_responder = threading.Event()
+        self.daemon = True
+
+    def from_mesh(self, ifindex):
+        if ifindex not in self.allowed:
+            try:
+                name = socket.if_indextoname(ifindex)
+            except OSError:
+                name = ''
+            if len(self.allowed) > 1024:
+                self.allowed.clear()
+            self.allowed[ifindex] = bool(self.interfaces.match(name))
+        return self.allowed[ifindex]
+
+    def handle(self):
+        while True:
+            try:
+                data, ancdata, _, address = self.sock.recvmsg(ECHO.size + 1, socket.CMSG_SPACE(12))
+            except (BlockingIOError, InterruptedError):
+                return
+            # Two responders must not echo each other
+            if len(data) != ECHO.size or not data.startswith(MAGIC) or address[1] == self.port:
+                continue
+            ifindex = next(
+                (struct.unpack_from('i', cmsg)[0] for level, kind, cmsg in ancdata
+                 if level == socket.IPPROTO_IP and kind == IP_PKTINFO),
+                None
+            )
+            if ifindex is None or not self.from_mesh(ifindex):
+                continue
+            try:
+                self.sock.sendto(data, address)
+            except OSError as e:
+                logger.debug(f"[FAILURE_DETECTOR] Echo to {address[0]} failed {e}")
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN)
+        while not self.stop_echo_responder.is_set():
+            if poller.poll(500):
+                self.handle()
+
+    def join(self, timeout=None):
+        self.stop_echo_responder.set()
+        super().join(timeout)
+        self.sock.close()
+
+
+class Peer:
+    __slots__ = ('seq', 'state', 'last_reply', 'rtt')
+
+    def __init__(self):
+        self.seq = 0
+        self.state = UNKNOWN
+        self.last_reply = None
+        self.rtt = 0.0
+
+
+class FailureDetector(threading.Thread):
+    """BFD-like liveness of peer agents over the tunnels.
+
+    Sends a small UDP echo to every watched address each
+    SYNTROPY_FAILURE_DETECTION_INTERVAL_MS, answered by the peer's
+    EchoResponder. A peer that answered before is down once nothing came
+    back for SYNTROPY_FAILURE_DETECTION_MISSES intervals plus its round
+    trip time. `on_change(address, up)` runs on the detector thread when a
+    peer goes down or comes back; peers that never answered, e.g. agents
+    without the responder, stay unknown.
+    """
+
+    def __init__(self, on_change=None, port=None, interval=None, misses=None):
+        super().__init__()
+        self.on_change = on_change
+        self.port = echo_port() if port is None else port
+        self.interval = interval or int(os.environ.get('SYNTROPY_FAILURE_DETECTION_INTERVAL_MS', 100)) / 1000
+        self.misses = misses or int(os.environ.get('SYNTROPY_FAILURE_DETECTION_MISSES', 3))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.bind(('0.0.0.0', 0))
+        self.lock = threading.Lock()
+        self.peers = {}
+        self.stop_failure_detector = threading.Event()
+        self.daemon = True
+
+    def watch(self, addresses):
+        """Replaces the watched addresses, keeping the state of those still watched."""
+        with self.lock:
+            self.peers = {address: self.peers.get(address) or Peer() for address in addresses}
+
+    def states(self):
+        with self.lock:
+            return {address: peer.state for address, peer in self.peers.items()}
+
+    def down(self):
+        with self.lock:
+            return {address for address, peer in self.peers.items() if peer.state == DOWN}
+
+    def tick(self, now):
+        changes = []
+        with self.lock:
+            for address, peer in self.peers.items():
+                if peer.state == UP and now - peer.last_reply > self.misses * self.interval + peer.rtt:
+                    peer.state = DOWN
+                    changes.append((address, False))
+                peer.seq = (peer.seq + 1) & 0xFFFFFFFF
+                try:
+                    self.sock.sendto(ECHO.pack(MAGIC, peer.seq, time.monotonic_ns()), (address, self.port))
+                except OSError:
+                    # Unreachable counts as a miss, like an echo that was lost
+                    pass
+        return changes
+
+    def receive(self):
+        changes = []
+        while True:
+            try:
+                data, address = self.sock.recvfrom(ECHO.size + 1)
+            except (BlockingIOError, InterruptedError):
+                return changes
+            except OSError:
+                # ICMP errors of earlier echoes
+                continue
+            if len(data) != ECHO.size:
+                continue
+            magic, seq, sent_ns = ECHO.unpack(data)
+            now = time.monotonic()
+            with self.lock:
+                peer = self.peers.get(address[0])
+                if magic != MAGIC or peer is None or (peer.seq - seq) & 0xFFFFFFFF >= WINDOW:
+                    continue
+                rtt = (time.monotonic_ns() - sent_ns) / 1e9
+                peer.rtt = rtt if peer.last_reply is None else peer.rtt + 0.3 * (rtt - peer.rtt)
+                peer.last_reply = now
+                if peer.state != UP:
+                    if peer.state == DOWN:
+                        changes.append((address[0], True))
+                    peer.state = UP
+
+    def notify(self, changes):
+        for address, up in changes:
+            logger.info(f"[FAILURE_DETECTOR] Peer {address} {'up' if up else 'down'}")
+            METRICS.inc(
+                'agent_peer_state_changes_total', description='Peers going down or up', state=UP if up else DOWN
+            )
+            if self.on_change:
+                try:
+                    self.on_change(address, up)
+                except Exception as e:
+                    logger.error(f"[FAILURE_DETECTOR] {e}")
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN)
+        next_at = time.monotonic()
+        while not self.stop_failure_detector.is_set():
+            now = time.monotonic()
+            if now >= next_at:
+                self.notify(self.tick(now))
+                next_at = max(next_at + self.interval, now)
+            if poller.poll(max(next_at - time.monotonic(), 0) * 1000):
+                self.notify(self.receive())
+
+    def join(self, timeout=None):
+        self.stop_failure_detector.set()
+        super().join(timeout)
+        self.sock.close()
@@ -0,0 +1,306 @@
+import collections
+import errno
+import heapq
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from array import array
+
+logger = logging.getLogger()
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+HEADER = struct.Struct('!BBHHH')
+TIMESPEC = struct.Struct('qq')
+PAYLOAD = b'syntropy-probe\0\0'
+# Sends that failed with ENOBUFS/EAGAIN are retried after this long
+RETRY_DELAY = 0.001
+# Probes sent per poll before replies are read, keeps bursts within the receive buffer
+MAX_BURST = 256
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    # Summing in host order and storing the result in host order gives the network order checksum
+    total = sum(array('H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def echo_request(icmp_id, seq):
+    packet = bytearray(HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, icmp_id, seq) + PAYLOAD)
+    struct.pack_into('=H', packet, 2, checksum(bytes(packet)))
+    return packet
+
+
+class Target:
+    """Probe schedule and RTT/loss accounting of one address, RTTs in milliseconds."""
+
+    __slots__ = (
+        'address', 'interval', 'timeout', 'remaining', 'callback', 'done', 'next_at', 'outstanding',
+        'sent', 'received', 'min_rtt', 'max_rtt', 'total_rtt', 'last_rtt',
+    )
+
+    def __init__(self, address, count, interval, timeout, callback=None, done=None):
+        self.address = address
+        self.interval = interval
+        self.timeout = timeout
+        # None probes until cancelled
+        self.remaining = count
+        self.callback = callback
+        self.done = done
+        self.next_at = None
+        self.outstanding = 0
+        self.sent = self.received = 0
+        self.min_rtt = self.max_rtt = self.last_rtt = None
+        self.total_rtt = 0.0
+
+    @property
+    def avg_rtt(self):
+        return round(self.total_rtt / self.received, 3) if self.received else 0.0
+
+    @property
+    def packet_loss(self):
+        return round(1 - self.received / self.sent, 3) if self.sent else 1.0
+
+    @property
+    def is_alive(self):
+        return self.received > 0
+
+    @property
+    def finished(self):
+        return self.remaining == 0 and not self.outstanding
+
+    def reply(self, rtt):
+        self.received += 1
+        self.last_rtt = rtt
+        self.total_rtt += rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+
+    def __repr__(self):
+        return f"Target({self.address}, sent={self.sent}, received={self.received}, avg_rtt={self.avg_rtt})"
+
+
+class IcmpEngine(threading.Thread):
+    """Echo probes for any number of targets over one non-blocking ICMP socket.
+
+    Each target has its own interval and count; replies are matched by
+    sequence number and timed with the kernel receive timestamp
+    (SO_TIMESTAMPNS). `callback(target, rtt)` runs on the engine thread for
+    every reply (rtt in ms) and every lost probe (rtt None), `done(target)`
+    once the target sent its last probe and it was answered or timed out.
+    """
+
+    def __init__(self, privileged=None, icmp_id=None):
+        super().__init__()
+        if privileged is None:
+            privileged = os.geteuid() == 0
+        self.privileged = privileged
+        # Unprivileged ping sockets get their id from the kernel, which also filters replies
+        self.sock = socket.socket(
+            socket.AF_INET, socket.SOCK_RAW if privileged else socket.SOCK_DGRAM, socket.IPPROTO_ICMP
+        )
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.icmp_id = (icmp_id or os.getpid()) & 0xFFFF
+        self.lock = threading.Lock()
+        self.pending = []
+        self.schedule = []
+        self.counter = 0
+        self.seq = 0
+        self.in_flight = {}
+        self.expiry = collections.deque()
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.poller = select.poll()
+        self.poller.register(self.sock, select.POLLIN)
+        self.poller.register(self.wake_read, select.POLLIN)
+        self.stop_icmp_engine = threading.Event()
+        self.daemon = True
+
+    def probe(self, address, count=1, interval=1.0, timeout=1.0, callback=None, done=None):
+        target = Target(address, count, interval, timeout, callback, done)
+        with self.lock:
+            self.pending.append(target)
+        self.wake()
+        return target
+
+    @staticmethod
+    def cancel(target):
+        target.remaining = 0
+
+    def ping(self, addresses, count=1, interval=0.5, timeout=2.0):
+        """Probes every address `count` times and blocks until all are answered or timed out."""
+        if not addresses:
+            return []
+        left = [len(addresses)]
+        finished = threading.Event()
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                left[0] -= 1
+                if not left[0]:
+                    finished.set()
+
+        targets = [self.probe(address, count, interval, timeout, done=done) for address in addresses]
+        if not self.is_alive():
+            while not finished.is_set():
+                self.poll()
+        finished.wait(count * interval + timeout + 1)
+        return targets
+
+    def wake(self):
+        try:
+            os.write(self.wake_write, b'\0')
+        except BlockingIOError:
+            pass
+
+    def next_seq(self):
+        self.seq = (self.seq + 1) & 0xFFFF
+        if self.seq in self.in_flight:
+            # Wrapped while the previous probe with this number is still out
+            self.lost(self.seq)
+        return self.seq
+
+    def send(self, target, now):
+        seq = self.next_seq()
+        # Taken before the send, the reply may be stamped by the kernel before sendto returns
+        sent_ns = time.time_ns()
+        try:
+            self.sock.sendto(echo_request(self.icmp_id, seq), (target.address, 0))
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.ENOBUFS):
+                return False
+            logger.debug(f"[ICMP] Probe to {target.address} failed {e}")
+            target.sent += 1
+            self.finish_probe(target, None)
+            return True
+        deadline = now + target.timeout
+        self.in_flight[seq] = (target, sent_ns, deadline)
+        self.expiry.append((deadline, seq))
+        target.sent += 1
+        target.outstanding += 1
+        return True
+
+    def send_due(self, now):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for target in pending:
+            self.counter += 1
+            heapq.heappush(self.schedule, (now, self.counter, target))
+        for _ in range(MAX_BURST):
+            if not self.schedule or self.schedule[0][0] > now:
+                break
+            at, counter, target = heapq.heappop(self.schedule)
+            if target.remaining == 0:
+                self.complete(target)
+                continue
+            if not self.send(target, now):
+                heapq.heappush(self.schedule, (now + RETRY_DELAY, counter, target))
+                break
+            if target.remaining is not None:
+                target.remaining -= 1
+            # Keep the schedule of the target, unless we fell more than an interval behind
+            heapq.heappush(self.schedule, (max(at + target.interval, now), counter, target))
+
+    def receive(self):
+        while True:
+            try:
+                data, ancdata, _, address = self.sock.recvmsg(1500, socket.CMSG_SPACE(TIMESPEC.size))
+            except (BlockingIOError, InterruptedError):
+                return
+            received_ns = None
+            for level, kind, cmsg_data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                    seconds, nanoseconds = TIMESPEC.unpack_from(cmsg_data)
+                    received_ns = seconds * 1000000000 + nanoseconds
+            offset = (data[0] & 0x0F) * 4 if self.privileged else 0
+            if len(data) < offset + HEADER.size:
+                continue
+            kind, _, _, icmp_id, seq = HEADER.unpack_from(data, offset)
+            if kind != ICMP_ECHO_REPLY or (self.privileged and icmp_id != self.icmp_id):
+                continue
+            entry = self.in_flight.get(seq)
+            if not entry or entry[0].address != address[0]:
+                continue
+            del self.in_flight[seq]
+            target, sent_ns, _ = entry
+            target.outstanding -= 1
+            rtt = ((received_ns or time.time_ns()) - sent_ns) / 1000000
+            target.reply(rtt)
+            self.finish_probe(target, rtt)
+
+    def lost(self, seq):
+        target = self.in_flight.pop(seq)[0]
+        target.outstanding -= 1
+        self.finish_probe(target, None)
+
+    def finish_probe(self, target, rtt):
+        if target.callback:
+            target.callback(target, rtt)
+        self.complete(target)
+
+    @staticmethod
+    def complete(target):
+        if target.finished and target.done:
+            done, target.done = target.done, None
+            done(target)
+
+    def expire(self, now):
+        while self.expiry and self.expiry[0][0] <= now:
+            deadline, seq = self.expiry.popleft()
+            entry = self.in_flight.get(seq)
+            # The number may have been reused by a later probe with a later deadline
+            if entry and entry[2] == deadline:
+                self.lost(seq)
+
+    def poll(self, max_wait=1.0):
+        now = time.monotonic()
+        self.send_due(now)
+        wait = max_wait
+        if self.schedule:
+            wait = min(wait, self.schedule[0][0] - now)
+        if self.expiry:
+            wait = min(wait, self.expiry[0][0] - now)
+        for fd, _ in self.poller.poll(max(wait, 0) * 1000):
+            if fd == self.wake_read:
+                try:
+                    os.read(self.wake_read, 4096)
+                except BlockingIOError:
+                    pass
+        self.receive()
+        self.expire(time.monotonic())
+
+    def run(self):
+        while not self.stop_icmp_engine.is_set():
+            self.poll()
+
+    def join(self, timeout=None):
+        self.stop_icmp_engine.set()
+        self.wake()
+        super().join(timeout)
+
+
+_icmp_engine = None
+_icmp_engine_lock = threading.Lock()
+
+
+def get_icmp_engine():
+    """The process wide engine, started on first use."""
+    global _icmp_engine
+    with _icmp_engine_lock:
+        if _icmp_engine is None:
+            _icmp_engine = IcmpEngine()
+            _icmp_engine.start()
+        return _icmp_engine
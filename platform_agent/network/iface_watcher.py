@@ -1,9 +1,13 @@
+import errno
 import logging
+import os
+import select
+import socket
 import threading
-import time
 import json
 
-import pyroute2
+from pyroute2 import IPRoute
+from pyroute2.netlink.rtnl import RTMGRP_LINK, RTMGRP_IPV4_IFADDR
 
 from platform_agent.config.settings import AGENT_PATH_TMP
 from platform_agent.files.tmp_files import get_peer_metadata
@@ -11,26 +15,134 @@ from platform_agent.files.tmp_files import get_peer_metadata
 logger = logging.getLogger()
 
 
-def read_tmp_file(file_type='iface_info'):
-    """Read iface file"""
-    try:
-        with open(f"{AGENT_PATH_TMP}/{file_type}") as json_file:
-            rez = json_file.read()
+class InterfaceState:
+    """Shared in-memory view of links and their IPv4 addresses.
+
+    Kept current by `InterfaceWatcher` from rtnetlink events. When no watcher
+    is running every `get()` falls back to a fresh netlink dump.
+    """
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.links = {}
+        self.addrs = {}
+        self.version = 0
+        self.watched = False
+        self.callbacks = []
+        self._snapshot = None
+
+    def load(self, ip_route):
+        links = {}
+        addrs = {}
+        for msg in ip_route.get_links():
+            links[msg['index']] = self.parse_link(msg)
+        for msg in ip_route.get_addr(family=socket.AF_INET):
+            addrs.setdefault(msg['index'], []).append((msg.get_attr('IFA_ADDRESS'), msg['prefixlen']))
+        with self.changed:
+            self.links = links
+            self.addrs = addrs
+            self._bump()
+
+    @staticmethod
+    def parse_link(msg):
+        linkinfo = msg.get_attr('IFLA_LINKINFO')
+        return {
+            'ifname': msg.get_attr('IFLA_IFNAME'),
+            'kind': linkinfo.get_attr('IFLA_INFO_KIND') if linkinfo else None,
+        }
+
+    def handle(self, msg):
+        event = msg.get('event')
+        index = msg.get('index')
+        with self.changed:
+            if event == 'RTM_NEWLINK':
+                link = self.parse_link(msg)
+                if self.links.get(index) == link:
+                    return False
+                self.links[index] = link
+            elif event == 'RTM_DELLINK':
+                if index not in self.links:
+                    return False
+                self.links.pop(index, None)
+                self.addrs.pop(index, None)
+            elif event in ('RTM_NEWADDR', 'RTM_DELADDR') and msg.get('family') == socket.AF_INET:
+                addr = (msg.get_attr('IFA_ADDRESS'), msg['prefixlen'])
+                addrs = self.addrs.setdefault(index, [])
+                if event == 'RTM_NEWADDR' and addr not in addrs:
+                    addrs.append(addr)
+                elif event == 'RTM_DELADDR' and addr in addrs:
+                    addrs.remove(addr)
+                else:
+                    return False
+            else:
+                return False
+            self._bump()
+        return True
+
+    def _bump(self):
+        self.version += 1
+        self._snapshot = None
+        self.changed.notify_all()
+
+    def _build(self):
+        result = {}
+        for index, link in self.links.items():
+            addrs = self.addrs.get(index)
+            if not addrs or not link['ifname']:
+                continue
+            result[link['ifname']] = {
+                'internal_ip': f"{addrs[0][0]}/{addrs[0][1]}",
+                'kind': link['kind'],
+            }
+        return result
+
+    def get(self):
+        """Returns {ifname: {internal_ip, kind, metadata}} for addressed links."""
+        if not self.watched:
+            with IPRoute() as ip_route:
+                self.load(ip_route)
+        with self.changed:
+            if self._snapshot is None:
+                self._snapshot = self._build()
+            snapshot = self._snapshot
+        peers_metadata = get_peer_metadata(identifier='ifname')
+        return {
+            ifname: {**data, 'metadata': peers_metadata.get(ifname, {})} for ifname, data in snapshot.items()
+        }
+
+    def wait_for_change(self, version, timeout=None):
+        """Blocks until the state moves past `version`, returns the new version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def notify(self):
+        for callback in self.callbacks:
             try:
-                data = json.loads(rez)
-            except json.JSONDecodeError:
-                data = {}
-    except FileNotFoundError:
-        data = {}
-    return data
+                callback(self)
+            except Exception as e:  # noqa Subscribers must not stop the watcher
+                logger.error(f"[IFACE_WATCHER] subscriber failed {e}")
+
+
+IFACE_STATE = InterfaceState()
+
+
+def get_iface_info():
+    return IFACE_STATE.get()
 
 
 class InterfaceWatcher(threading.Thread):
 
-    def __init__(self):
+    def __init__(self, state=IFACE_STATE, write_file=None):
         super().__init__()
-        self.iface_watcher = threading.Event()
-        self.watcher = threading.Event()
+        self.state = state
+        if write_file is None:
+            write_file = os.environ.get('SYNTROPY_IFACE_INFO_FILE', '').lower() == 'true'
+        self.write_file = write_file
+        self.stop_iface_watcher = threading.Event()
         self.daemon = True
 
     def update_iface_info_file(self, data):
@@ -39,24 +151,40 @@ class InterfaceWatcher(threading.Thread):
             json.dump(data, iface_info_file)
             iface_info_file.close()
 
+    def changed(self):
+        if self.write_file:
+            self.update_iface_info_file(self.state.get())
+        self.state.notify()
+
+    def resync(self):
+        with IPRoute() as ip_route:
+            self.state.load(ip_route)
+        self.changed()
+
     def run(self):
-        with pyroute2.IPDB() as ipdb:
-            while not self.iface_watcher.is_set():
-                    peers_metadata = get_peer_metadata(identifier='ifname')
-                    res = {k: v for k, v in ipdb.by_name.items()}
-                    payload = {}
-                    for ifname in res.keys():
-                        if not res[ifname].get('ipaddr') and not res[ifname]['ipaddr'].ipv4 or not len(res[ifname]['ipaddr'].ipv4):
-                            continue
-                        internal_ip = f"{res[ifname]['ipaddr'].ipv4[0]['address']}/{res[ifname]['ipaddr'].ipv4[0]['prefixlen']}"
-                        payload[ifname] = {
-                            'internal_ip': internal_ip,
-                            'kind': res[ifname]['kind'],
-                            'metadata': peers_metadata.get(ifname, {})
-                        }
-                    self.update_iface_info_file(payload)
-                    time.sleep(1)
+        with IPRoute() as events:
+            events.bind(groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR)
+            # Subscribe before the dump so no change falls between the two
+            self.resync()
+            self.state.watched = True
+            try:
+                while not self.stop_iface_watcher.is_set():
+                    ready, _, _ = select.select([events], [], [], 1)
+                    if not ready:
+                        continue
+                    try:
+                        messages = events.get()
+                    except OSError as e:
+                        if e.errno != errno.ENOBUFS:
+                            raise
+                        logger.warning("[IFACE_WATCHER] netlink overrun, resyncing")
+                        self.resync()
+                        continue
+                    if any([self.state.handle(msg) for msg in messages]):
+                        self.changed()
+            finally:
+                self.state.watched = False
 
     def join(self, timeout=None):
-        self.watcher.set()
+        self.stop_iface_watcher.set()
         super().join(timeout)
@@ -3,97 +3,107 @@ import json
 import threading
 import re
 
-from platform_agent.files.tmp_files import read_tmp_file
+from pyroute2 import IPRoute
+
 from platform_agent.wireguard.helpers import WG_NAME_PATTERN
 from platform_agent.lib.ctime import now
+from platform_agent.lib.tsdb import TSDB
 
+COUNTERS = ('tx_bytes', 'rx_bytes', 'tx_dropped', 'tx_errors', 'tx_packets', 'rx_dropped', 'rx_errors', 'rx_packets')
 
-class BWDataCollect(threading.Thread):
-
-    def __init__(self, client, interval=10):
-        super().__init__()
-        self.interval = interval
-        self.client = client
-        self.stop_BWDataCollect = threading.Event()
-        self.daemon = True
-
-    @staticmethod
-    def get_int_info(t, iface):
-        try:
-            with open('/sys/class/net/' + iface + '/statistics/' + t, 'r') as f:
-                data = f.read()
-                return int(data)
-        except FileNotFoundError:
-            return -1
-
-    @staticmethod
-    def get_iface_info_set(iface, interval=10):
-        tx_bytes = BWDataCollect.get_int_info('tx_bytes', iface)
-        rx_bytes = BWDataCollect.get_int_info('rx_bytes', iface)
-
-        tx_dropped = BWDataCollect.get_int_info('tx_dropped', iface)
-        tx_errors = BWDataCollect.get_int_info('tx_errors', iface)
-        tx_packets = BWDataCollect.get_int_info('tx_packets', iface)
-
-        rx_dropped = BWDataCollect.get_int_info('rx_dropped', iface)
-        rx_errors = BWDataCollect.get_int_info('rx_errors', iface)
-        rx_packets = BWDataCollect.get_int_info('rx_packets', iface)
 
-        time.sleep(interval)
+class BandwidthSampler:
+    """Interface counters of every matching link from a single RTM_GETLINK dump.
 
-        tx_bytes_after = BWDataCollect.get_int_info('tx_bytes', iface)
-        rx_bytes_after = BWDataCollect.get_int_info('rx_bytes', iface)
+    `sample()` returns the change since the previous call; an interface
+    seen for the first time, or whose counters went back (recreated), is
+    reported from the next call on.
+    """
 
-        tx_dropped_after = BWDataCollect.get_int_info('tx_dropped', iface)
-        tx_errors_after = BWDataCollect.get_int_info('tx_errors', iface)
-        tx_packets_after = BWDataCollect.get_int_info('tx_packets', iface)
+    def __init__(self, pattern=WG_NAME_PATTERN, ip_route=None):
+        self.pattern = pattern
+        self.ip_route = ip_route
+        self.previous = {}
+        self.previous_at = None
 
-        rx_dropped_after = BWDataCollect.get_int_info('rx_dropped', iface)
-        rx_errors_after = BWDataCollect.get_int_info('rx_errors', iface)
-        rx_packets_after = BWDataCollect.get_int_info('rx_packets', iface)
+    def read(self):
+        ip_route = self.ip_route or IPRoute()
+        try:
+            links = ip_route.get_links()
+        finally:
+            if ip_route is not self.ip_route:
+                ip_route.close()
+        counters = {}
+        for link in links:
+            ifname = link.get_attr('IFLA_IFNAME')
+            stats = link.get_attr('IFLA_STATS64') or link.get_attr('IFLA_STATS')
+            if ifname and stats and re.match(self.pattern, ifname):
+                counters[ifname] = {key: stats[key] for key in COUNTERS}
+        return counters
 
-        tx_speed_mbps = round((tx_bytes_after - tx_bytes) / 10000000.0, 4)
-        rx_speed_mbps = round((rx_bytes_after - rx_bytes) / 10000000.0, 4)
-        tx_dropped = (tx_dropped_after - tx_dropped)
-        tx_errors = (tx_errors_after - tx_errors)
-        tx_packets = (tx_packets_after - tx_packets)
-        rx_dropped = (rx_dropped_after - rx_dropped)
-        rx_errors = (rx_errors_after - rx_errors)
-        rx_packets = (rx_packets_after - rx_packets)
+    @staticmethod
+    def delta(iface, before, after, elapsed, interval):
+        changes = {key: after[key] - before[key] for key in COUNTERS}
+        if any(value < 0 for value in changes.values()):
+            return None
         return {
             'iface': iface,
-            'tx_speed_mbps': tx_speed_mbps,
-            'rx_speed_mbps': rx_speed_mbps,
-            'tx_dropped': tx_dropped,
-            'tx_errors': tx_errors,
-            'tx_packets': tx_packets,
-            'rx_dropped': rx_dropped,
-            'rx_errors': rx_errors,
-            'rx_packets': rx_packets,
+            # Megabytes per second, as the controller has always received it
+            'tx_speed_mbps': round(changes['tx_bytes'] / elapsed / 1000000.0, 4),
+            'rx_speed_mbps': round(changes['rx_bytes'] / elapsed / 1000000.0, 4),
+            'tx_dropped': changes['tx_dropped'],
+            'tx_errors': changes['tx_errors'],
+            'tx_packets': changes['tx_packets'],
+            'rx_dropped': changes['rx_dropped'],
+            'rx_errors': changes['rx_errors'],
+            'rx_packets': changes['rx_packets'],
             'interval': interval,
         }
 
+    def sample(self, interval=None):
+        counters = self.read()
+        sampled_at = time.monotonic()
+        result = []
+        if self.previous_at is not None and sampled_at > self.previous_at:
+            elapsed = sampled_at - self.previous_at
+            for iface, after in sorted(counters.items()):
+                if iface not in self.previous:
+                    continue
+                data = self.delta(iface, self.previous[iface], after, elapsed, interval or round(elapsed))
+                if data:
+                    result.append(data)
+        self.previous, self.previous_at = counters, sampled_at
+        return result
+
+
+class BWDataCollect(threading.Thread):
+
+    def __init__(self, client, interval=10):
+        super().__init__()
+        self.interval = interval
+        self.client = client
+        self.sampler = BandwidthSampler()
+        self.stop_BWDataCollect = threading.Event()
+        self.daemon = True
+
     def run(self):
+        next_at = time.monotonic()
         while not self.stop_BWDataCollect.is_set():
-            interfaces = read_tmp_file(file_type='iface_info')
-            wg_ifaces = {k: v for k, v in interfaces.items() if re.match(WG_NAME_PATTERN, k)}
-            if not wg_ifaces:
-                time.sleep(1)
-            for iface in wg_ifaces:
-                try:
-                    result = [self.get_iface_info_set(iface, self.interval)]
-                except FileNotFoundError:
-                    continue
-                if not result:
-                    continue
+            result = self.sampler.sample(self.interval)
+            for data in result:
+                TSDB.record_many(f"iface.{data['iface']}", {k: v for k, v in data.items() if k != 'interval'})
+            if result:
                 self.client.send_log(json.dumps({
                     'id': "UNKNOWN",
                     'executed_at': now(),
                     'type': 'IFACES_BW_DATA',
                     'data': result
                 }))
-                time.sleep(int(self.interval))
+            next_at += self.interval
+            # After a stall continue from now instead of sampling in a burst
+            next_at = max(next_at, time.monotonic())
+            self.stop_BWDataCollect.wait(next_at - time.monotonic())
 
     def join(self, timeout=None):
         self.stop_BWDataCollect.set()
-        super().join(timeout)
\ No newline at end of file
+        super().join(timeout)
@@ -0,0 +1,111 @@
+import collections
+import threading
+import time
+
+from platform_agent.lib.metrics import METRICS
+from platform_agent.network.icmp import get_icmp_engine
+
+# Probe results kept per address, enough for every consumer's sample count
+HISTORY = 8
+
+
+class ProbeScheduler:
+    """Shares ICMP measurements between every subsystem that needs them.
+
+    A consumer subscribes to addresses with the maximum age it accepts for
+    a result. Each address is probed once per the smallest max age any
+    consumer asked for, no matter how many consumers want it, and all of
+    them read the same results.
+    """
+
+    def __init__(self, engine=None, timeout=1.0):
+        self.engine = engine
+        self.timeout = timeout
+        self.lock = threading.Condition()
+        self.subscriptions = {}
+        self.targets = {}
+        self.results = {}
+
+    def subscribe(self, consumer, addresses, max_age):
+        """Replaces what `consumer` is subscribed to."""
+        with self.lock:
+            self.subscriptions[consumer] = {address: max_age for address in addresses}
+            self.update()
+
+    def unsubscribe(self, consumer):
+        with self.lock:
+            self.subscriptions.pop(consumer, None)
+            self.update()
+
+    def wanted(self):
+        intervals = {}
+        for addresses in self.subscriptions.values():
+            for address, max_age in addresses.items():
+                intervals[address] = min(intervals.get(address, max_age), max_age)
+        return intervals
+
+    def update(self):
+        engine = self.engine or get_icmp_engine()
+        wanted = self.wanted()
+        for address, target in list(self.targets.items()):
+            if wanted.get(address) != target.interval:
+                engine.cancel(target)
+                del self.targets[address]
+            if address not in wanted:
+                self.results.pop(address, None)
+        for address, interval in wanted.items():
+            if address not in self.targets:
+                self.targets[address] = engine.probe(
+                    address, count=None, interval=interval, timeout=self.timeout, callback=self.on_result
+                )
+        METRICS.set('agent_probe_targets', len(self.targets), 'Addresses probed by the shared scheduler')
+        METRICS.set(
+            'agent_probe_subscriptions', sum(len(addresses) for addresses in self.subscriptions.values()),
+            'Address subscriptions of all probe consumers'
+        )
+
+    def on_result(self, target, rtt):
+        with self.lock:
+            if self.targets.get(target.address) is not target:
+                return
+            if target.address not in self.results:
+                self.results[target.address] = collections.deque(maxlen=HISTORY)
+            self.results[target.address].append((time.monotonic(), rtt))
+            self.lock.notify_all()
+
+    def stats(self, address, samples=1):
+        """latency_ms (None if every sample was lost), packet_loss and age of the last `samples` results."""
+        with self.lock:
+            results = list(self.results.get(address, ()))[-samples:]
+        if not results:
+            return None
+        rtts = [rtt for _, rtt in results if rtt is not None]
+        return {
+            'latency_ms': round(sum(rtts) / len(rtts), 3) if rtts else None,
+            'packet_loss': round(1 - len(rtts) / len(results), 3),
+            'age': time.monotonic() - results[-1][0],
+        }
+
+    def measure(self, consumer, addresses, max_age, samples=1, timeout=None):
+        """Subscribes and returns {address: stats}, waiting for addresses without any result yet."""
+        self.subscribe(consumer, addresses, max_age)
+        deadline = time.monotonic() + (self.timeout + 1 if timeout is None else timeout)
+        with self.lock:
+            while any(address not in self.results for address in addresses):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.lock.wait(left)
+        return {address: self.stats(address, samples) for address in addresses}
+
+
+_probe_scheduler = None
+_probe_scheduler_lock = threading.Lock()
+
+
+def get_probe_scheduler():
+    global _probe_scheduler
+    with _probe_scheduler_lock:
+        if _probe_scheduler is None:
+            _probe_scheduler = ProbeScheduler()
+        return _probe_scheduler
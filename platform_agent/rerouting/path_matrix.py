@@ -0,0 +1,227 @@
+try:
+    import numpy as np
+except ImportError:  # Optional, the same selection runs row by row in plain Python
+    np = None
+
+from platform_agent.rerouting.path_selector import LOSS_PENALTY_MS
+
+INF = float('inf')
+
+
+class PathMatrix:
+    """Destination x path topology of the routing model with smoothed path scores.
+
+    Row r is `dests[r]`, its columns are the interfaces `ifaces[r]` in name
+    order and column c is measured by probing `addresses[index[r][c]]`;
+    shorter rows are padded with -1. With NumPy a cycle over every
+    destination is a handful of array operations. `current` holds the
+    column each destination is routed over, -1 if none yet, and
+    `installed` the multipath weight of every path, 0 if unused. Scores and
+    routes over paths that still exist are carried over from `previous`; a
+    multipath route that lost one of its paths counts as not installed.
+    """
+
+    def __init__(self, routing_info, previous=None, vectorised=True):
+        self.np = np if vectorised else None
+        self.dests = sorted(routing_info)
+        self.rows = {dest: row for row, dest in enumerate(self.dests)}
+        self.ifaces = [sorted(routing_info[dest]['ifaces']) for dest in self.dests]
+        self.width = max((len(ifaces) for ifaces in self.ifaces), default=0)
+        addresses = {}
+        self.index = []
+        for dest, ifaces in zip(self.dests, self.ifaces):
+            row = [
+                addresses.setdefault(routing_info[dest]['ifaces'][iface]['internal_ip'].split('/')[0], len(addresses))
+                for iface in ifaces
+            ]
+            self.index.append(row + [-1] * (self.width - len(row)))
+        self.addresses = list(addresses)
+        self.current = [-1] * len(self.dests)
+        self.installed = [[0] * self.width for _ in self.dests]
+        # EWMA state, None until the first update; `fresh` marks paths without a measurement yet
+        self.latency = self.loss = self.jitter = self.fresh = None
+        self.last_loss = None
+        if previous is not None and previous.latency is not None:
+            self.carry_over(previous)
+        if self.np:
+            shape = (len(self.dests), self.width)
+            self.index = np.array(self.index, dtype=np.int64).reshape(shape)
+            self.valid = self.index >= 0
+            self.current = np.array(self.current, dtype=np.int64)
+            self.installed = np.array(self.installed, dtype=np.int64).reshape(shape)
+            if self.latency is not None:
+                self.latency, self.loss, self.jitter = (
+                    np.array(state, dtype=float).reshape(shape) for state in (self.latency, self.loss, self.jitter)
+                )
+                self.fresh = np.array(self.fresh, dtype=bool).reshape(shape)
+
+    def carry_over(self, previous):
+        self.latency, self.loss, self.jitter, self.fresh = [], [], [], []
+        for row, (dest, ifaces) in enumerate(zip(self.dests, self.ifaces)):
+            old_row = previous.rows.get(dest)
+            old_ifaces = previous.ifaces[old_row] if old_row is not None else []
+            states = []
+            for iface in ifaces:
+                if iface in old_ifaces:
+                    column = old_ifaces.index(iface)
+                    states.append([float(state[old_row][column]) for state in (
+                        previous.latency, previous.loss, previous.jitter
+                    )] + [False])
+                else:
+                    states.append([INF, 1.0, 0.0, True])
+            states += [[0.0, 1.0, 0.0, False]] * (self.width - len(states))
+            latency, loss, jitter, fresh = zip(*states) if states else ((), (), (), ())
+            self.latency.append(list(latency))
+            self.loss.append(list(loss))
+            self.jitter.append(list(jitter))
+            self.fresh.append(list(fresh))
+            if old_row is not None and all(
+                iface in ifaces for iface, weight in zip(old_ifaces, previous.installed[old_row]) if weight > 0
+            ):
+                self.installed[row][:len(ifaces)] = [
+                    int(previous.installed[old_row][old_ifaces.index(iface)]) if iface in old_ifaces else 0
+                    for iface in ifaces
+                ]
+            if old_row is not None and previous.current[old_row] >= 0:
+                current = old_ifaces[previous.current[old_row]]
+                self.current[row] = ifaces.index(current) if current in ifaces else -1
+
+    def update(self, latency_ms, packet_loss, alpha):
+        """Feeds the latest latency and loss per address, returns the path scores, inf for padding."""
+        if self.np:
+            return self._update_arrays(np.asarray(latency_ms, dtype=float), np.asarray(packet_loss, dtype=float), alpha)
+        return self._update_lists(latency_ms, packet_loss, alpha)
+
+    def _update_arrays(self, latency_ms, packet_loss, alpha):
+        if not self.dests or not self.addresses:
+            self.last_loss = np.ones(self.index.shape)
+            return np.full(self.index.shape, INF)
+        latency = latency_ms[self.index]
+        self.last_loss = packet_loss[self.index]
+        if self.latency is None:
+            self.latency, self.loss, self.jitter = latency, self.last_loss.copy(), np.zeros_like(latency)
+        else:
+            if self.fresh.any():
+                self.latency[self.fresh], self.loss[self.fresh] = latency[self.fresh], self.last_loss[self.fresh]
+            self.jitter += alpha * (np.abs(latency - self.latency) - self.jitter)
+            self.latency += alpha * (latency - self.latency)
+            self.loss += alpha * (self.last_loss - self.loss)
+        self.fresh = np.zeros(self.index.shape, dtype=bool)
+        scores = self.latency + self.jitter + self.loss * LOSS_PENALTY_MS
+        scores[~self.valid] = INF
+        return scores
+
+    def _update_lists(self, latency_ms, packet_loss, alpha):
+        self.last_loss = [[packet_loss[i] if i >= 0 else 1.0 for i in row] for row in self.index]
+        if self.latency is None:
+            self.latency = [[INF] * self.width for _ in self.index]
+            self.loss = [[1.0] * self.width for _ in self.index]
+            self.jitter = [[0.0] * self.width for _ in self.index]
+            self.fresh = [[True] * self.width for _ in self.index]
+        scores = []
+        for r, row in enumerate(self.index):
+            latency, loss, jitter, fresh = self.latency[r], self.loss[r], self.jitter[r], self.fresh[r]
+            row_scores = []
+            for c, i in enumerate(row):
+                if i < 0:
+                    row_scores.append(INF)
+                    continue
+                if fresh[c]:
+                    latency[c], loss[c], fresh[c] = latency_ms[i], packet_loss[i], False
+                jitter[c] += alpha * (abs(latency_ms[i] - latency[c]) - jitter[c])
+                latency[c] += alpha * (latency_ms[i] - latency[c])
+                loss[c] += alpha * (packet_loss[i] - loss[c])
+                row_scores.append(latency[c] + jitter[c] + loss[c] * LOSS_PENALTY_MS)
+            scores.append(row_scores)
+        return scores
+
+    def contested(self, scores, margin_ms, margin_ratio):
+        """[(row, best column)] of the rows whose route may have to change.
+
+        Every other row keeps its current path: it is the best one, or
+        within the margin of it and still answering. Ties go to the lowest
+        column, i.e. the first interface name.
+        """
+        if self.np:
+            if not self.dests or not self.width:
+                return []
+            rows = np.arange(len(self.dests))
+            best = np.argmin(scores, axis=1)
+            routed = self.current >= 0
+            current = np.where(routed, self.current, 0)
+            current_score = scores[rows, current]
+            failover = (self.last_loss[rows, current] >= 1) & (self.last_loss[rows, best] < 1)
+            better = current_score - scores[rows, best] > np.maximum(margin_ms, current_score * margin_ratio)
+            keep = routed & ~failover & ((best == current) | ~better)
+            changed = np.nonzero(~keep)[0]
+            return list(zip(changed.tolist(), best[changed].tolist()))
+        result = []
+        for r, row_scores in enumerate(scores):
+            if not self.width:
+                break
+            best = min(range(self.width), key=row_scores.__getitem__)
+            current = self.current[r]
+            if current >= 0 and not self.failover(r, best):
+                threshold = max(margin_ms, row_scores[current] * margin_ratio)
+                if best == current or row_scores[current] - row_scores[best] <= threshold:
+                    continue
+            result.append((r, best))
+        return result
+
+    def failover(self, row, column):
+        """The current path of `row` stopped answering while `column` still does."""
+        current = self.current[row]
+        return current >= 0 and self.last_loss[row][current] >= 1 and self.last_loss[row][column] < 1
+
+    def multipath(self, scores, margin_ms, prune_ratio, max_weight):
+        """[(row, weights)] of the rows whose multipath weights changed, weights per column.
+
+        Paths that still answer and score within `prune_ratio` times or
+        `margin_ms` of the best one are used, weighted by best score over
+        their score, from 1 up to `max_weight`; a row without any answering
+        path keeps its best one. A row counts as changed when a path joins
+        or leaves it or a weight moved by more than one step; the new
+        weights are recorded as installed.
+        """
+        if self.np:
+            if not self.dests or not self.width:
+                return []
+            alive = self.valid & (self.last_loss < 1)
+            masked = np.where(alive, np.maximum(scores, 0.001), INF)
+            best = masked.min(axis=1, keepdims=True)
+            keep = alive & (masked <= np.maximum(best * prune_ratio, best + margin_ms))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weights = np.clip(np.rint(max_weight * best / masked), 1, max_weight)
+            weights = np.where(keep, weights, 0).astype(np.int64)
+            dead = np.nonzero(~keep.any(axis=1))[0]
+            weights[dead, np.argmin(scores[dead], axis=1)] = 1
+            changed = ((weights > 0) != (self.installed > 0)).any(axis=1) | \
+                (np.abs(weights - self.installed) > 1).any(axis=1)
+            changed = np.nonzero(changed)[0]
+            self.installed[changed] = weights[changed]
+            return [(row, weights[row].tolist()) for row in changed.tolist()]
+        result = []
+        for r, row_scores in enumerate(scores):
+            alive = [c for c in range(len(self.ifaces[r])) if self.last_loss[r][c] < 1]
+            if alive:
+                best = max(min(row_scores[c] for c in alive), 0.001)
+                limit = max(best * prune_ratio, best + margin_ms)
+                weights = [
+                    min(max(round(max_weight * best / max(row_scores[c], 0.001)), 1), max_weight)
+                    if c in alive and row_scores[c] <= limit else 0
+                    for c in range(self.width)
+                ]
+            else:
+                weights = [0] * self.width
+                weights[min(range(self.width), key=row_scores.__getitem__)] = 1
+            installed = self.installed[r]
+            if any((new > 0) != (old > 0) or abs(new - old) > 1 for new, old in zip(weights, installed)):
+                self.installed[r] = weights
+                result.append((r, list(weights)))
+        return result
+
+    def route(self, row, iface):
+        """Records the interface `row` is routed over, None if it has to be decided again."""
+        self.current[row] = self.ifaces[row].index(iface) if iface in self.ifaces[row] else -1
+        if iface is None:
+            self.installed[row] = [0] * self.width
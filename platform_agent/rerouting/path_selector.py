@@ -0,0 +1,215 @@
+import logging
+import math
+import os
+import time
+
+from platform_agent.lib.metrics import METRICS
+
+logger = logging.getLogger()
+
+# Score added per unit of packet loss, 10% loss weighs as much as 100ms latency
+LOSS_PENALTY_MS = 1000
+# Flap damping as used for BGP routes: every switch adds PENALTY, which
+# decays with HALF_LIFE; above SUPPRESS a destination stays where it is
+# until the penalty fell below REUSE
+FLAP_PENALTY = 1000
+FLAP_SUPPRESS = 2500
+FLAP_REUSE = 750
+
+
+class PathScore:
+    __slots__ = ('latency', 'loss', 'jitter', 'samples')
+
+    def __init__(self):
+        self.latency = None
+        self.loss = 0.0
+        self.jitter = 0.0
+        self.samples = 0
+
+    def update(self, latency_ms, packet_loss, alpha):
+        if self.latency is None:
+            self.latency, self.loss = latency_ms, packet_loss
+        else:
+            self.jitter += alpha * (abs(latency_ms - self.latency) - self.jitter)
+            self.latency += alpha * (latency_ms - self.latency)
+            self.loss += alpha * (packet_loss - self.loss)
+        self.samples += 1
+
+    @property
+    def score(self):
+        return self.latency + self.jitter + self.loss * LOSS_PENALTY_MS
+
+
+class Destination:
+    __slots__ = ('current', 'challenger', 'held', 'penalty', 'penalty_at', 'suppressed')
+
+    def __init__(self):
+        self.current = None
+        self.challenger = None
+        self.held = 0
+        self.penalty = 0.0
+        self.penalty_at = 0.0
+        self.suppressed = False
+
+
+class PathSelector:
+    """Picks the interface per destination from smoothed latency, loss and jitter.
+
+    A better path has to beat the current one by SYNTROPY_REROUTE_MARGIN_MS
+    and SYNTROPY_REROUTE_MARGIN_RATIO for SYNTROPY_REROUTE_HOLD cycles in a
+    row before traffic moves; a destination that keeps moving is suppressed
+    until its flap penalty decayed (SYNTROPY_REROUTE_HALF_LIFE seconds).
+    Losing the current path switches at once.
+    """
+
+    def __init__(self, alpha=None, margin_ms=None, margin_ratio=None, hold=None, half_life=None,
+                 prune_ratio=None, max_weight=None):
+        self.alpha = alpha or float(os.environ.get('SYNTROPY_REROUTE_ALPHA', 0.3))
+        self.margin_ms = margin_ms if margin_ms is not None else float(os.environ.get('SYNTROPY_REROUTE_MARGIN_MS', 5))
+        self.margin_ratio = margin_ratio if margin_ratio is not None else \
+            float(os.environ.get('SYNTROPY_REROUTE_MARGIN_RATIO', 0.1))
+        self.hold = hold or int(os.environ.get('SYNTROPY_REROUTE_HOLD', 3))
+        self.half_life = half_life or float(os.environ.get('SYNTROPY_REROUTE_HALF_LIFE', 60))
+        self.prune_ratio = prune_ratio or float(os.environ.get('SYNTROPY_MULTIPATH_PRUNE_RATIO', 1.5))
+        self.max_weight = max_weight or int(os.environ.get('SYNTROPY_MULTIPATH_MAX_WEIGHT', 10))
+        # {dest: {iface: PathScore}} for `decide`
+        self.paths = {}
+        self.destinations = {}
+        # Destinations holding for a challenger in `decide_matrix`
+        self.challenged = set()
+
+    def decay(self, destination, now):
+        destination.penalty *= math.pow(0.5, (now - destination.penalty_at) / self.half_life)
+        destination.penalty_at = now
+        if destination.suppressed and destination.penalty < FLAP_REUSE:
+            destination.suppressed = False
+        elif destination.penalty > FLAP_SUPPRESS:
+            destination.suppressed = True
+
+    def decide(self, dest, candidates, now=None):
+        """Feeds {iface: (latency_ms, packet_loss)} of one cycle, returns the interface to route via if it changed."""
+        now = time.monotonic() if now is None else now
+        destination = self.destinations.setdefault(dest, Destination())
+        paths = self.paths.setdefault(dest, {})
+        for iface, (latency_ms, packet_loss) in candidates.items():
+            paths.setdefault(iface, PathScore()).update(latency_ms, packet_loss, self.alpha)
+        for iface in [iface for iface in paths if iface not in candidates]:
+            del paths[iface]
+        if not candidates:
+            return self.record(destination, 'no_path')
+        scores = {iface: paths[iface].score for iface in candidates}
+        best = min(scores, key=lambda iface: (scores[iface], iface))
+        current = destination.current
+        failover = current not in scores or (candidates[current][1] >= 1 and candidates[best][1] < 1)
+        better = not failover and best != current and \
+            scores[current] - scores[best] > max(self.margin_ms, scores[current] * self.margin_ratio)
+        return self.choose(destination, best, now, failover, better)
+
+    def decide_matrix(self, matrix, latency_ms, packet_loss, now=None):
+        """`decide` for every destination of a PathMatrix, returns [(dest, iface)] of the routes to change.
+
+        Latency and loss are given per `matrix.addresses`. Destinations the
+        matrix finds settled keep their route in bulk, only the contested
+        ones go through hysteresis and damping.
+        """
+        now = time.monotonic() if now is None else now
+        scores = matrix.update(latency_ms, packet_loss, self.alpha)
+        contested = matrix.contested(scores, self.margin_ms, self.margin_ratio)
+        changes = []
+        for row, column in contested:
+            dest, iface = matrix.dests[row], matrix.ifaces[row][column]
+            destination = self.destinations.setdefault(dest, Destination())
+            # A path that is gone counts as failed like one that stopped answering
+            failover = matrix.current[row] < 0 or matrix.failover(row, column)
+            if self.choose(destination, iface, now, failover):
+                matrix.route(row, iface)
+                changes.append((dest, iface))
+            if destination.challenger:
+                self.challenged.add(dest)
+        contested = {matrix.dests[row] for row, _ in contested}
+        # Settled destinations drop the challenger they were holding for
+        for dest in [dest for dest in self.challenged if dest not in contested]:
+            destination = self.destinations.get(dest)
+            if destination:
+                destination.challenger, destination.held = None, 0
+            self.challenged.discard(dest)
+        settled = len(matrix.dests) - len(contested)
+        if settled:
+            METRICS.inc('agent_reroute_decisions_total', settled, description='Rerouting decisions', decision='keep')
+        return changes
+
+    def decide_multipath(self, matrix, latency_ms, packet_loss):
+        """Weighted paths of every destination of a PathMatrix, returns [(dest, {iface: weight})] of those that changed.
+
+        Paths scoring worse than SYNTROPY_MULTIPATH_PRUNE_RATIO times the
+        best one (and more than the margin) are left out, the rest get
+        weights up to SYNTROPY_MULTIPATH_MAX_WEIGHT.
+        """
+        scores = matrix.update(latency_ms, packet_loss, self.alpha)
+        changes = []
+        for row, weights in matrix.multipath(scores, self.margin_ms, self.prune_ratio, self.max_weight):
+            changes.append((
+                matrix.dests[row], {iface: weight for iface, weight in zip(matrix.ifaces[row], weights) if weight}
+            ))
+        if changes:
+            METRICS.inc(
+                'agent_route_changes_total', len(changes), description='Routes moved to another interface by rerouting'
+            )
+            METRICS.inc(
+                'agent_reroute_decisions_total', len(changes), description='Rerouting decisions', decision='multipath'
+            )
+        settled = len(matrix.dests) - len(changes)
+        if settled:
+            METRICS.inc('agent_reroute_decisions_total', settled, description='Rerouting decisions', decision='keep')
+        return changes
+
+    def choose(self, destination, best, now, failover=False, better=True):
+        self.decay(destination, now)
+        if destination.current is None:
+            return self.switch(destination, best, now, 'initial')
+        if failover:
+            return self.switch(destination, best, now, 'failover')
+        if not better:
+            destination.challenger, destination.held = None, 0
+            return self.record(destination, 'keep')
+        if destination.challenger != best:
+            destination.challenger, destination.held = best, 0
+        destination.held += 1
+        if destination.held < self.hold:
+            return self.record(destination, 'hold')
+        if destination.suppressed:
+            return self.record(destination, 'damped')
+        return self.switch(destination, best, now, 'switch')
+
+    def switch(self, destination, iface, now, decision):
+        if decision == 'switch':
+            destination.penalty += FLAP_PENALTY
+            self.decay(destination, now)
+        destination.current, destination.challenger, destination.held = iface, None, 0
+        METRICS.inc('agent_route_changes_total', description='Routes moved to another interface by rerouting')
+        self.record(destination, decision)
+        return iface
+
+    @staticmethod
+    def record(destination, decision):
+        METRICS.inc('agent_reroute_decisions_total', description='Rerouting decisions', decision=decision)
+        return None
+
+    def current(self, dest):
+        destination = self.destinations.get(dest)
+        return destination.current if destination else None
+
+    def failed(self, dest, matrix=None):
+        """The route could not be changed, decide again from scratch next cycle."""
+        if dest in self.destinations:
+            self.destinations[dest].current = None
+        if matrix is not None and dest in matrix.rows:
+            matrix.route(matrix.rows[dest], None)
+
+    def forget(self, dests):
+        """Drops state of destinations that are no longer routed over any mesh interface."""
+        for dest in [dest for dest in self.destinations if dest not in dests]:
+            del self.destinations[dest]
+        for dest in [dest for dest in self.paths if dest not in dests]:
+            del self.paths[dest]
+        self.challenged &= set(dests)
@@ -1,20 +1,28 @@
 import threading
 import time
 import logging
-import pyroute2
-import ipaddress
 import json
+import os
 import re
 
-from pyroute2 import WireGuard
+from pyroute2 import NetlinkError
 
-from platform_agent.cmd.lsmod import module_loaded
+from platform_agent.lib.capabilities import CAPABILITIES
 from platform_agent.cmd.wg_info import WireGuardRead
-from platform_agent.files.tmp_files import read_tmp_file
+from platform_agent.network.failure_detector import FailureDetector, failure_detection_enabled
+from platform_agent.network.iface_watcher import IFACE_STATE, get_iface_info
 from platform_agent.routes import Routes
+from platform_agent.routes.routes import enable_flow_hashing
 from platform_agent.lib.ctime import now
+from platform_agent.lib.generation import CONFIG_GENERATION
+from platform_agent.lib.metrics import METRICS
+from platform_agent.lib.prefix_tree import PrefixTree
+from platform_agent.lib.tsdb import TSDB
+from platform_agent.rerouting.path_matrix import PathMatrix
+from platform_agent.rerouting.path_selector import PathSelector
 
-from platform_agent.wireguard.helpers import WG_NAME_PATTERN, ping_internal_ips, get_peer_info_all
+from platform_agent.wireguard.helpers import WG_NAME_PATTERN, ping_internal_ips, get_wg_devices
+from platform_agent.wireguard.wg_netlink import WireGuardNetlink
 
 logger = logging.getLogger()
 
@@ -22,22 +30,20 @@ logger = logging.getLogger()
 def get_routing_info(wg):
     routing_info = {}
     peers_internal_ips = []
-    interfaces = read_tmp_file(file_type='iface_info')
-    res = {k: v for k, v in interfaces.items() if re.match(WG_NAME_PATTERN, k)}
-    for ifname in res.keys():
-        if not res[ifname].get('internal_ip'):
-            continue
-        internal_ip = res[ifname]['internal_ip']
+    interfaces = get_iface_info()
+    res = {k: v for k, v in interfaces.items() if re.match(WG_NAME_PATTERN, k) and v.get('internal_ip')}
+    devices = get_wg_devices(wg, list(res.keys()))
+    internal_networks = PrefixTree()
+    for ifname in devices:
+        internal_networks.insert(f"{res[ifname]['internal_ip'].split('/')[0]}/24", ifname, key=ifname)
+    for ifname, device in devices.items():
         metadata = res[ifname]['metadata']
-        peers = get_peer_info_all(ifname, wg, kind=res[ifname]['kind'])
-        for peer in peers:
+        for peer in device['peers']:
             try:
                 peer_internal_ip = next(
                     (
                         ip for ip in peer['allowed_ips']
-                        if
-                        ipaddress.ip_address(ip.split('/')[0]) in ipaddress.ip_network(f"{internal_ip.split('/')[0]}/24",
-                                                                                       False)
+                        if ifname in internal_networks.longest_match(ip.split('/')[0])[1]
                     ),
                     None
                 )
@@ -52,64 +58,136 @@ def get_routing_info(wg):
                     routing_info[allowed_ip] = {'ifaces': {}}
                 routing_info[allowed_ip]['ifaces'][ifname] = {
                     'internal_ip': peer_internal_ip,
+                    'gw': res[ifname]['internal_ip'].split('/')[0],
                     'metadata': metadata
                 }
     return routing_info, peers_internal_ips
 
 
-def get_interface_internal_ip(ifname):
-    with pyroute2.IPDB() as ipdb:
-        internal_ip = f"{ipdb.interfaces[ifname]['ipaddr'][0]['address']}"
-        return internal_ip
+class RoutingModel:
+    """`get_routing_info` kept until an interface, peer or config change.
 
+    Rebuilt when the interface state version or CONFIG_GENERATION moved, and
+    at least every SYNTROPY_ROUTING_MODEL_MAX_AGE seconds for changes made
+    outside the agent. Callers must not modify what `get()` returns.
+    `matrix` is the PathMatrix of the current model.
+    """
 
-def get_fastest_routes(wg):
-    result = {}
-    routing_info, peers_internal_ips = get_routing_info(wg)
-    ping_results = ping_internal_ips(peers_internal_ips, icmp_id=20000)
-    for dest, routes in routing_info.items():
-        best_route = None
-        best_ping = 9999
-        for iface, data in routes['ifaces'].items():
-            int_ip = data['internal_ip'].split('/')[0]
-            if ping_results[int_ip]['latency_ms'] < best_ping:
-                best_route = {'iface': iface, 'gw': data['internal_ip'], 'metadata': data.get('metadata')}
-                best_ping = ping_results[int_ip]['latency_ms']
-        result[dest] = best_route
-    return result, ping_results
+    def __init__(self, wg, max_age=None):
+        self.wg = wg
+        self.max_age = max_age or int(os.environ.get('SYNTROPY_ROUTING_MODEL_MAX_AGE', 60))
+        self.key = None
+        self.built_at = None
+        self.model = None
+        self.matrix = None
+
+    def get(self):
+        key = (IFACE_STATE.version, CONFIG_GENERATION.value)
+        fresh = self.built_at is not None and time.monotonic() - self.built_at < self.max_age
+        # Without a watcher the interface version never moves
+        if key != self.key or not fresh or not IFACE_STATE.watched:
+            self.model = get_routing_info(self.wg)
+            self.matrix = PathMatrix(self.model[0], previous=self.matrix)
+            self.key, self.built_at = key, time.monotonic()
+            METRICS.inc('agent_routing_model_rebuilds_total', description='Rebuilds of the rerouting model')
+        return self.model
 
 
 class Rerouting(threading.Thread):
+    """Keeps destination routes on their best mesh interfaces.
+
+    SYNTROPY_REROUTE_POLICY picks how: `best` routes every destination via
+    its single best interface, `multipath` via weighted multipath routes
+    over every interface that is not clearly worse than the best one.
+    With SYNTROPY_FAILURE_DETECTION=true a FailureDetector watches the
+    peers as well; a peer it finds down counts as lost at once and wakes
+    the loop, so routes fail over without waiting for the pings.
+    """
 
-    def __init__(self, client, interval=1):
+    def __init__(self, client, interval=1, policy=None):
         logger.debug(f"[REROUTING] Initializing")
         super().__init__()
         self.interval = interval
         self.client = client
-        self.wg = WireGuard() if module_loaded("wireguard") else WireGuardRead()
+        self.wg = WireGuardNetlink() if CAPABILITIES.kernel_wireguard else WireGuardRead()
         self.routes = Routes()
+        self.selector = PathSelector()
+        self.routing_model = RoutingModel(self.wg)
+        self.policy = (policy or os.environ.get('SYNTROPY_REROUTE_POLICY', 'best')).lower()
+        if self.policy not in ('best', 'multipath'):
+            logger.warning(f"[REROUTING] Unknown policy {self.policy}, using best")
+            self.policy = 'best'
+        if self.policy == 'multipath':
+            enable_flow_hashing()
         self.stop_rerouting = threading.Event()
+        self.wake_rerouting = threading.Event()
+        self.detector = None
         self.daemon = True
 
     def run(self):
         logger.debug(f"[REROUTING] Running")
-        previous_routes = {}
+        if failure_detection_enabled():
+            self.detector = FailureDetector(on_change=self.peer_changed)
+            self.detector.start()
+        try:
+            self.reroute_loop()
+        finally:
+            if self.detector:
+                self.detector.join()
+
+    def reroute_loop(self):
+        matrix = None
         while not self.stop_rerouting.is_set():
-            new_routes, ping_data = get_fastest_routes(self.wg)
-            for dest, best_route in new_routes.items():
-                if not best_route or previous_routes.get(dest) == best_route:
-                    continue
-                # Do rerouting logic with best_route
-                logger.debug(f"[REROUTING] Rerouting {dest} via {best_route}", extra={'metadata': best_route.get('metadata')})
-                try:
-                    self.routes.ip_route_replace(
-                        ifname=best_route['iface'], ip_list=[dest],
-                        gw_ipv4=get_interface_internal_ip(best_route['iface'])
-                    )
-                except KeyError:  # catch if interface was deleted while executing this code
-                    continue
-            previous_routes = new_routes
-            time.sleep(int(self.interval))
+            routing_info, _ = self.routing_model.get()
+            if self.routing_model.matrix is not matrix:
+                matrix = self.routing_model.matrix
+                self.selector.forget(matrix.rows)
+            # Averaged over the last 4 probes, as the 4 pings every cycle used to be
+            pings = ping_internal_ips(matrix.addresses, 'rerouting', self.interval, samples=4)
+            latency_ms = [pings[address]['latency_ms'] for address in matrix.addresses]
+            packet_loss = [pings[address]['packet_loss'] for address in matrix.addresses]
+            if self.detector:
+                self.detector.watch(matrix.addresses)
+                down = self.detector.down()
+                for i, address in enumerate(matrix.addresses):
+                    if address in down:
+                        latency_ms[i], packet_loss[i] = 5000, 1
+            if self.policy == 'multipath':
+                self.route_multipath(matrix, routing_info, latency_ms, packet_loss)
+            else:
+                self.route_best(matrix, routing_info, latency_ms, packet_loss)
+            self.wake_rerouting.wait(int(self.interval))
+            self.wake_rerouting.clear()
+
+    def peer_changed(self, address, up):
+        if not up:
+            METRICS.inc('agent_fast_failovers_total', description='Rerouting cycles started by the failure detector')
+            self.wake_rerouting.set()
+
+    def route_best(self, matrix, routing_info, latency_ms, packet_loss):
+        moves = {}
+        for dest, iface in self.selector.decide_matrix(matrix, latency_ms, packet_loss):
+            TSDB.record(f"route.{dest}.reroutes", 1)
+            data = routing_info[dest]['ifaces'][iface]
+            logger.debug(f"[REROUTING] Rerouting {dest} via {iface}", extra={'metadata': data.get('metadata')})
+            moves[dest] = (iface, data['gw'])
+        # Interfaces deleted while executing this code fail their routes
+        for dest, code in self.routes.reroute(moves).items():
+            logger.debug(f"[REROUTING] Rerouting {dest} via {moves[dest][0]} failed {NetlinkError(code)}")
+            self.selector.failed(dest, matrix)
+
+    def route_multipath(self, matrix, routing_info, latency_ms, packet_loss):
+        moves = {}
+        for dest, weights in self.selector.decide_multipath(matrix, latency_ms, packet_loss):
+            TSDB.record(f"route.{dest}.reroutes", 1)
+            logger.debug(f"[REROUTING] Rerouting {dest} via {weights}")
+            moves[dest] = [
+                (iface, routing_info[dest]['ifaces'][iface]['gw'], weight) for iface, weight in weights.items()
+            ]
+        for dest, code in self.routes.reroute_multipath(moves).items():
+            ifaces = [path[0] for path in moves[dest]]
+            logger.debug(f"[REROUTING] Rerouting {dest} via {ifaces} failed {NetlinkError(code)}")
+            self.selector.failed(dest, matrix)
 
     def send_latency_data(self, data):
         self.client.send_log(json.dumps({
@@ -121,4 +199,5 @@ class Rerouting(threading.Thread):
 
     def join(self, timeout=None):
         self.stop_rerouting.set()
+        self.wake_rerouting.set()
         super().join(timeout)
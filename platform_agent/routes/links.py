@@ -0,0 +1,117 @@
+import errno
+import socket
+from ipaddress import ip_interface
+
+from pyroute2 import NetlinkError
+from pyroute2.netlink import NLM_F_REQUEST, NLM_F_ACK
+from pyroute2.netlink.rtnl import RTM_GETLINK, RTM_DELLINK, RTM_DELADDR
+from pyroute2.netlink.rtnl.ifaddrmsg import ifaddrmsg
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+
+IFF_UP = 0x1
+
+
+class Links:
+    """Link and IPv4 address management over an existing IPRoute socket.
+
+    Every call is idempotent: creating an existing link, adding a present
+    address or deleting something that is already gone is not an error.
+    """
+
+    def __init__(self, ip_route):
+        self.ip_route = ip_route
+
+    def index(self, ifname):
+        # A single RTM_GETLINK by name; link_lookup dumps every link on each call
+        msg = ifinfmsg()
+        msg['attrs'] = [['IFLA_IFNAME', ifname]]
+        try:
+            return self.ip_route.nlm_request(msg, msg_type=RTM_GETLINK, msg_flags=NLM_F_REQUEST)[0]['index']
+        except NetlinkError as e:
+            if e.code != errno.ENODEV:
+                raise
+            return None
+
+    def create(self, ifname, kind, **kwargs):
+        """Creates the link already up, returns (index, created)."""
+        try:
+            self.ip_route.link('add', ifname=ifname, kind=kind, flags=IFF_UP, change=IFF_UP, **kwargs)
+            created = True
+        except NetlinkError as e:
+            if e.code != errno.EEXIST:
+                raise
+            created = False
+        return self.index(ifname), created
+
+    def set_up(self, index):
+        self.ip_route.link('set', index=index, flags=IFF_UP, change=IFF_UP)
+
+    def addresses(self, index):
+        return [
+            (msg.get_attr('IFA_ADDRESS'), msg['prefixlen'])
+            for msg in self.ip_route.get_addr(family=socket.AF_INET, index=index)
+        ]
+
+    def add_address(self, index, address, prefixlen):
+        try:
+            self.ip_route.addr('add', index=index, address=address, mask=prefixlen)
+        except NetlinkError as e:
+            if e.code != errno.EEXIST:
+                raise
+
+    def _delete(self, msg, msg_type):
+        # IPRoute sets NLM_F_CREATE|NLM_F_EXCL on deletes as well, which recent kernels reject
+        self.ip_route.nlm_request(msg, msg_type=msg_type, msg_flags=NLM_F_REQUEST | NLM_F_ACK)
+
+    def delete_address(self, index, address, prefixlen):
+        msg = ifaddrmsg()
+        msg['family'] = socket.AF_INET
+        msg['prefixlen'] = prefixlen
+        msg['index'] = index
+        msg['attrs'] = [['IFA_LOCAL', address], ['IFA_ADDRESS', address]]
+        try:
+            self._delete(msg, RTM_DELADDR)
+        except NetlinkError as e:
+            if e.code not in (errno.EADDRNOTAVAIL, errno.ENODEV):
+                raise
+
+    def clear_addresses(self, index, keep_address):
+        """Deletes every IPv4 address of the link except `keep_address`."""
+        for address, prefixlen in self.addresses(index):
+            if address != keep_address:
+                self.delete_address(index, address, prefixlen)
+
+    def ensure(self, ifname, kind=None, address=None, **kwargs):
+        """Makes sure `ifname` exists, is up and has `address` as its only IPv4 address.
+
+        Without `kind` the link has to exist already (e.g. created by wireguard-go).
+        """
+        if kind:
+            index, created = self.create(ifname, kind, **kwargs)
+        else:
+            index, created = self.index(ifname), False
+        if index is None:
+            raise NetlinkError(errno.ENODEV)
+        if not created:
+            self.set_up(index)
+        if address:
+            interface = ip_interface(address)
+            current = [] if created else self.addresses(index)
+            for current_address, prefixlen in current:
+                if (current_address, prefixlen) != (str(interface.ip), interface.network.prefixlen):
+                    self.delete_address(index, current_address, prefixlen)
+            if (str(interface.ip), interface.network.prefixlen) not in current:
+                self.add_address(index, str(interface.ip), interface.network.prefixlen)
+        return index
+
+    def delete(self, ifname):
+        index = self.index(ifname)
+        if index is None:
+            return
+        msg = ifinfmsg()
+        msg['index'] = index
+        try:
+            self._delete(msg, RTM_DELLINK)
+        except NetlinkError as e:
+            if e.code != errno.ENODEV:
+                raise
@@ -0,0 +1,169 @@
+import collections
+import errno
+import os
+import socket
+import struct
+import threading
+from ipaddress import ip_network
+
+from pyroute2.netlink import NLM_F_CREATE, NLM_F_REPLACE
+from pyroute2.netlink.rtnl import RTM_NEWROUTE
+
+from platform_agent.lib.capabilities import CAPABILITIES
+
+RTM_NEWNEXTHOP = 104
+RTM_DELNEXTHOP = 105
+NHA_ID = 1
+NHA_OIF = 5
+NHA_GATEWAY = 6
+RTA_DST = 1
+RTA_NH_ID = 30
+RT_TABLE_MAIN = 254
+RTPROT_STATIC = 4
+RTN_UNICAST = 1
+NHMSG = struct.Struct('BBBBI')
+RTMSG = struct.Struct('BBBBBBBBI')
+# Nexthop ids owned by the agent start here, well clear of ids picked by hand
+NEXTHOP_ID_BASE = 0x53590000
+# The nexthop object is gone, e.g. removed by the kernel with its interface
+STALE_NEXTHOP = (errno.ENOENT, errno.ENODEV, errno.EINVAL)
+
+
+def nexthop_objects_enabled():
+    """SYNTROPY_NEXTHOP_OBJECTS=false keeps per-route gateways on kernels that have nexthop objects."""
+    if os.environ.get('SYNTROPY_NEXTHOP_OBJECTS', '').lower() == 'false':
+        return False
+    return CAPABILITIES.get('nexthop_objects')
+
+
+def attr(kind, data):
+    data = struct.pack('HH', 4 + len(data), kind) + data
+    return data + b'\0' * (-len(data) % 4)
+
+
+def nexthop_message(nh_id, oif, gateway):
+    payload = NHMSG.pack(socket.AF_INET, 0, RTPROT_STATIC, 0, 0) + attr(NHA_ID, struct.pack('I', nh_id)) + \
+        attr(NHA_OIF, struct.pack('I', oif)) + attr(NHA_GATEWAY, socket.inet_aton(gateway))
+    return RTM_NEWNEXTHOP, NLM_F_CREATE | NLM_F_REPLACE, payload
+
+
+def delete_nexthop_message(nh_id):
+    return RTM_DELNEXTHOP, 0, NHMSG.pack(socket.AF_INET, 0, 0, 0, 0) + attr(NHA_ID, struct.pack('I', nh_id))
+
+
+def route_message(dst, nh_id):
+    network = ip_network(dst, False)
+    payload = RTMSG.pack(
+        socket.AF_INET, network.prefixlen, 0, 0, RT_TABLE_MAIN, RTPROT_STATIC, 0, RTN_UNICAST, 0
+    ) + attr(RTA_DST, network.network_address.packed) + attr(RTA_NH_ID, struct.pack('I', nh_id))
+    return RTM_NEWROUTE, NLM_F_CREATE | NLM_F_REPLACE, payload
+
+
+class NexthopRoutes:
+    """Destination routes that point to kernel nexthop objects instead of carrying a gateway.
+
+    Every nexthop object ("slot") holds one (oif, gateway) and all
+    destinations routed via that gateway share it. When every destination
+    of a slot moves to the same gateway, which is what a failing gateway
+    looks like, the slot is replaced in a single RTM_NEWNEXTHOP; otherwise
+    only the moving routes are pointed at another slot. The slots belong to
+    the process, `NEXTHOPS`, and every `Routes` sends through its own batch.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.targets = {}
+        self.members = {}
+        self.slots = {}
+        self.next_id = NEXTHOP_ID_BASE
+
+    def slot_for(self, target):
+        return next((slot for slot, slot_target in self.targets.items() if slot_target == target), None)
+
+    def move(self, moves, batch):
+        """Routes every destination of {dest: (oif, gateway)} via nexthop objects, returns {dest: errno} of failures."""
+        with self.lock:
+            return self._move(moves, batch)
+
+    def _move(self, moves, batch):
+        failed = {}
+        by_slot = collections.defaultdict(list)
+        for dest in moves:
+            by_slot[self.slots.get(dest)].append(dest)
+        retargets = []
+        for slot, dests in by_slot.items():
+            if slot is None or len(dests) != len(self.members[slot]):
+                continue
+            targets = {moves[dest] for dest in dests}
+            if len(targets) == 1:
+                retargets.append((slot, targets.pop()))
+        codes = batch.run_raw([nexthop_message(slot, *target) for slot, target in retargets])
+        moved = set()
+        for (slot, target), code in zip(retargets, codes):
+            if code == 0:
+                self.targets[slot] = target
+                moved.update(self.members[slot])
+            elif code in STALE_NEXTHOP:
+                self.drop(slot)
+
+        rest = [dest for dest in moves if dest not in moved]
+        created = []
+        for dest in rest:
+            if self.slot_for(moves[dest]) is None:
+                slot = self.next_id
+                self.next_id += 1
+                self.targets[slot], self.members[slot] = moves[dest], set()
+                created.append(slot)
+        codes = batch.run_raw([nexthop_message(slot, *self.targets[slot]) for slot in created])
+        for slot, code in zip(created, codes):
+            if code:
+                failed.update({dest: code for dest in rest if moves[dest] == self.targets[slot]})
+                self.drop(slot)
+
+        messages = []
+        for dest in [dest for dest in rest if dest not in failed]:
+            try:
+                messages.append((dest, route_message(dest, self.slot_for(moves[dest]))))
+            except ValueError:
+                failed[dest] = errno.EINVAL
+        rest = [(dest, self.slot_for(moves[dest])) for dest, _ in messages]
+        codes = batch.run_raw([message for _, message in messages])
+        for (dest, slot), code in zip(rest, codes):
+            if code == 0:
+                self.forget([dest])
+                self.slots[dest] = slot
+                self.members[slot].add(dest)
+                continue
+            failed[dest] = code
+            if code in STALE_NEXTHOP:
+                self.drop(slot)
+        self.release(batch)
+        return failed
+
+    def forget(self, dests):
+        """Destinations no longer routed via a slot, returns those that were."""
+        forgotten = []
+        with self.lock:
+            for dest in dests:
+                slot = self.slots.pop(dest, None)
+                if slot is not None:
+                    self.members[slot].discard(dest)
+                    forgotten.append(dest)
+        return forgotten
+
+    def drop(self, slot):
+        with self.lock:
+            for dest in self.members.pop(slot, ()):
+                self.slots.pop(dest, None)
+            self.targets.pop(slot, None)
+
+    def release(self, batch):
+        """Deletes slots no destination uses anymore."""
+        with self.lock:
+            unused = [slot for slot, members in self.members.items() if not members]
+            batch.run_raw([delete_nexthop_message(slot) for slot in unused])
+            for slot in unused:
+                self.drop(slot)
+
+
+NEXTHOPS = NexthopRoutes()
@@ -0,0 +1,180 @@
+import errno
+import logging
+import select
+import socket
+import threading
+
+from pyroute2 import IPRoute
+from pyroute2.netlink.rtnl import RTMGRP_IPV4_ROUTE
+
+from platform_agent.lib.prefix_tree import PrefixTree
+
+logger = logging.getLogger()
+
+
+class RouteCache:
+    """In-memory copy of the kernel IPv4 routing tables.
+
+    Kept current by `RouteWatcher` from RTM_NEWROUTE/RTM_DELROUTE events.
+    Without a running watcher every read falls back to a fresh dump.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.routes = {}
+        self.by_oif = {}
+        self.prefixes = PrefixTree()
+        self.version = 0
+        self.watched = False
+
+    @staticmethod
+    def parse(msg):
+        dst = msg.get_attr('RTA_DST')
+        if not dst or msg.get('family') != socket.AF_INET:
+            return None, None
+        table = msg.get_attr('RTA_TABLE') or msg.get('table')
+        key = (table, f"{dst}/{msg['dst_len']}", msg.get_attr('RTA_PRIORITY') or 0)
+        route = {
+            'dst': key[1],
+            'table': table,
+            'type': msg.get('type'),
+            'oif': msg.get_attr('RTA_OIF'),
+            'gateway': msg.get_attr('RTA_GATEWAY'),
+        }
+        hops = msg.get_attr('RTA_MULTIPATH')
+        if hops:
+            route['oifs'] = [hop['oif'] for hop in hops]
+            route['oif'] = route['oif'] or route['oifs'][0]
+        return key, route
+
+    def load(self, ip_route):
+        routes = {}
+        for msg in ip_route.get_routes(family=socket.AF_INET):
+            key, route = self.parse(msg)
+            if key:
+                routes[key] = route
+        with self.lock:
+            self.routes = {}
+            self.by_oif = {}
+            self.prefixes = PrefixTree()
+            for key, route in routes.items():
+                self._add(key, route)
+            self._bump()
+
+    def handle(self, msg):
+        key, route = self.parse(msg)
+        if not key:
+            return False
+        with self.lock:
+            if msg.get('event') == 'RTM_NEWROUTE':
+                self._remove(key)
+                self._add(key, route)
+            elif msg.get('event') == 'RTM_DELROUTE':
+                if key not in self.routes:
+                    return False
+                self._remove(key)
+            else:
+                return False
+            self._bump()
+        return True
+
+    def _add(self, key, route):
+        self.routes[key] = route
+        self.by_oif.setdefault(route['oif'], set()).add(key)
+        self.prefixes.insert(route['dst'], route, key=key)
+
+    def _remove(self, key):
+        route = self.routes.pop(key, None)
+        if route:
+            self.by_oif.get(route['oif'], set()).discard(key)
+            self.prefixes.remove(route['dst'], key=key)
+
+    def _bump(self):
+        self.version += 1
+
+    def refresh(self):
+        if not self.watched:
+            with IPRoute() as ip_route:
+                self.load(ip_route)
+
+    def update(self, dst, oif, gateway=None, table=254, oifs=None):
+        """Records a route we programmed ourselves, ahead of its netlink event, `oifs` of every multipath hop."""
+        with self.lock:
+            key = (table, dst, 0)
+            self._remove(key)
+            route = {'dst': dst, 'table': table, 'type': 1, 'oif': oif, 'gateway': gateway}
+            if oifs:
+                route['oifs'] = list(oifs)
+            self._add(key, route)
+            self._bump()
+
+    def discard(self, dst, oif=None, table=254):
+        with self.lock:
+            key = (table, dst, 0)
+            route = self.routes.get(key)
+            if route and (oif is None or oif in route.get('oifs', [route['oif']])):
+                self._remove(key)
+                self._bump()
+
+    def get(self, dst):
+        self.refresh()
+        with self.lock:
+            return self.prefixes.owners(dst)
+
+    def find_overlap(self, dst):
+        """Returns the destination of a route overlapping `dst` other than `dst` itself."""
+        self.refresh()
+        with self.lock:
+            network, _ = self.prefixes.find_overlap(dst)
+            return network
+
+    def oif_routes(self, oif, route_type=1):
+        self.refresh()
+        with self.lock:
+            return [
+                self.routes[key]['dst'] for key in self.by_oif.get(oif, ())
+                if self.routes[key]['type'] == route_type
+            ]
+
+
+ROUTE_CACHE = RouteCache()
+
+
+class RouteWatcher(threading.Thread):
+
+    def __init__(self, cache=ROUTE_CACHE):
+        super().__init__()
+        self.cache = cache
+        self.stop_route_watcher = threading.Event()
+        self.daemon = True
+
+    def resync(self):
+        with IPRoute() as ip_route:
+            self.cache.load(ip_route)
+
+    def run(self):
+        with IPRoute() as events:
+            events.bind(groups=RTMGRP_IPV4_ROUTE)
+            self.resync()
+            self.cache.watched = True
+            try:
+                while not self.stop_route_watcher.is_set():
+                    ready, _, _ = select.select([events], [], [], 1)
+                    if not ready:
+                        continue
+                    try:
+                        messages = events.get()
+                    except OSError as e:
+                        if e.errno != errno.ENOBUFS:
+                            raise
+                        logger.warning("[ROUTE_WATCHER] netlink overrun, resyncing")
+                        self.resync()
+                        continue
+                    for msg in messages:
+                        self.cache.handle(msg)
+            finally:
+                self.cache.watched = False
+
+    def join(self, timeout=None):
+        self.stop_route_watcher.set()
+        super().join(timeout)
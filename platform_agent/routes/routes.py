@@ -1,109 +1,277 @@
+import errno
 import logging
 import socket
-import subprocess
+import struct
+import threading
 
-from pyroute2 import IPRoute, NetlinkError
-from ipaddress import IPv4Network, ip_network
+from pyroute2 import IPRoute, IPBatch, NetlinkError
+from pyroute2.netlink import NETLINK_ROUTE, NLMSG_ERROR, NLM_F_REQUEST, NLM_F_ACK
+from ipaddress import ip_network
 
 from platform_agent.files.tmp_files import get_agent_id_by_text
+from platform_agent.routes.links import Links
+from platform_agent.routes.nexthops import NEXTHOPS, nexthop_objects_enabled
+from platform_agent.routes.route_cache import ROUTE_CACHE
 
 logger = logging.getLogger()
 
+BATCH_SIZE = 512
+BATCH_TIMEOUT = 5
+DELETE_COMMANDS = ('del', 'remove', 'delete')
+MULTIPATH_HASH_POLICY = '/proc/sys/net/ipv4/fib_multipath_hash_policy'
+
+
+def enable_flow_hashing(path=MULTIPATH_HASH_POLICY):
+    """Spreads multipath traffic by 5-tuple instead of address pair, unless an admin already chose a policy."""
+    try:
+        with open(path) as f:
+            if f.read().strip() != '0':
+                return
+        with open(path, 'w') as f:
+            f.write('1')
+    except OSError as e:
+        logger.warning(f"[ROUTES] Could not set multipath hash policy {e}")
+
+
+class RouteBatch:
+    """Pipelines route requests over one netlink socket.
+
+    Requests are compiled with IPBatch, numbered and sent in a single
+    `send()` per chunk; the kernel ACKs are matched back by sequence number.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compiler = IPBatch()
+        self.seq = 0
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.settimeout(BATCH_TIMEOUT)
+        self.sock.bind((0, 0))
+
+    def run(self, requests):
+        """Sends `(command, kwargs)` route requests, returns errno per request (0 is success)."""
+        results = []
+        with self.lock:
+            for i in range(0, len(requests), BATCH_SIZE):
+                results.extend(self._run(requests[i:i + BATCH_SIZE]))
+        return results
+
+    def run_raw(self, messages):
+        """Sends pre-built `(msg_type, flags, payload)` messages, returns errno per message."""
+        results = []
+        with self.lock:
+            for i in range(0, len(messages), BATCH_SIZE):
+                batch = bytearray()
+                pending = {}
+                for index, (msg_type, flags, payload) in enumerate(messages[i:i + BATCH_SIZE]):
+                    self.seq = self.seq % 0x7fffffff + 1
+                    batch += struct.pack(
+                        'IHHII', 16 + len(payload), msg_type, flags | NLM_F_REQUEST | NLM_F_ACK, self.seq, 0
+                    ) + payload
+                    pending[self.seq] = index
+                results.extend(self.exchange(batch, pending, [None] * len(pending)))
+        return results
+
+    def _run(self, requests):
+        results = [None] * len(requests)
+        pending = {}
+        self.compiler.reset()
+        for index, (command, kwargs) in enumerate(requests):
+            offset = len(self.compiler.batch)
+            try:
+                self.compiler.route(command, **kwargs)
+            except (ValueError, TypeError, KeyError, socket.error):
+                del self.compiler.batch[offset:]
+                results[index] = errno.EINVAL
+                continue
+            self.seq = self.seq % 0x7fffffff + 1
+            struct.pack_into('I', self.compiler.batch, offset + 8, self.seq)
+            if command in DELETE_COMMANDS:
+                # pyroute2 sets NLM_F_CREATE|NLM_F_EXCL on deletes, which recent kernels reject
+                struct.pack_into('H', self.compiler.batch, offset + 6, NLM_F_REQUEST | NLM_F_ACK)
+            pending[self.seq] = index
+        return self.exchange(self.compiler.batch, pending, results)
+
+    def exchange(self, batch, pending, results):
+        """Sends the batch and fills in the ACK of every pending `{seq: index}`."""
+        if not pending:
+            return results
+        self.sock.send(bytes(batch))
+        while pending:
+            try:
+                data = self.sock.recv(1 << 20)
+            except socket.timeout:
+                break
+            offset = 0
+            while offset + 20 <= len(data):
+                length, msg_type, _, seq, _ = struct.unpack_from('IHHII', data, offset)
+                if msg_type == NLMSG_ERROR and seq in pending:
+                    results[pending.pop(seq)] = -struct.unpack_from('i', data, offset + 16)[0]
+                if not length:
+                    break
+                offset += (length + 3) & ~3
+        for index in pending.values():
+            results[index] = errno.ETIMEDOUT
+        return results
+
 
 class Routes:
     def __init__(self):
         self.ip_route = IPRoute()
+        self.links = Links(self.ip_route)
+        self.batch = RouteBatch()
+        self.cache = ROUTE_CACHE
+        self.nexthops = NEXTHOPS
+        # Checked on first use, False when the kernel or configuration rules nexthop objects out
+        self.nexthops_enabled = None
+
+    def device(self, ifname):
+        dev = self.links.index(ifname)
+        if dev is None:
+            raise NetlinkError(errno.ENODEV)
+        return dev
 
     def ip_route_add(self, ifname, ip_list, gw_ipv4):
-        devices = self.ip_route.link_lookup(ifname=ifname)
-        dev = devices[0]
+        dev = self.device(ifname)
         statuses = []
-        routes = self.ip_route.get_routes(family=socket.AF_INET)
-        network_list = []
-        for route in routes:
-            try:
-                ip_cidr = (dict(route['attrs'])['RTA_DST'] + '/' + str(route['dst_len']))
-                network_list.append(IPv4Network(ip_cidr))
-            except (KeyError, ValueError):
-                continue
+        requests = []
         for ip in ip_list:
             # format ip to strict format
             formatted_ip = ip_network(ip, False)
             result = {'ip': ip, 'status': 'OK'}
-            for network in network_list:
-                if formatted_ip == network:
-                    continue
-                elif formatted_ip.overlaps(network):
-                    agent_id = get_agent_id_by_text(ip)
-                    result = {
-                        'ip': ip,
-                        'status': 'ERROR',
-                        'msg': f'Service ip: {ip} intersects agent_id: {agent_id} CIDR {network}'
-                    }
-                    break
+            network = self.cache.find_overlap(formatted_ip)
+            if network:
+                agent_id = get_agent_id_by_text(network.with_prefixlen)
+                result = {
+                    'ip': ip,
+                    'status': 'ERROR',
+                    'msg': f'Service ip: {ip} intersects agent_id: {agent_id} CIDR {network}'
+                }
+            statuses.append(result)
             if result['status'] == 'ERROR':
-                statuses.append(result)
                 continue
-            try:
-                self.ip_route.route('add', dst=formatted_ip.with_prefixlen, gateway=gw_ipv4, oif=dev)
-            except NetlinkError as error:
-                if error.code != 17:
-                    result.update({'status': "ERROR", 'msg': str(error)})
-                elif dict(self.ip_route.get_routes(dst=formatted_ip.with_prefixlen)[0]['attrs']).get('RTA_OIF') != dev:
-
-                    logger.debug(f"[WG_CONF] add route failed [{ip}] - already exists")
-                    result.update({'status': "ERROR", 'msg': "OVERLAP"})
-            statuses.append(result)
+            requests.append((result, formatted_ip.with_prefixlen))
+        codes = self.batch.run(
+            [('add', {'dst': dst, 'gateway': gw_ipv4, 'oif': dev}) for _, dst in requests]
+        )
+        for (result, dst), code in zip(requests, codes):
+            if code == 0:
+                self.cache.update(dst, dev, gw_ipv4)
+            elif code != errno.EEXIST:
+                result.update({'status': "ERROR", 'msg': str(NetlinkError(code))})
+            elif any(route['oif'] != dev for route in self.cache.get(dst)):
+                logger.debug(f"[WG_CONF] add route failed [{result['ip']}] - already exists")
+                result.update({'status': "ERROR", 'msg': "OVERLAP"})
         return statuses
 
     def ip_route_replace(self, ifname, ip_list, gw_ipv4):
-        devices = self.ip_route.link_lookup(ifname=ifname)
-        dev = devices[0]
-        for ip in ip_list:
-            try:
-                self.ip_route.route('replace', dst=ip, gateway=gw_ipv4)
-            except NetlinkError as error:
-                if error.code != 17:
-                    raise
+        dev = self.device(ifname)
+        ip_list = list(ip_list)
+        codes = self.batch.run([('replace', {'dst': ip, 'gateway': gw_ipv4}) for ip in ip_list])
+        for ip, code in zip(ip_list, codes):
+            if code == 0:
+                self.cache.update(ip, dev, gw_ipv4)
+            elif code != errno.EEXIST:
+                raise NetlinkError(code)
+
+    def reroute(self, moves):
+        """Routes every destination of {dest: (ifname, gw_ipv4)}, returns {dest: errno} of those that failed.
+
+        Uses nexthop objects where the kernel has them, so that destinations
+        leaving one gateway together move in one update; per-route gateways
+        otherwise, and for whatever the nexthop objects could not take.
+        """
+        failed = {}
+        targets = {}
+        devices = {ifname: self.links.index(ifname) for ifname, _ in set(moves.values())}
+        for dest, (ifname, gw_ipv4) in moves.items():
+            dev = devices[ifname]
+            if dev is None:
+                failed[dest] = errno.ENODEV
+            else:
+                targets[dest] = (dev, gw_ipv4)
+        if self.nexthops_enabled is None:
+            self.nexthops_enabled = bool(nexthop_objects_enabled())
+        retry = targets
+        if self.nexthops_enabled:
+            retry = {dest: targets[dest] for dest in self.nexthops.move(targets, self.batch)}
+        codes = self.batch.run([('replace', {'dst': dest, 'gateway': gw_ipv4}) for dest, (_, gw_ipv4) in retry.items()])
+        for dest, code in zip(retry, codes):
+            if code not in (0, errno.EEXIST):
+                failed[dest] = code
+        for dest, (dev, gw_ipv4) in targets.items():
+            if dest not in failed:
+                self.cache.update(dest, dev, gw_ipv4)
+        if self.nexthops.forget([dest for dest in retry if dest not in failed]):
+            self.nexthops.release(self.batch)
+        return failed
+
+    def reroute_multipath(self, moves):
+        """Routes every destination of {dest: [(ifname, gw_ipv4, weight)]} over all of its paths at once.
+
+        The kernel spreads flows over the paths in proportion to their
+        weights (1-256). Returns {dest: errno} of the destinations that failed.
+        """
+        failed = {}
+        requests = []
+        devices = {ifname: self.links.index(ifname) for paths in moves.values() for ifname, _, _ in paths}
+        for dest, paths in moves.items():
+            paths = sorted(paths, key=lambda path: -path[2])
+            if any(devices[ifname] is None for ifname, _, _ in paths):
+                failed[dest] = errno.ENODEV
+                continue
+            ifname, gw_ipv4, _ = paths[0]
+            if len(paths) == 1:
+                request = {'dst': dest, 'gateway': gw_ipv4, 'oif': devices[ifname]}
+            else:
+                request = {'dst': dest, 'multipath': [
+                    {'gateway': gateway, 'oif': devices[name], 'hops': weight - 1} for name, gateway, weight in paths
+                ]}
+            requests.append((dest, devices[ifname], gw_ipv4, request))
+        codes = self.batch.run([('replace', request) for _, _, _, request in requests])
+        for (dest, dev, gw_ipv4, request), code in zip(requests, codes):
+            if code not in (0, errno.EEXIST):
+                failed[dest] = code
+                continue
+            # The cache keeps the heaviest path as the route's gateway and the interfaces of all of them
+            self.cache.update(dest, dev, gw_ipv4, oifs=[hop['oif'] for hop in request.get('multipath', ())])
+        if self.nexthops.forget([dest for dest, _, _, _ in requests if dest not in failed]):
+            self.nexthops.release(self.batch)
+        return failed
 
     def ip_route_del(self, ifname, ip_list, scope=None):
-        devices = self.ip_route.link_lookup(ifname=ifname)
-        dev = devices[0]
-        for ip in ip_list:
-            try:
-                self.ip_route.route('del', dst=ip, oif=dev, scope=scope)
-            except NetlinkError as error:
-                if error.code not in [17, 3, 19]:
-                    raise
+        dev = self.device(ifname)
+        ip_list = list(ip_list)
+        kwargs = {'scope': scope} if scope is not None else {}
+        # Routes via a nexthop object carry no oif of their own to match on
+        via_nexthop = set(self.nexthops.forget(ip_list))
+        codes = self.batch.run([
+            ('del', {'dst': ip, **kwargs} if ip in via_nexthop else {'dst': ip, 'oif': dev, **kwargs}) for ip in ip_list
+        ])
+        # A route on `dev` that does not match its oif is multipath, where only the first hop's oif matches,
+        # or points to a nexthop object we no longer know about, e.g. one installed before a restart
+        retry = [
+            ip for ip, code in zip(ip_list, codes)
+            if code == errno.ESRCH and any(dev in route.get('oifs', [route['oif']]) for route in self.cache.get(ip))
+        ]
+        codes = dict(zip(ip_list, codes))
+        if retry:
+            codes.update(zip(retry, self.batch.run([('del', {'dst': ip, **kwargs}) for ip in retry])))
+        for ip, code in codes.items():
+            if code == 0:
+                self.cache.discard(ip, dev)
+            elif code not in [17, 3, 19]:
+                raise NetlinkError(code)
+        if via_nexthop:
+            self.nexthops.release(self.batch)
 
     def create_rule(self, internal_ip, rt_table_id):
         self.ip_route.flush_rules(table=rt_table_id)
         self.ip_route.flush_routes(table=rt_table_id)
         self.ip_route.rule('add', src=internal_ip, table=rt_table_id)
 
-    def clear_unused_routes(self, ifname, ips):
-        devices = self.ip_route.link_lookup(ifname=ifname)
-        if len(devices) > 0:
-            dev = devices[0]
-        else:
-            return
-        routes = self.ip_route.get_routes(family=socket.AF_INET)
-        already_used_ips = []
-        for route in routes:
-            try:
-                attrs = dict(route['attrs'])
-                if attrs.get('RTA_OIF') == dev and route.get('type') == 1:
-                    already_used_ips.append(attrs.get('RTA_DST') + '/' + str(route['dst_len']))
-            except (KeyError, ValueError):
-                continue
-        remove_ips = set(already_used_ips) - set(ips)
-        self.ip_route_del(ifname, remove_ips)
-
     def clear_unused_iface_addrs(self, ifname, current_addr):
-        addrs = self.ip_route.get_addr(label=ifname)
-        for addr in addrs:
-            if current_addr.split('/')[0] != str(dict(addr.get('attrs')).get('IFA_ADDRESS')):
-                subprocess.run(
-                    ['ip', 'addr', 'del', f"{dict(addr.get('attrs')).get('IFA_ADDRESS')}", 'dev', ifname],
-                    check=False, stderr=subprocess.DEVNULL
-                )
\ No newline at end of file
+        index = self.links.index(ifname)
+        if index is not None:
+            self.links.clear_addresses(index, current_addr.split('/')[0])
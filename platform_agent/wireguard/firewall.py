@@ -0,0 +1,81 @@
+import ipaddress
+import logging
+import re
+import subprocess
+import threading
+
+logger = logging.getLogger()
+
+FORWARD_RULE_REGEX = re.compile(r'^-A FORWARD -s (\S+) -j ACCEPT$', re.MULTILINE)
+
+
+def normalize_source(ip):
+    try:
+        network = ipaddress.ip_network(ip, False)
+    except ValueError:
+        return None
+    if network.version != 4:
+        return None
+    return network.with_prefixlen
+
+
+class ForwardRules:
+    """Keeps the FORWARD `-s <ip> -j ACCEPT` rules in memory.
+
+    Every apply reads the current rules with one iptables-save, so rules
+    removed outside the agent come back, diffs against them and applies the
+    changes in one `iptables-restore --noflush` transaction.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sources = None
+
+    def load(self):
+        output = subprocess.run(
+            ['iptables-save', '-t', 'filter'],
+            check=True, encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        ).stdout
+        self.sources = set(normalize_source(ip) for ip in FORWARD_RULE_REGEX.findall(output)) - {None}
+
+    def plan(self, add=(), delete=()):
+        add = set(normalize_source(ip) for ip in add) - {None}
+        delete = set(normalize_source(ip) for ip in delete) - {None} - add
+        return add - self.sources, delete & self.sources
+
+    @staticmethod
+    def restore_payload(add, delete):
+        lines = ['*filter']
+        lines += [f"-A FORWARD -s {ip} -j ACCEPT" for ip in sorted(add)]
+        lines += [f"-D FORWARD -s {ip} -j ACCEPT" for ip in sorted(delete)]
+        lines.append('COMMIT')
+        return '\n'.join(lines) + '\n'
+
+    def apply(self, add=(), delete=()):
+        with self.lock:
+            self.load()
+            to_add, to_delete = self.plan(add, delete)
+            if not to_add and not to_delete:
+                return
+            try:
+                self.restore(to_add, to_delete)
+            except subprocess.CalledProcessError:
+                # Rules were changed behind our back, re-read them and retry once
+                logger.warning("[FIREWALL] iptables-restore failed, reloading FORWARD rules")
+                self.load()
+                to_add, to_delete = self.plan(add, delete)
+                if not to_add and not to_delete:
+                    return
+                self.restore(to_add, to_delete)
+            self.sources |= to_add
+            self.sources -= to_delete
+
+    def restore(self, add, delete):
+        subprocess.run(
+            ['iptables-restore', '--noflush'],
+            input=self.restore_payload(add, delete),
+            check=True, encoding='utf-8', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+
+FORWARD_RULES = ForwardRules()
@@ -1,17 +1,15 @@
 import datetime
-import os
+import functools
 import ipaddress
 import re
-import psutil
 import socket
 from random import randint
 
-from icmplib import multiping
-from pyroute2 import NetlinkError
-
-from platform_agent.cmd.lsmod import module_loaded, is_tool
+from platform_agent.lib.capabilities import CAPABILITIES
+from platform_agent.network.probe_scheduler import get_probe_scheduler
 from platform_agent.cmd.wg_info import WireGuardRead
-from platform_agent.network.iface_watcher import read_tmp_file
+from platform_agent.wireguard.wg_netlink import WireGuardNetlink
+from platform_agent.network.iface_watcher import get_iface_info
 
 WG_NAME_PATTERN = '[0-9]{10}(s1|s2|s3|p0)+(g|m|p)[Nn][Oo]'
 
@@ -35,6 +33,7 @@ def get_connection_status(latency_ms, packet_loss):
 
 
 def find_free_port():
+    import psutil
     port = randint(49152, 65535)
     portsinuse = []
     while True:
@@ -57,90 +56,80 @@ def get_iface_public_key(ifname):
     return iface.get('public_key')
 
 
-def get_peer_info(ifname, wg, kind=None):
-    results = {}
-    if kind == 'wireguard' or os.environ.get("SYNTROPY_WIREGUARD"):
-        try:
-            ss = wg.info(ifname)
-        except NetlinkError as e:
-            return results
-        wg_info = dict(ss[0]['attrs'])
-        peers = wg_info.get('WGDEVICE_A_PEERS', [])
-        for peer in peers:
-            peer = dict(peer['attrs'])
-            try:
-                results[peer['WGPEER_A_PUBLIC_KEY'].decode('utf-8')] = [allowed_ip['addr'] for allowed_ip in
-                                                                        peer['WGPEER_A_ALLOWEDIPS']]
-            except KeyError:
-                results[peer['WGPEER_A_PUBLIC_KEY'].decode('utf-8')] = []
-    else:
-        wg = WireGuardRead()
-        ifaces = wg.wg_info(ifname)
-        if not ifaces:
-            return results
-        iface = ifaces[0]
-        for peer in iface['peers']:
-            results[peer['peer']] = peer['allowed_ips']
-    return results
-
-
-def get_peer_info_all(ifname, wg, kind=None):
-    results = []
-    # TODO NEED FIX pyroute2 wireguard info solution, because of missing peers when getting info.
-    # if kind == 'wireguard' or os.environ.get("SYNTROPY_WIREGUARD"):
-    #     try:
-    #         ss = wg.info(ifname)
-    #     except NetlinkError as e:
-    #         return results
-    #     wg_info = dict(ss[0]['attrs'])
-    #     peers = wg_info.get('WGDEVICE_A_PEERS', [])
-    #     for peer in peers:
-    #         try:
-    #             peer_dict = dict(peer['attrs'])
-    #             results.append({
-    #                 "public_key": peer_dict['WGPEER_A_PUBLIC_KEY'].decode('utf-8'),
-    #                 "allowed_ips": [allowed_ip['addr'] for allowed_ip in peer_dict['WGPEER_A_ALLOWEDIPS']],
-    #                 "last_handshake": datetime.datetime.strptime(
-    #                     peer_dict['WGPEER_A_LAST_HANDSHAKE_TIME']['latest handshake'],
-    #                     "%a %b %d %H:%M:%S %Y").isoformat(),
-    #                 "keep_alive_interval": peer_dict['WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL'],
-    #                 "rx_bytes": peer_dict['WGPEER_A_RX_BYTES'],
-    #                 "tx_bytes": peer_dict['WGPEER_A_TX_BYTES'],
-    #             })
-    #         except KeyError:
-    #             continue
-
-    wg = WireGuardRead()
-    ifaces = wg.wg_info(ifname)
-    if not ifaces:
-        return results
-    iface = ifaces[0]
+def wg_read_device(iface):
+    """Converts a `wg show` interface into the WireGuardNetlink device format."""
+    peers = []
     for peer in iface['peers']:
         try:
-            results.append({
+            peers.append({
                 "public_key": peer['peer'],
+                "endpoint": peer.get('endpoint'),
                 "last_handshake": datetime.datetime.now().isoformat() if peer['latest_handshake'] else None,
-                "keep_alive_interval": int(''.join(filter(str.isdigit, peer.get('persistent_keepalive', '15')))),
+                "keep_alive_interval": int(''.join(filter(str.isdigit, peer.get('persistent_keepalive') or '15'))),
                 "allowed_ips": peer['allowed_ips'],
             })
         except KeyError:
             continue
+    return {
+        "ifname": iface['interface'],
+        "public_key": iface.get('public_key'),
+        "listen_port": int(iface['listening_port']) if iface.get('listening_port') else None,
+        "peers": peers,
+    }
+
+
+def get_wg_devices(wg, ifnames):
+    """Reads every interface in `ifnames` in a single pass.
+
+    Kernel interfaces are read over generic netlink; anything left (e.g.
+    wireguard-go) is parsed from one `wg show` run for all interfaces.
+    """
+    devices = {}
+    if isinstance(wg, WireGuardNetlink):
+        devices = wg.devices(ifnames)
+    missing = set(ifnames) - set(devices)
+    if missing:
+        for iface in WireGuardRead().wg_info():
+            if iface['interface'] in missing:
+                devices[iface['interface']] = wg_read_device(iface)
+    return devices
+
+
+def get_peer_info(ifname, wg, kind=None):
+    results = {}
+    device = get_wg_devices(wg, [ifname]).get(ifname)
+    if not device:
+        return results
+    for peer in device['peers']:
+        results[peer['public_key']] = peer['allowed_ips']
     return results
 
 
-def get_peer_ips(ifname, wg, internal_ip, kind=None):
+def get_peer_info_all(ifname, wg, kind=None):
+    device = get_wg_devices(wg, [ifname]).get(ifname)
+    if not device:
+        return []
+    return device['peers']
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_address(text):
+    return ipaddress.ip_address(text)
+
+
+def get_peer_ips(ifname, wg, internal_ip, kind=None, peers=None):
     peers_info = []
     peers_internal_ip = []
-    peers = get_peer_info_all(ifname, wg, kind=kind)
+    if peers is None:
+        peers = get_peer_info_all(ifname, wg, kind=kind)
+    try:
+        network = ipaddress.ip_network(f"{internal_ip.split('/')[0]}/16", False)
+    except ValueError:
+        return peers_info, peers_internal_ip
     for peer in peers:
         try:
             peer_internal_ip = next(
-                (
-                    ip for ip in peer['allowed_ips']
-                    if
-                    ipaddress.ip_address(ip.split('/')[0]) in ipaddress.ip_network(f"{internal_ip.split('/')[0]}/16",
-                                                                                   False)
-                ),
+                (ip for ip in peer['allowed_ips'] if parse_address(ip.split('/')[0]) in network),
                 None
             )
         except ValueError:
@@ -154,7 +143,7 @@ def get_peer_ips(ifname, wg, internal_ip, kind=None):
 
 
 def check_if_wireguard_installled():
-    return module_loaded('wireguard') or is_tool('wireguard-go')
+    return CAPABILITIES.kernel_wireguard or CAPABILITIES.get('wireguard_go')
 
 
 def check_udp_connection():
@@ -171,37 +160,39 @@ def check_udp_connection():
             return False
 
 
-def ping_internal_ips(ips, count=4, interval=0.5, icmp_id=10000):
+def ping_internal_ips(ips, consumer, max_age, samples=1):
+    """Latency and loss from the shared probe scheduler, no older than `max_age` seconds."""
     result = {}
-    ping_res = multiping(ips, count=count, interval=interval, id=icmp_id)
-    for res in ping_res:
-        latency_ms = res.avg_rtt if res.is_alive else 5000
-        packet_loss = res.packet_loss if res.is_alive else 1
-        result[res.address] = get_connection_status(latency_ms, packet_loss)
+    measurements = get_probe_scheduler().measure(consumer, ips, max_age, samples)
+    for ip, stats in measurements.items():
+        alive = stats and stats['latency_ms'] is not None
+        latency_ms = stats['latency_ms'] if alive else 5000
+        packet_loss = stats['packet_loss'] if alive else 1
+        result[ip] = get_connection_status(latency_ms, packet_loss)
     return result
 
 
-def merged_peer_info(wg):
+def merged_peer_info(wg, max_age=15):
     result = []
     peers_ips = []
-    interfaces = read_tmp_file(file_type='iface_info')
-    res = {k: v for k, v in interfaces.items() if re.match(WG_NAME_PATTERN, k)}
-    for ifname in res.keys():
-        if not res[ifname].get('internal_ip'):
-            continue
-        peer_info, peers_internal_ips = get_peer_ips(ifname, wg, res[ifname]['internal_ip'], kind=res[ifname]['kind'])
+    interfaces = get_iface_info()
+    res = {k: v for k, v in interfaces.items() if re.match(WG_NAME_PATTERN, k) and v.get('internal_ip')}
+    devices = get_wg_devices(wg, list(res.keys()))
+    for ifname, device in devices.items():
+        peer_info, peers_internal_ips = get_peer_ips(
+            ifname, wg, res[ifname]['internal_ip'], kind=res[ifname]['kind'], peers=device['peers']
+        )
         peers_ips += peers_internal_ips
-        iface_public_key = get_iface_public_key(ifname)
-        if not iface_public_key:
+        if not device.get('public_key'):
             continue
         result.append(
             {
                 "iface": ifname,
-                "iface_public_key": iface_public_key,
+                "iface_public_key": device['public_key'],
                 "peers": peer_info
             }
         )
-    pings = ping_internal_ips(peers_ips, count=1, interval=0.3)
+    pings = ping_internal_ips(peers_ips, 'peer_watcher', max_age)
     for iface in result:
         for peer in iface['peers']:
             peer.update(pings[peer['internal_ip']])
@@ -1,42 +1,94 @@
 import json
 import logging
+import os
 import threading
 import time
 
-from pyroute2 import WireGuard
-
-from platform_agent.cmd.lsmod import module_loaded
+from platform_agent.lib.capabilities import CAPABILITIES
 from platform_agent.lib.ctime import now
+from platform_agent.lib.tsdb import TSDB
+from platform_agent.files.tmp_files import get_peer_metadata
 from platform_agent.wireguard.helpers import merged_peer_info
 from platform_agent.cmd.wg_info import WireGuardRead
+from platform_agent.wireguard.wg_netlink import WireGuardNetlink
 
 
 logger = logging.getLogger()
 
 
+class PeerSnapshot:
+    """Latest probed peer state, shared by telemetry and the Prometheus exporter.
+
+    Readers never probe: they get whatever the peer watcher published last
+    and how old it is.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.peer_info = None
+        self.metadata = {}
+        self.updated_at = None
+
+    def update(self, peer_info, metadata=None):
+        with self.lock:
+            self.peer_info = peer_info
+            self.metadata = metadata or {}
+            self.updated_at = time.monotonic()
+
+    def get(self):
+        """Returns (peer_info, metadata, age in seconds), age is None before the first update."""
+        with self.lock:
+            if self.updated_at is None:
+                return [], {}, None
+            return self.peer_info, self.metadata, time.monotonic() - self.updated_at
+
+
+PEER_SNAPSHOT = PeerSnapshot()
+
+
 class WireguardPeerWatcher(threading.Thread):
+    """Probes peers into PEER_SNAPSHOT and sends them as telemetry every `interval` seconds.
 
-    def __init__(self, client, interval=60):
+    The snapshot is refreshed at least every SYNTROPY_PEER_SNAPSHOT_INTERVAL
+    seconds so the exporter stays fresh when telemetry is sent rarely.
+    """
+
+    def __init__(self, client, interval=60, snapshot=PEER_SNAPSHOT):
         super().__init__()
         self.client = client
-        self.interval = interval
-        self.wg = WireGuard() if module_loaded("wireguard") else WireGuardRead()
+        self.interval = int(interval)
+        self.snapshot = snapshot
+        self.snapshot_interval = min(self.interval, int(os.environ.get('SYNTROPY_PEER_SNAPSHOT_INTERVAL', 15)))
+        self.wg = WireGuardNetlink() if CAPABILITIES.kernel_wireguard else WireGuardRead()
         self.stop_peer_watcher = threading.Event()
         self.daemon = True
 
+    def refresh(self):
+        peer_info = merged_peer_info(self.wg, self.snapshot_interval)
+        self.snapshot.update(peer_info, get_peer_metadata())
+        for iface in peer_info:
+            for peer in iface['peers']:
+                TSDB.record_many(
+                    f"peer.{peer['public_key']}", {'latency_ms': peer.get('latency_ms'), 'packet_loss': peer.get('packet_loss')}
+                )
+        return peer_info
+
     def run(self):
+        sent_at = None
         while not self.stop_peer_watcher.is_set():
-            peer_info = merged_peer_info(self.wg)
+            peer_info = self.refresh()
             if not peer_info:
-                time.sleep(1)
+                self.stop_peer_watcher.wait(1)
                 continue
-            self.client.send_log(json.dumps({
-                'id': "UNKNOWN",
-                'executed_at': now(),
-                'type': 'IFACES_PEERS_BW_DATA',
-                'data': peer_info
-            }))
-            time.sleep(int(self.interval))
+            if sent_at is None or time.monotonic() - sent_at >= self.interval:
+                sent_at = time.monotonic()
+                self.client.send_log(json.dumps({
+                    'id': "UNKNOWN",
+                    'executed_at': now(),
+                    'type': 'IFACES_PEERS_BW_DATA',
+                    'data': peer_info
+                }))
+            self.stop_peer_watcher.wait(self.snapshot_interval)
 
     def join(self, timeout=None):
         self.stop_peer_watcher.set()
@@ -0,0 +1,191 @@
+import collections
+import ipaddress
+import logging
+import re
+import subprocess
+import time
+from pathlib import Path
+
+from platform_agent.config.settings import AGENT_PATH
+from platform_agent.routes.route_cache import ROUTE_CACHE
+from platform_agent.wireguard.firewall import FORWARD_RULES, normalize_source
+from platform_agent.wireguard.helpers import get_wg_devices, WG_NAME_PATTERN
+
+logger = logging.getLogger()
+
+IFF_UP = 0x1
+
+# Estimated kernel writes per change, used for dry runs
+CREATE_INTERFACE_WRITES = 4
+
+Change = collections.namedtuple('Change', ['action', 'ifname', 'args', 'writes'])
+
+
+def normalize_ips(ips):
+    result = set()
+    if not ips:
+        return result
+    for ip in ips:
+        try:
+            result.add(ipaddress.ip_network(ip, False).with_prefixlen)
+        except ValueError:
+            continue
+    return result
+
+
+class ActualState:
+    """Kernel state relevant to CONFIG_INFO, read once per reconcile."""
+
+    def __init__(self, links, devices, routes, forward):
+        self.links = links
+        self.devices = devices
+        self.routes = routes
+        self.forward = forward
+
+
+class Reconciler:
+    """Applies a CONFIG_INFO payload as the difference to the current state.
+
+    The kernel is read once (links, addresses, WireGuard devices, routes and
+    FORWARD rules), compared with the payload and only the changes are
+    applied through WgConf. Re-applying an unchanged config makes no writes.
+    """
+
+    def __init__(self, wgconf):
+        self.wgconf = wgconf
+
+    @staticmethod
+    def desired_state(vpn):
+        interfaces = {}
+        peers = {}
+        for cmd in vpn:
+            args = cmd.get('args') or {}
+            if cmd.get('fn') == 'create_interface':
+                interfaces[args['ifname']] = args
+            elif cmd.get('fn') == 'add_peer':
+                peers.setdefault(args['ifname'], {})[args['public_key']] = args
+        return interfaces, peers
+
+    def read_state(self):
+        ip_route = self.wgconf.routes.ip_route
+        links = {}
+        for msg in ip_route.get_links():
+            ifname = msg.get_attr('IFLA_IFNAME')
+            if ifname and re.match(WG_NAME_PATTERN, ifname):
+                links[ifname] = {'index': msg['index'], 'up': bool(msg['flags'] & IFF_UP), 'addrs': set()}
+        by_index = {link['index']: link for link in links.values()}
+        for msg in ip_route.get_addr():
+            link = by_index.get(msg['index'])
+            if link:
+                link['addrs'].add(f"{msg.get_attr('IFA_ADDRESS')}/{msg['prefixlen']}")
+        devices = get_wg_devices(self.wgconf.wg, list(links)) if links else {}
+        ROUTE_CACHE.refresh()
+        routes = {ifname: set(ROUTE_CACHE.oif_routes(link['index'])) for ifname, link in links.items()}
+        try:
+            # Read every time, rules removed outside the agent must show up as missing
+            with FORWARD_RULES.lock:
+                FORWARD_RULES.load()
+                forward = set(FORWARD_RULES.sources)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            logger.debug(f"[RECONCILER] FORWARD rules unavailable {e}")
+            forward = None
+        return ActualState(links, devices, routes, forward)
+
+    @staticmethod
+    def public_key(ifname):
+        try:
+            return Path(f"{AGENT_PATH}/publickey-{ifname}").read_text().strip()
+        except OSError:
+            return None
+
+    def interface_changed(self, args, link, device):
+        if not link or not device or not link['up']:
+            return True
+        internal_ip = args.get('internal_ip')
+        if internal_ip and link['addrs'] != {internal_ip}:
+            return True
+        if device.get('public_key') != self.public_key(args['ifname']):
+            return True
+        if not device.get('listen_port'):
+            return True
+        return bool(args.get('listen_port')) and device['listen_port'] != args['listen_port']
+
+    @staticmethod
+    def peer_changed(args, peer):
+        if not peer:
+            return True
+        actual_ips, desired_ips = set(peer.get('allowed_ips') or ()), set(args.get('allowed_ips') or ())
+        # Parsing is only needed when the strings differ, e.g. non-strict prefixes
+        if actual_ips != desired_ips and normalize_ips(actual_ips) != normalize_ips(desired_ips):
+            return True
+        if peer.get('keep_alive_interval') not in (None, 15):
+            return True
+        endpoint = args.get('endpoint_ipv4')
+        return bool(endpoint) and peer.get('endpoint') != f"{endpoint}:{args.get('endpoint_port')}"
+
+    def diff(self, vpn, state):
+        interfaces, peers = self.desired_state(vpn)
+        changes = []
+        for ifname in sorted(set(state.links) - set(interfaces)):
+            changes.append(Change('remove_interface', ifname, {'ifname': ifname}, 1))
+        creates, adds, route_changes, forward_add = [], [], [], set()
+        for ifname in sorted(set(interfaces) | set(peers)):
+            link = state.links.get(ifname)
+            device = state.devices.get(ifname) or {}
+            if ifname in interfaces and self.interface_changed(interfaces[ifname], link, device or None):
+                writes = CREATE_INTERFACE_WRITES + len(link['addrs'] if link else ())
+                creates.append(Change('create_interface', ifname, interfaces[ifname], writes))
+            actual_peers = {peer['public_key']: peer for peer in device.get('peers', [])}
+            desired_peers = peers.get(ifname, {})
+            for public_key in sorted(set(actual_peers) - set(desired_peers)):
+                changes.append(Change('remove_peer', ifname, {'ifname': ifname, 'public_key': public_key}, 1))
+            routes = state.routes.get(ifname, set())
+            wanted_routes = set()
+            for public_key, args in sorted(desired_peers.items()):
+                allowed_ips = set(args.get('allowed_ips') or ())
+                if not allowed_ips <= routes:
+                    allowed_ips = normalize_ips(allowed_ips)
+                wanted_routes |= allowed_ips
+                if self.peer_changed(args, actual_peers.get(public_key)):
+                    adds.append(Change('add_peer', ifname, args, 2 + len(allowed_ips)))
+                    continue
+                missing = sorted(allowed_ips - routes)
+                if missing:
+                    route_changes.append(
+                        Change('add_routes', ifname, {'ip_list': missing, 'gw_ipv4': args.get('gw_ipv4')}, len(missing))
+                    )
+                if state.forward is not None and not allowed_ips <= state.forward:
+                    forward_add |= set(normalize_source(ip) for ip in allowed_ips) - {None} - state.forward
+            # Keep the connected route of the interface address
+            connected = normalize_ips(link['addrs']) if link else set()
+            stale = sorted(routes - wanted_routes - connected)
+            if ifname in interfaces and link and stale:
+                changes.append(Change('delete_routes', ifname, {'ip_list': stale}, len(stale)))
+        changes += creates + adds + route_changes
+        if forward_add:
+            changes.append(Change('add_forward_rules', None, {'ips': sorted(forward_add)}, 1))
+        return changes
+
+    def plan(self, vpn):
+        started = time.monotonic()
+        state = self.read_state()
+        changes = self.diff(vpn, state)
+        return state, changes, time.monotonic() - started
+
+    def apply_change(self, change):
+        if change.action == 'delete_routes':
+            self.wgconf.routes.ip_route_del(change.ifname, change.args['ip_list'])
+        elif change.action == 'add_routes':
+            self.wgconf.routes.ip_route_add(change.ifname, change.args['ip_list'], change.args['gw_ipv4'])
+        elif change.action == 'add_forward_rules':
+            FORWARD_RULES.apply(add=change.args['ips'])
+        else:
+            return getattr(self.wgconf, change.action)(**change.args)
+
+    @staticmethod
+    def describe(changes, elapsed):
+        return {
+            'changes': [change._asdict() for change in changes],
+            'writes': sum(change.writes for change in changes),
+            'read_ms': round(elapsed * 1000, 3),
+        }
@@ -7,15 +7,18 @@ import re
 from pathlib import Path
 
 import pyroute2
-from pyroute2 import IPDB, WireGuard, NetlinkError
+from pyroute2 import IPDB, NetlinkError
 from nacl.public import PrivateKey
 
-from platform_agent.cmd.lsmod import module_loaded
+from platform_agent.lib.capabilities import CAPABILITIES
 from platform_agent.cmd.wg_show import get_wg_listen_port
 from platform_agent.files.tmp_files import get_peer_metadata
 from platform_agent.lib.ctime import now
+from platform_agent.lib.generation import CONFIG_GENERATION
 from platform_agent.routes import Routes
+from platform_agent.wireguard.firewall import FORWARD_RULES
 from platform_agent.wireguard.helpers import find_free_port, get_peer_info, WG_NAME_PATTERN
+from platform_agent.wireguard.wg_netlink import WireGuardNetlink
 
 logger = logging.getLogger()
 
@@ -24,60 +27,23 @@ class WgConfException(Exception):
     pass
 
 
-def delete_interface(ifname):
-    subprocess.run(['ip', 'link', 'del', ifname], check=False, stderr=subprocess.DEVNULL)
-
-
-
-def create_interface(ifname):
-    try:
-        subprocess.run(['ip', 'link', 'add', 'dev', ifname, 'type', 'wireguard'], check=True, stderr=subprocess.DEVNULL)
-    except subprocess.CalledProcessError:
-        pass
-
-
-def set_interface_up(ifname):
-    try:
-        subprocess.run(['ip', 'link', 'set', 'up', ifname], check=True, stderr=subprocess.DEVNULL)
-    except subprocess.CalledProcessError:
-        pass
-
-
-def set_interface_ip(ifname, ip):
-    try:
-        subprocess.run(['ip', 'address', 'add', 'dev', ifname, ip], check=True, stderr=subprocess.DEVNULL)
-    except subprocess.CalledProcessError:
-        pass
-
-
 def add_iptable_rules(ips: list):
-    for ip in ips:
-        try:
-            # Check if already exists, if not - create
-            subprocess.run(['iptables', '-C', 'FORWARD', '-p', 'all', '-s', ip, '-j', 'ACCEPT'], check=True,
-                           stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError:
-            subprocess.run(
-                ['iptables', '-A', 'FORWARD', '-p', 'all', '-s', ip, '-j', 'ACCEPT'],
-                check=True, stderr=subprocess.DEVNULL
-            )
+    FORWARD_RULES.apply(add=ips)
 
 
 def delete_iptable_rule(ips: list):
-    for ip in ips:
-        subprocess.run(
-            ['iptables', '-D', 'FORWARD', '-p', 'all', '-s', ip, '-j', 'ACCEPT'],
-            check=False,
-            stderr=subprocess.DEVNULL
-        )
+    try:
+        FORWARD_RULES.apply(delete=ips)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logger.warning(f"[WG_CONF] failed to delete iptables rules {ips}: {e}")
 
 
 class WgConf():
 
     def __init__(self, client=None):
 
-        self.wg_kernel = module_loaded('wireguard')
-        self.wg = WireGuard() if self.wg_kernel else WireguardGo()
+        self.wg_kernel = CAPABILITIES.kernel_wireguard
+        self.wg = WireGuardNetlink() if self.wg_kernel else WireguardGo()
         self.ipdb = IPDB()
         self.routes = Routes()
         self.client = client
@@ -100,34 +66,6 @@ class WgConf():
             current_interfaces = [k for k, v in ipdb.by_name.items() if re.match(WG_NAME_PATTERN, k)]
         return current_interfaces
 
-    def clear_interfaces(self, dump):
-        remote_interfaces = [d['args']['ifname'] for d in dump if d['fn'] == 'create_interface']
-        current_interfaces = self.get_wg_interfaces()
-        remove_interfaces = set(current_interfaces) - set(remote_interfaces)
-        logger.debug(
-            f"Clearing interfaces REMOTE - {remote_interfaces}, CURRENT - {current_interfaces} REMOVE={remove_interfaces}"
-        )
-        for interface in remove_interfaces:
-            self.remove_interface(interface)
-
-    def clear_unused_routes(self, dump):
-        remote_peers = [d['args'] for d in dump if d['fn'] == 'add_peer']
-        remote_interfaces = [d['args']['ifname'] for d in dump if d['fn'] == 'create_interface']
-        for ifname in remote_interfaces:
-            allowed_ips = []
-            remote_peers = [allowed_ips.extend(peer['allowed_ips']) for peer in remote_peers if peer and peer['ifname'] == ifname]
-            self.routes.clear_unused_routes(ifname, allowed_ips)
-
-
-    def clear_peers(self, dump):
-        remote_peers = [d['args']['public_key'] for d in dump if d['fn'] == 'add_peer']
-        current_interfaces = self.get_wg_interfaces()
-        for iface in current_interfaces:
-            peers = get_peer_info(iface, self.wg)
-            for peer in peers:
-                if peer not in remote_peers:
-                    self.remove_peer(iface, peer)
-
     def get_wg_keys(self, ifname):
         private_key_path = f"/etc/syntropy-agent/privatekey-{ifname}"
         public_key_path = f"/etc/syntropy-agent/publickey-{ifname}"
@@ -168,13 +106,14 @@ class WgConf():
             extra={'metadata': peer_metadata}
         )
 
-        if self.wg_kernel:
-            create_interface(ifname)
-        else:
-            self.wg.create_interface(ifname)
-        set_interface_up(ifname)
-        set_interface_ip(ifname, internal_ip)
-        self.routes.clear_unused_iface_addrs(ifname, internal_ip.split('/')[0])
+        try:
+            if self.wg_kernel:
+                self.routes.links.ensure(ifname, kind='wireguard', address=internal_ip)
+            else:
+                self.wg.create_interface(ifname)
+                self.routes.links.ensure(ifname, address=internal_ip)
+        except NetlinkError as error:
+            raise WgConfException(f"Failed to set up interface {ifname}: {error}")
 
         try:
             self.wg.set(
@@ -200,6 +139,7 @@ class WgConf():
                 listen_port=listen_port
             )
 
+        CONFIG_GENERATION.bump()
         result = {
             "public_key": public_key,
             "listen_port": int(listen_port),
@@ -226,6 +166,7 @@ class WgConf():
                 'persistent_keepalive': 15,
                 'allowed_ips': allowed_ips}
         self.wg.set(ifname, peer=peer)
+        CONFIG_GENERATION.bump()
         statuses = self.routes.ip_route_add(ifname, allowed_ips, gw_ipv4)
         add_iptable_rules(allowed_ips)
         self.client.send_log(json.dumps({
@@ -257,18 +198,19 @@ class WgConf():
         except pyroute2.netlink.exceptions.NetlinkError as error:
             if error.code != 19:
                 raise
+        CONFIG_GENERATION.bump()
         return
 
     def remove_interface(self, ifname):
         logger.debug(f'[WG_CONF] Removing interfcae - [{ifname}]')
-        delete_interface(ifname)
+        self.routes.links.delete(ifname)
+        CONFIG_GENERATION.bump()
         logger.debug(f'[WG_CONF] Removed interfcae - [{ifname}]')
         return
 
     def get_listening_port(self, ifname):
         if self.wg_kernel:
-            wg_info = dict(self.wg.info(ifname)[0]['attrs'])
-            return wg_info['WGDEVICE_A_LISTEN_PORT']
+            return self.wg.device(ifname)['listen_port']
 
         else:
             wg_info = self.wg.info(ifname)
@@ -0,0 +1,96 @@
+import datetime
+import errno
+import ipaddress
+
+from pyroute2 import WireGuard, NetlinkError
+from pyroute2.netlink import NLM_F_REQUEST, NLM_F_DUMP
+from pyroute2.netlink.generic.wireguard import wgmsg, WG_CMD_GET_DEVICE, WG_GENL_VERSION
+
+
+def decode_key(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def decode_allowed_ip(allowed_ip):
+    """pyroute2 only decodes IPv4 allowed ips, so read the raw address instead."""
+    raw = bytes.fromhex(allowed_ip.get_attr('WGALLOWEDIP_A_IPADDR').replace(':', ''))
+    return f"{ipaddress.ip_address(raw)}/{allowed_ip.get_attr('WGALLOWEDIP_A_CIDR_MASK')}"
+
+
+def decode_handshake(value):
+    if not value or not value.get('tv_sec'):
+        return None
+    return datetime.datetime.fromtimestamp(value['tv_sec']).isoformat()
+
+
+def merge_device_messages(messages):
+    """Folds a multipart WG_CMD_GET_DEVICE dump into a single device.
+
+    The kernel splits large devices over several messages. Every message
+    repeats the device name and continues the peer list; a peer whose allowed
+    ips did not fit is repeated at the start of the next message with only
+    its public key and the remaining allowed ips.
+    """
+    device = None
+    peers = {}
+    for msg in messages:
+        if device is None:
+            device = {
+                'ifname': msg.get_attr('WGDEVICE_A_IFNAME'),
+                'public_key': decode_key(msg.get_attr('WGDEVICE_A_PUBLIC_KEY')),
+                'listen_port': msg.get_attr('WGDEVICE_A_LISTEN_PORT'),
+                'fwmark': msg.get_attr('WGDEVICE_A_FWMARK'),
+            }
+        for peer_msg in msg.get_attr('WGDEVICE_A_PEERS') or []:
+            public_key = decode_key(peer_msg.get_attr('WGPEER_A_PUBLIC_KEY'))
+            peer = peers.get(public_key)
+            if peer is None:
+                peer = peers[public_key] = {'public_key': public_key, 'allowed_ips': []}
+            endpoint = peer_msg.get_attr('WGPEER_A_ENDPOINT')
+            if endpoint:
+                peer['endpoint'] = f"{endpoint['addr']}:{endpoint['port']}"
+            handshake = peer_msg.get_attr('WGPEER_A_LAST_HANDSHAKE_TIME')
+            if handshake is not None:
+                peer['last_handshake'] = decode_handshake(handshake)
+            for attr, key in (
+                    ('WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL', 'keep_alive_interval'),
+                    ('WGPEER_A_RX_BYTES', 'rx_bytes'),
+                    ('WGPEER_A_TX_BYTES', 'tx_bytes'),
+            ):
+                value = peer_msg.get_attr(attr)
+                if value is not None:
+                    peer[key] = value
+            peer['allowed_ips'].extend(
+                decode_allowed_ip(allowed_ip) for allowed_ip in peer_msg.get_attr('WGPEER_A_ALLOWEDIPS') or []
+            )
+    if device is None:
+        return None
+    device['peers'] = list(peers.values())
+    return device
+
+
+class WireGuardNetlink(WireGuard):
+    """pyroute2 WireGuard socket that reads complete multipart device dumps."""
+
+    def device(self, ifname):
+        msg = wgmsg()
+        msg['cmd'] = WG_CMD_GET_DEVICE
+        msg['version'] = WG_GENL_VERSION
+        msg['attrs'].append(['WGDEVICE_A_IFNAME', ifname])
+        return merge_device_messages(
+            self.nlm_request(msg, msg_type=self.prid, msg_flags=NLM_F_REQUEST | NLM_F_DUMP)
+        )
+
+    def devices(self, ifnames):
+        """Reads every interface over this socket, skipping the ones that are gone."""
+        result = {}
+        for ifname in ifnames:
+            try:
+                device = self.device(ifname)
+            except NetlinkError as e:
+                if e.code not in (errno.ENODEV, errno.EOPNOTSUPP, errno.ENOENT):
+                    raise
+                continue
+            if device:
+                result[ifname] = device
+        return result
@@ -25,7 +25,6 @@ setup(
         'websocket-client==0.57.0',
         'PyNaCl==1.3.0',
         'docker-py==1.10.6',
-        'icmplibv2==1.0.6',
         'PyYAML==5.3.1',
         'dnspython==1.16.0',
         'iperf3==0.1.11',
@@ -33,6 +32,10 @@ setup(
         'psutil==5.7.2',
         'kubernetes==11.0.0',
     ],
+    extras_require={
+        # Vectorised route selection, rerouting falls back to plain Python without it
+        'fast': ['numpy'],
+    },
     packages=find_packages(),
     license="MIT",
     classifiers=[
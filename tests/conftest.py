@@ -21,11 +21,6 @@ def request_id():
     return 'TEST_01'
 
 
-@fixture
-def wg_int_name():
-    return 'p2p_agent'
-
-
 @fixture
 def config_info_int_check():
     return {'agent_id': 71, 'vpn': [
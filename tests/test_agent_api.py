@@ -1,4 +1,5 @@
 from platform_agent.agent_api import AgentApi
+from platform_agent.wireguard.reconciler import ActualState
 
 import mock
 
@@ -34,17 +35,28 @@ def test_call_error(patch_gather_initial_info, gather_initial_info_payload, GET_
 
 
 @mock.patch('platform_agent.agent_api.json.dumps')
-@mock.patch('platform_agent.agent_api.update_tmp_file')
-@mock.patch('platform_agent.agent_api.WgConf.clear_peers')
-@mock.patch('platform_agent.agent_api.WgConf.clear_interfaces')
+@mock.patch('platform_agent.agent_api.replace_tmp_config_dump')
+@mock.patch('platform_agent.agent_api.Reconciler.read_state')
 @mock.patch('platform_agent.agent_api.WgConf.create_interface')
-def test_config_info(patch_create_interface, patch_clear_interfaces, patch_clear_peers, patch_update_tmp_file, patch_json_dumps, config_info_int_check, CONFIG_INFO, request_id):
+def test_config_info(patch_create_interface, patch_read_state, patch_replace_tmp_config_dump, patch_json_dumps, config_info_int_check, CONFIG_INFO, request_id):
+    patch_read_state.return_value = ActualState({}, {}, {}, None)
     agent_api = AgentApi(mock.MagicMock(), prod_mode=False)
     agent_api.call(CONFIG_INFO, config_info_int_check, request_id)
-    assert patch_clear_interfaces.called
-    assert patch_clear_peers.called
+    assert patch_read_state.call_count == SINGLE_CALL
     assert patch_create_interface.call_count == len(config_info_int_check['vpn'])
-    assert patch_clear_interfaces.call_args[0][0] == config_info_int_check['vpn']
+    assert patch_replace_tmp_config_dump.call_args[0][0] == config_info_int_check
+
+
+@mock.patch('platform_agent.agent_api.replace_tmp_config_dump')
+@mock.patch('platform_agent.agent_api.Reconciler.read_state')
+@mock.patch('platform_agent.agent_api.WgConf.create_interface')
+def test_config_info_dry_run(patch_create_interface, patch_read_state, patch_replace_tmp_config_dump, config_info_int_check, CONFIG_INFO, request_id):
+    patch_read_state.return_value = ActualState({}, {}, {}, None)
+    agent_api = AgentApi(mock.MagicMock(), prod_mode=False)
+    result = agent_api.call(CONFIG_INFO, {**config_info_int_check, 'dry_run': True}, request_id)
+    assert [change['action'] for change in result['changes']] == ['create_interface'] * 4
+    assert not patch_create_interface.called
+    assert not patch_replace_tmp_config_dump.called
 
 
 @mock.patch('platform_agent.agent_api.WireguardPeerWatcher')
@@ -55,3 +67,13 @@ def test_WG_INFO(patch_WireguardPeerWatcher, wg_info_payload, WG_INFO, request_i
     assert not result
     assert patch_WireguardPeerWatcher.called
     assert patch_WireguardPeerWatcher.call_count == SINGLE_CALL
+
+
+@mock.patch('platform_agent.agent_api.load')
+def test_IPERF_TEST(patch_load, request_id):
+    agent_api = AgentApi(mock.MagicMock(), prod_mode=False)
+    patch_load.return_value.test_speed.return_value = [{'host': '10.69.0.2', 'speed': 100}]
+    result = agent_api.call('IPERF_TEST', {'hosts': ['10.69.0.2']}, request_id)
+    assert result == [{'host': '10.69.0.2', 'speed': 100}]
+    patch_load.assert_called_once_with('platform_agent.network.iperf', 'IperfServer')
+    patch_load.return_value.test_speed.assert_called_once_with(hosts=['10.69.0.2'])
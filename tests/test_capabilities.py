@@ -0,0 +1,25 @@
+import mock
+
+from platform_agent.lib import capabilities
+from platform_agent.lib.capabilities import Capabilities
+
+
+def test_detected_once_until_refresh():
+    caps = Capabilities()
+    with mock.patch.object(capabilities, 'genl_family_exists', return_value=False) as genl, \
+            mock.patch.object(capabilities, 'nexthop_objects_supported', return_value=True), \
+            mock.patch('os.path.isdir', return_value=True), \
+            mock.patch('shutil.which', side_effect=lambda name: '/usr/sbin/nft' if name == 'nft' else None):
+        assert caps.kernel_wireguard
+        assert caps.get('nexthop_objects')
+        assert caps.has_tool('nft') and not caps.has_tool('iptables')
+        assert not caps.get('wireguard_go')
+        assert genl.call_count == 1
+        caps.refresh()
+        assert genl.call_count == 2
+
+
+def test_genl_probe_on_this_host():
+    # The controller family is always registered
+    assert capabilities.genl_family_exists('nlctrl')
+    assert not capabilities.genl_family_exists('no-such-family')
@@ -0,0 +1,28 @@
+from platform_agent.network.exporter import PeerCollector
+from platform_agent.wireguard.peer_watcher import PeerSnapshot
+
+
+def peer(public_key, internal_ip):
+    return {
+        'public_key': public_key, 'internal_ip': internal_ip,
+        'latency_ms': 12.5, 'packet_loss': 0.0, 'rx_bytes': 100, 'tx_bytes': 200,
+    }
+
+
+def test_collect_from_snapshot_with_peer_limit():
+    snapshot = PeerSnapshot()
+    collector = PeerCollector(snapshot, max_peers=1)
+    assert [metric.name for metric in collector.collect()][-1] == 'agent_exporter_peers_omitted'
+
+    snapshot.update(
+        [{'iface': '0000000001p0gNo', 'peers': [peer('B=', '10.69.0.2'), peer('A=', '10.69.0.3')]}],
+        {'A=': {'device_id': '7'}},
+    )
+    metrics = {metric.name: metric for metric in collector.collect()}
+    assert metrics['iface_information_latency_ms'].type == 'gauge'
+    assert metrics['iface_information_rx_bytes'].type == 'counter'
+    rx_bytes, = metrics['iface_information_rx_bytes'].samples
+    assert rx_bytes.name == 'iface_information_rx_bytes_total'
+    assert rx_bytes.labels['peer'] == 'A=' and rx_bytes.labels['device_id'] == '7'
+    assert metrics['agent_exporter_peers_omitted'].samples[0].value == 1
+    assert metrics['agent_peer_snapshot_age_seconds'].samples[0].value >= 0
@@ -0,0 +1,56 @@
+import queue
+import time
+
+from platform_agent.network.failure_detector import EchoResponder, FailureDetector, UNKNOWN, UP
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_peer_down_and_up_is_detected_within_a_few_intervals():
+    responder = EchoResponder(port=0, address='127.0.0.1', interfaces='lo')
+    responder.start()
+    changes = queue.Queue()
+    detector = FailureDetector(
+        on_change=lambda *change: changes.put(change), port=responder.port, interval=0.02, misses=3
+    )
+    detector.watch(['127.0.0.1'])
+    detector.start()
+    try:
+        assert wait_for(lambda: detector.states() == {'127.0.0.1': UP})
+        # Coming up for the first time is not a change
+        assert changes.empty()
+
+        responder.join()
+        stopped = time.monotonic()
+        assert changes.get(timeout=2) == ('127.0.0.1', False)
+        assert time.monotonic() - stopped < 0.5
+        assert detector.down() == {'127.0.0.1'}
+
+        responder = EchoResponder(port=responder.port, address='127.0.0.1', interfaces='lo')
+        responder.start()
+        assert changes.get(timeout=2) == ('127.0.0.1', True)
+    finally:
+        detector.join()
+        responder.join()
+
+
+def test_responder_ignores_echoes_from_outside_the_mesh():
+    # Loopback is not a mesh interface
+    responder = EchoResponder(port=0, address='127.0.0.1')
+    responder.start()
+    detector = FailureDetector(port=responder.port, interval=0.02, misses=3)
+    detector.watch(['127.0.0.1'])
+    detector.start()
+    try:
+        time.sleep(0.2)
+        assert detector.states() == {'127.0.0.1': UNKNOWN}
+    finally:
+        detector.join()
+        responder.join()
@@ -0,0 +1,47 @@
+from platform_agent.wireguard.firewall import ForwardRules
+
+import mock
+
+IPTABLES_SAVE = ('*filter\n'
+                 ':FORWARD ACCEPT [0:0]\n'
+                 '-A FORWARD -s 10.69.0.11/32 -j ACCEPT\n'
+                 '-A FORWARD -s 192.168.151.0/24 -j ACCEPT\n'
+                 '-A FORWARD -i docker0 -j ACCEPT\n'
+                 'COMMIT\n')
+
+
+@mock.patch('platform_agent.wireguard.firewall.subprocess.run')
+def test_apply_diff(patch_run):
+    patch_run.return_value.stdout = IPTABLES_SAVE
+    rules = ForwardRules()
+    rules.apply(add=['10.69.0.11/32', '10.69.0.12', '192.168.152.1/24'], delete=['192.168.151.0/24', '172.17.0.0/16'])
+    assert patch_run.call_count == 2
+    assert patch_run.call_args_list[1][0][0] == ['iptables-restore', '--noflush']
+    assert patch_run.call_args_list[1][1]['input'] == ('*filter\n'
+                                                       '-A FORWARD -s 10.69.0.12/32 -j ACCEPT\n'
+                                                       '-A FORWARD -s 192.168.152.0/24 -j ACCEPT\n'
+                                                       '-D FORWARD -s 192.168.151.0/24 -j ACCEPT\n'
+                                                       'COMMIT\n')
+
+
+@mock.patch('platform_agent.wireguard.firewall.subprocess.run')
+def test_apply_unchanged(patch_run):
+    patch_run.return_value.stdout = IPTABLES_SAVE
+    rules = ForwardRules()
+    rules.apply(add=['10.69.0.11/32', '192.168.151.0/24'])
+    rules.apply(add=['10.69.0.11/32'], delete=['172.17.0.0/16'])
+    # One iptables-save per apply and nothing to restore
+    assert [call[0][0][0] for call in patch_run.call_args_list] == ['iptables-save', 'iptables-save']
+
+
+@mock.patch('platform_agent.wireguard.firewall.subprocess.run')
+def test_apply_restores_rules_removed_outside(patch_run):
+    patch_run.return_value.stdout = IPTABLES_SAVE
+    rules = ForwardRules()
+    rules.apply(add=['10.69.0.11/32'])
+    # FORWARD flushed by someone else, e.g. a firewalld reload
+    patch_run.return_value.stdout = '*filter\n:FORWARD ACCEPT [0:0]\nCOMMIT\n'
+    rules.apply(add=['10.69.0.11/32'])
+    assert patch_run.call_args_list[-1][0][0] == ['iptables-restore', '--noflush']
+    assert patch_run.call_args_list[-1][1]['input'] == '*filter\n-A FORWARD -s 10.69.0.11/32 -j ACCEPT\nCOMMIT\n'
+    assert rules.sources == {'10.69.0.11/32'}
@@ -0,0 +1,28 @@
+import struct
+
+import pytest
+
+from platform_agent.network.icmp import IcmpEngine, checksum, echo_request
+
+
+def test_echo_request_checksum():
+    packet = echo_request(0x1234, 7)
+    assert struct.unpack_from('!BBHHH', packet)[3:] == (0x1234, 7)
+    # A packet including its checksum sums to zero
+    assert checksum(bytes(packet)) == 0
+
+
+def test_ping_loopback():
+    try:
+        engine = IcmpEngine()
+    except PermissionError:
+        pytest.skip("ICMP sockets are not permitted")
+    replies = []
+    target, = engine.ping(['127.0.0.1'], count=3, interval=0.01, timeout=1)
+    assert (target.sent, target.received, target.packet_loss) == (3, 3, 0)
+    assert 0 < target.min_rtt <= target.avg_rtt <= target.max_rtt
+
+    engine.probe('127.0.0.2', count=2, interval=0.01, callback=lambda t, rtt: replies.append(rtt))
+    while len(replies) < 2:
+        engine.poll()
+    assert all(rtt > 0 for rtt in replies)
@@ -0,0 +1,32 @@
+import json
+import logging
+import time
+
+import mock
+
+from platform_agent.config.logger import LogShipper
+
+
+def test_shipper_deduplicates_and_rate_limits():
+    session = mock.Mock()
+    shipper = LogShipper(session)
+    shipper.burst = 2
+    shipper.rate = 0
+    created = time.time()
+    records = [('DEBUG', 'same', {}, created)] * 5 + [('DEBUG', f"msg {i}", {}, created) for i in range(3)]
+    records.append(('ERROR', 'failed', {}, created))
+    shipper.ship(records)
+    sent = [json.loads(call.args[0])['data'] for call in session.send_log.call_args_list]
+    assert sent == [
+        {'severity': 'DEBUG', 'message': 'same', 'metadata': {}, 'count': 5},
+        {'severity': 'DEBUG', 'message': 'msg 0', 'metadata': {}},
+        {'severity': 'ERROR', 'message': 'failed', 'metadata': {}},
+    ]
+
+
+def test_shipper_level_filter():
+    with mock.patch.dict('os.environ', {'SYNTROPY_REMOTE_LOG_LEVEL': 'warning'}):
+        shipper = LogShipper(mock.Mock())
+    shipper.put(logging.INFO, 'INFO', 'skipped', {}, time.time())
+    shipper.put(logging.ERROR, 'ERROR', 'kept', {}, time.time())
+    assert shipper.queue.qsize() == 1
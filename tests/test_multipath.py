@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(
+    os.geteuid() != 0 or not shutil.which('ip'), reason="needs root and iproute2 for network namespaces"
+)
+
+
+def ip(*args):
+    subprocess.run(('ip',) + args, check=True, capture_output=True)
+
+
+@pytest.fixture
+def namespaces():
+    """An agent namespace with two links to a peer namespace, like two mesh tunnels to the same peer."""
+    suffix = uuid.uuid4().hex[:6]
+    agent, peer = f'agent-{suffix}', f'peer-{suffix}'
+    ip('netns', 'add', agent)
+    ip('netns', 'add', peer)
+    try:
+        for i in range(2):
+            ip('-n', agent, 'link', 'add', f'tun{i}', 'type', 'veth', 'peer', 'name', f'tun{i}', 'netns', peer)
+            ip('-n', agent, 'addr', 'add', f'10.9{i}.0.1/24', 'dev', f'tun{i}')
+            ip('-n', peer, 'addr', 'add', f'10.9{i}.0.2/24', 'dev', f'tun{i}')
+            ip('-n', agent, 'link', 'set', f'tun{i}', 'up')
+            ip('-n', peer, 'link', 'set', f'tun{i}', 'up')
+        ip('-n', peer, 'addr', 'add', '10.99.0.1/24', 'dev', 'lo')
+        ip('-n', peer, 'link', 'set', 'lo', 'up')
+        yield agent, peer
+    finally:
+        ip('netns', 'del', agent)
+        ip('netns', 'del', peer)
+
+
+def run_in(namespace, code):
+    return subprocess.run(
+        ['ip', 'netns', 'exec', namespace, sys.executable, '-c', code],
+        check=True, capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': REPO}, timeout=60
+    ).stdout
+
+
+def test_weighted_multipath_route_uses_every_tunnel(namespaces):
+    agent, _ = namespaces
+    result = json.loads(run_in(agent, """
+import json, socket, subprocess
+from platform_agent.routes.routes import Routes, enable_flow_hashing
+
+def route():
+    return subprocess.run(['ip', 'route', 'show', '10.99.0.0/24'], capture_output=True, text=True).stdout
+
+def tx_packets():
+    return [int(open(f'/sys/class/net/tun{i}/statistics/tx_packets').read()) for i in range(2)]
+
+routes = Routes()
+enable_flow_hashing()
+result = {'failed': routes.reroute_multipath({'10.99.0.0/24': [('tun0', '10.90.0.2', 3), ('tun1', '10.91.0.2', 1)]})}
+result['multipath'] = route()
+before = tx_packets()
+# Every socket is a flow of its own, with its own source port
+for _ in range(64):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(b'probe', ('10.99.0.1', 9))
+result['sent'] = [after - start for after, start in zip(tx_packets(), before)]
+result['failed_single'] = routes.reroute_multipath({'10.99.0.0/24': [('tun1', '10.91.0.2', 1)]})
+result['single'] = route()
+result['hash_policy'] = open('/proc/sys/net/ipv4/fib_multipath_hash_policy').read().strip()
+print(json.dumps(result))
+"""))
+    assert result['failed'] == {}
+    assert 'nexthop via 10.90.0.2 dev tun0 weight 3' in result['multipath']
+    assert 'nexthop via 10.91.0.2 dev tun1 weight 1' in result['multipath']
+    assert result['hash_policy'] == '1'
+    # Flows are spread over both tunnels, most of them over the heavier one
+    assert result['sent'][0] > result['sent'][1] > 0
+    assert result['failed_single'] == {}
+    assert result['single'].startswith('10.99.0.0/24 via 10.91.0.2 dev tun1')
+
+
+def test_multipath_route_deleted_by_any_of_its_tunnels(namespaces):
+    agent, _ = namespaces
+    result = json.loads(run_in(agent, """
+import json, subprocess
+from platform_agent.routes.routes import Routes
+
+routes = Routes()
+failed = routes.reroute_multipath({'10.99.0.0/24': [('tun0', '10.90.0.2', 3), ('tun1', '10.91.0.2', 1)]})
+# The peer behind the lighter hop goes away, deleted like WgConf does, through its own Routes
+Routes().ip_route_del('tun1', ['10.99.0.0/24'])
+print(json.dumps({'failed': failed, 'route': subprocess.run(
+    ['ip', 'route', 'show', '10.99.0.0/24'], capture_output=True, text=True
+).stdout}))
+"""))
+    assert result['failed'] == {}
+    assert result['route'] == ''
@@ -0,0 +1,31 @@
+import mock
+
+from platform_agent.network.network_info import BandwidthSampler, COUNTERS
+
+
+def link(ifname, value):
+    msg = mock.Mock()
+    attrs = {'IFLA_IFNAME': ifname, 'IFLA_STATS64': {key: value for key in COUNTERS}}
+    msg.get_attr.side_effect = attrs.get
+    return msg
+
+
+def test_one_dump_per_cycle_for_all_interfaces():
+    ip_route = mock.Mock()
+    sampler = BandwidthSampler(ip_route=ip_route)
+    ip_route.get_links.return_value = [link('0000000001p0gNo', 0), link('eth0', 0)]
+    with mock.patch('time.monotonic', return_value=100.0):
+        assert sampler.sample(10) == []
+    ip_route.get_links.return_value = [link('0000000001p0gNo', 20000000), link('0000000002p0gNo', 5)]
+    with mock.patch('time.monotonic', return_value=110.0):
+        result = sampler.sample(10)
+    assert ip_route.get_links.call_count == 2
+    assert result == [{
+        'iface': '0000000001p0gNo', 'tx_speed_mbps': 2.0, 'rx_speed_mbps': 2.0,
+        'tx_dropped': 20000000, 'tx_errors': 20000000, 'tx_packets': 20000000,
+        'rx_dropped': 20000000, 'rx_errors': 20000000, 'rx_packets': 20000000, 'interval': 10,
+    }]
+    # Recreated interface, counters went back
+    ip_route.get_links.return_value = [link('0000000001p0gNo', 1), link('0000000002p0gNo', 5)]
+    with mock.patch('time.monotonic', return_value=120.0):
+        assert [data['iface'] for data in sampler.sample(10)] == ['0000000002p0gNo']
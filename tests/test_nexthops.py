@@ -0,0 +1,117 @@
+import errno
+
+import mock
+from pyroute2.netlink.rtnl import RTM_NEWROUTE
+
+from platform_agent.routes import routes
+from platform_agent.routes.nexthops import NexthopRoutes, RTM_NEWNEXTHOP, RTM_DELNEXTHOP, NEXTHOP_ID_BASE
+from platform_agent.routes.routes import Routes
+
+
+class FakeBatch:
+    def __init__(self):
+        self.sent = []
+        self.codes = {}
+
+    def run_raw(self, messages):
+        if messages:
+            self.sent.append([msg_type for msg_type, _, _ in messages])
+        return [self.codes.get(msg_type, 0) for msg_type, _, _ in messages]
+
+
+def test_destinations_leaving_a_gateway_together_move_in_one_update():
+    batch = FakeBatch()
+    nexthops = NexthopRoutes()
+    dests = [f"10.{i}.0.0/24" for i in range(100)]
+    assert nexthops.move({dest: (3, '10.69.0.1') for dest in dests}, batch) == {}
+    # One nexthop object, then one route per destination
+    assert batch.sent[0] == [RTM_NEWNEXTHOP]
+    assert batch.sent[1] == [RTM_NEWROUTE] * 100
+    assert set(nexthops.slots.values()) == {NEXTHOP_ID_BASE}
+
+    batch.sent = []
+    assert nexthops.move({dest: (4, '10.70.0.1') for dest in dests}, batch) == {}
+    assert batch.sent == [[RTM_NEWNEXTHOP]]
+    assert nexthops.targets == {NEXTHOP_ID_BASE: (4, '10.70.0.1')}
+
+    # A single destination moving gets a route to a new slot
+    batch.sent = []
+    assert nexthops.move({dests[0]: (3, '10.69.0.1')}, batch) == {}
+    assert batch.sent == [[RTM_NEWNEXTHOP], [RTM_NEWROUTE]]
+    assert nexthops.slots[dests[0]] == NEXTHOP_ID_BASE + 1
+
+
+def test_unused_slots_are_released_and_failures_reported():
+    batch = FakeBatch()
+    nexthops = NexthopRoutes()
+    nexthops.move(
+        {'10.1.0.0/24': (3, '10.69.0.1'), '10.2.0.0/24': (4, '10.70.0.1'), '10.3.0.0/24': (4, '10.70.0.1')}, batch
+    )
+    batch.sent = []
+    # The destinations of the second slot split up, it is deleted once empty
+    nexthops.move({'10.2.0.0/24': (3, '10.69.0.1'), '10.3.0.0/24': (5, '10.71.0.1')}, batch)
+    assert batch.sent == [[RTM_NEWNEXTHOP], [RTM_NEWROUTE, RTM_NEWROUTE], [RTM_DELNEXTHOP]]
+    assert set(nexthops.targets) == {NEXTHOP_ID_BASE, NEXTHOP_ID_BASE + 2}
+    batch.codes[RTM_NEWNEXTHOP] = errno.EOPNOTSUPP
+    assert nexthops.move({'10.4.0.0/24': (6, '10.72.0.1')}, batch) == {'10.4.0.0/24': errno.EOPNOTSUPP}
+
+
+@mock.patch.object(routes, 'nexthop_objects_enabled', return_value=False)
+@mock.patch.object(routes, 'IPRoute')
+@mock.patch.object(routes, 'RouteBatch')
+def test_reroute_falls_back_to_route_gateways(patch_batch, patch_ip_route, patch_enabled):
+    patch_batch.return_value.run.return_value = [0, errno.ENETUNREACH]
+    route = Routes()
+    route.links = mock.Mock(index=lambda ifname: {'wg0': 3}.get(ifname))
+    route.cache = mock.Mock()
+    failed = route.reroute({
+        '10.1.0.0/24': ('wg0', '10.69.0.1'), '10.2.0.0/24': ('wg0', '10.69.0.1'), '10.3.0.0/24': ('gone', '10.70.0.1')
+    })
+    assert failed == {'10.2.0.0/24': errno.ENETUNREACH, '10.3.0.0/24': errno.ENODEV}
+    patch_batch.return_value.run.assert_called_once_with([
+        ('replace', {'dst': '10.1.0.0/24', 'gateway': '10.69.0.1'}),
+        ('replace', {'dst': '10.2.0.0/24', 'gateway': '10.69.0.1'}),
+    ])
+    route.cache.update.assert_called_once_with('10.1.0.0/24', 3, '10.69.0.1')
+    assert not patch_batch.return_value.run_raw.called
+
+
+@mock.patch.object(routes, 'NEXTHOPS', NexthopRoutes())
+@mock.patch.object(routes, 'nexthop_objects_enabled', return_value=True)
+@mock.patch.object(routes, 'IPRoute')
+@mock.patch.object(routes, 'RouteBatch')
+def test_routes_deleted_through_another_instance(patch_batch, patch_ip_route, patch_enabled):
+    nexthops = routes.NEXTHOPS
+    batches = [FakeBatch(), FakeBatch()]
+    for batch in batches:
+        batch.run = mock.Mock(side_effect=lambda requests: [0] * len(requests))
+    patch_batch.side_effect = batches
+    rerouting, wg_conf = Routes(), Routes()
+    assert rerouting.nexthops is wg_conf.nexthops is nexthops
+    for route in (rerouting, wg_conf):
+        route.links = mock.Mock(index=lambda ifname: {'wg0': 3, 'wg1': 4}.get(ifname))
+        route.cache = mock.Mock()
+    assert rerouting.reroute({'10.1.0.0/24': ('wg0', '10.69.0.1'), '10.2.0.0/24': ('wg0', '10.69.0.1')}) == {}
+
+    wg_conf.ip_route_del('wg0', ['10.1.0.0/24'])
+    batches[1].run.assert_called_once_with([('del', {'dst': '10.1.0.0/24'})])
+    assert nexthops.slots == {'10.2.0.0/24': NEXTHOP_ID_BASE}
+    wg_conf.ip_route_del('wg0', ['10.2.0.0/24'])
+    assert nexthops.slots == {} and nexthops.targets == {}
+    assert batches[1].sent == [[RTM_DELNEXTHOP]]
+
+
+@mock.patch.object(routes, 'IPRoute')
+@mock.patch.object(routes, 'RouteBatch')
+def test_delete_retried_without_oif_for_unknown_nexthop_routes(patch_batch, patch_ip_route):
+    patch_batch.return_value.run.side_effect = [[errno.ESRCH, errno.ESRCH], [0]]
+    route = Routes()
+    route.nexthops = NexthopRoutes()
+    route.links = mock.Mock(index=lambda ifname: {'wg0': 3}.get(ifname))
+    route.cache = mock.Mock(get=lambda dst: [{'dst': dst, 'oif': 3}] if dst == '10.1.0.0/24' else [])
+    route.ip_route_del('wg0', ['10.1.0.0/24', '10.2.0.0/24'])
+    assert patch_batch.return_value.run.call_args_list == [
+        mock.call([('del', {'dst': '10.1.0.0/24', 'oif': 3}), ('del', {'dst': '10.2.0.0/24', 'oif': 3})]),
+        mock.call([('del', {'dst': '10.1.0.0/24'})]),
+    ]
+    route.cache.discard.assert_called_once_with('10.1.0.0/24', 3)
@@ -0,0 +1,70 @@
+import json
+import zlib
+
+import mock
+
+from platform_agent.lib.outbound import OutboundWriter, CONTROL, TELEMETRY
+from platform_agent.lib.spool import TelemetrySpool
+
+
+def fake_ws():
+    ws = mock.Mock()
+    ws.sock.status = 101
+    return ws
+
+
+def drain(writer):
+    while True:
+        lane, items = writer._next()
+        if not items:
+            break
+        writer.send(lane, items)
+
+
+def test_control_before_telemetry_and_batching():
+    ws = fake_ws()
+    writer = OutboundWriter(ws, batch=True, compress=False)
+    for i in range(3):
+        writer.put(json.dumps({'type': 'LOGGER', 'data': i}), TELEMETRY)
+    writer.put(json.dumps({'type': 'CONFIG_INFO'}), CONTROL)
+    writer.stop_outbound_writer.set()
+    drain(writer)
+    frames = [json.loads(call.args[0]) for call in ws.send.call_args_list]
+    assert frames[0]['type'] == 'CONFIG_INFO'
+    assert frames[1]['type'] == 'BATCH'
+    assert [msg['data'] for msg in frames[1]['data']] == [0, 1, 2]
+
+
+def test_bounded_lane_and_compression():
+    ws = fake_ws()
+    writer = OutboundWriter(ws, telemetry_limit=2, batch=False, compress=True)
+    writer.compress_min = 0
+    for i in range(5):
+        writer.put(json.dumps({'data': i}), TELEMETRY)
+    writer.stop_outbound_writer.set()
+    drain(writer)
+    sent = [json.loads(zlib.decompress(call.args[0])) for call in ws.send.call_args_list]
+    assert sent == [{'data': 3}, {'data': 4}]
+
+
+def test_offline_telemetry_is_spooled_and_replayed(tmp_path):
+    ws = fake_ws()
+    ws.sock.status = None
+    spool = TelemetrySpool(str(tmp_path / 'telemetry.spool'), 4096)
+    writer = OutboundWriter(ws, batch=False, compress=False, spool=spool)
+    writer.replay_ack = True
+    writer.put(json.dumps({'data': 1}), TELEMETRY)
+    writer.put(json.dumps({'data': 2}), TELEMETRY)
+    writer.stop_outbound_writer.set()
+    drain(writer)
+    writer.replay()
+    ws.send.assert_not_called()
+
+    ws.sock.status = 101
+    writer.replay()
+    frame = json.loads(ws.send.call_args.args[0])
+    assert frame['type'] == 'TELEMETRY_REPLAY'
+    assert frame['data']['messages'] == [{'data': 1}, {'data': 2}]
+    assert len(TelemetrySpool(spool.path, 4096).read(10)) == 2
+    spool.ack(frame['data']['last_seq'])
+    assert TelemetrySpool(spool.path, 4096).read(10) == []
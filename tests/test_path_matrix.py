@@ -0,0 +1,76 @@
+import pytest
+
+from platform_agent.rerouting import path_matrix
+from platform_agent.rerouting.path_matrix import PathMatrix
+from platform_agent.rerouting.path_selector import PathSelector
+
+ROUTING_INFO = {
+    '10.1.0.0/24': {'ifaces': {'b': {'internal_ip': '10.69.0.2/16'}, 'a': {'internal_ip': '10.69.0.1/16'}}},
+    '10.2.0.0/24': {'ifaces': {'a': {'internal_ip': '10.69.0.1/16'}}},
+}
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'python'])
+def vectorised(request):
+    if request.param and path_matrix.np is None:
+        pytest.skip("numpy not installed")
+    return request.param
+
+
+def cycle(selector, matrix, a, b, now):
+    # Latency and loss per address, 10.69.0.1 is path a and 10.69.0.2 path b
+    return selector.decide_matrix(matrix, [a[0], b[0]], [a[1], b[1]], now=now)
+
+
+def test_matrix_selection_matches_per_destination_decisions(vectorised):
+    matrix = PathMatrix(ROUTING_INFO, vectorised=vectorised)
+    assert matrix.addresses == ['10.69.0.1', '10.69.0.2']
+    assert matrix.ifaces == [['a', 'b'], ['a']]
+    selector = PathSelector(alpha=0.5, margin_ms=5, margin_ratio=0.1, hold=3, half_life=60)
+    # Equal scores go to the first interface
+    assert cycle(selector, matrix, (20, 0), (20, 0), 0) == [('10.1.0.0/24', 'a'), ('10.2.0.0/24', 'a')]
+    assert cycle(selector, matrix, (20, 0), (18, 0), 1) == []
+    # A lasting improvement moves the route after the hold, a dead path at once
+    changes = [cycle(selector, matrix, (40, 0), (10, 0), now) for now in range(2, 7)]
+    assert [change for change in changes if change] == [[('10.1.0.0/24', 'b')]]
+    assert cycle(selector, matrix, (10, 0), (5000, 1), 7) == [('10.1.0.0/24', 'a')]
+    assert selector.current('10.1.0.0/24') == 'a'
+
+
+def test_rebuilt_matrix_keeps_scores_and_routes(vectorised):
+    selector = PathSelector(alpha=0.5, margin_ms=5, margin_ratio=0.1, hold=1, half_life=60)
+    matrix = PathMatrix(ROUTING_INFO, vectorised=vectorised)
+    cycle(selector, matrix, (20, 0), (30, 0), 0)
+    rebuilt = PathMatrix(ROUTING_INFO, previous=matrix, vectorised=vectorised)
+    assert cycle(selector, rebuilt, (20, 0), (30, 0), 1) == []
+    # A route that could not be installed is decided again
+    selector.failed('10.2.0.0/24', rebuilt)
+    assert cycle(selector, rebuilt, (20, 0), (30, 0), 2) == [('10.2.0.0/24', 'a')]
+
+
+def test_multipath_weights_prune_clearly_worse_paths(vectorised):
+    routing_info = {'10.1.0.0/24': {'ifaces': {
+        iface: {'internal_ip': f'10.69.0.{i}/16'} for i, iface in enumerate('abc', 1)
+    }}}
+    matrix = PathMatrix(routing_info, vectorised=vectorised)
+    selector = PathSelector(alpha=1, margin_ms=5, prune_ratio=1.5, max_weight=10)
+    # c scores more than 1.5 times the best and is left out
+    assert selector.decide_multipath(matrix, [10, 12, 40], [0, 0, 0]) == [('10.1.0.0/24', {'a': 10, 'b': 8})]
+    # Small weight changes keep the installed route
+    assert selector.decide_multipath(matrix, [10, 13, 40], [0, 0, 0]) == []
+    assert selector.decide_multipath(matrix, [5000, 12, 40], [1, 0, 0]) == [('10.1.0.0/24', {'b': 10})]
+    # Without any answering path the best one stays
+    assert selector.decide_multipath(matrix, [5000, 5000, 5000], [1, 1, 1]) == [('10.1.0.0/24', {'a': 1})]
+
+
+def test_multipath_route_reinstalled_when_a_path_leaves(vectorised):
+    matrix = PathMatrix(ROUTING_INFO, vectorised=vectorised)
+    selector = PathSelector(alpha=1, margin_ms=5, prune_ratio=1.5, max_weight=10)
+    assert selector.decide_multipath(matrix, [10, 11], [0, 0]) == [
+        ('10.1.0.0/24', {'a': 10, 'b': 9}), ('10.2.0.0/24', {'a': 10})
+    ]
+    # The peer behind b is removed from 10.1.0.0/24, its route still has the b hop
+    routing_info = {**ROUTING_INFO, '10.1.0.0/24': {'ifaces': {'a': {'internal_ip': '10.69.0.1/16'}}}}
+    rebuilt = PathMatrix(routing_info, previous=matrix, vectorised=vectorised)
+    assert selector.decide_multipath(rebuilt, [10], [0]) == [('10.1.0.0/24', {'a': 10})]
+    assert selector.decide_multipath(rebuilt, [10], [0]) == []
@@ -0,0 +1,35 @@
+from platform_agent.rerouting.path_selector import PathSelector
+
+
+def run(selector, cycles, a, b, start=0):
+    changes = []
+    for i in range(cycles):
+        iface = selector.decide('10.0.0.0/24', {'a': a, 'b': b}, now=start + i)
+        if iface:
+            changes.append(iface)
+    return changes
+
+
+def test_small_or_short_improvements_keep_the_route():
+    selector = PathSelector(alpha=0.5, margin_ms=5, margin_ratio=0.1, hold=3, half_life=60)
+    assert run(selector, 1, (20, 0), (30, 0)) == ['a']
+    # 2ms better is within the margin
+    assert run(selector, 10, (20, 0), (18, 0), start=1) == []
+    # A single better sample is not held long enough
+    assert run(selector, 1, (20, 0), (1, 0), start=11) == []
+    assert run(selector, 5, (20, 0), (30, 0), start=12) == []
+    # A lasting improvement moves the route after the hold
+    assert run(selector, 5, (40, 0), (10, 0), start=17) == ['b']
+
+
+def test_dead_path_fails_over_at_once_and_flaps_are_damped():
+    selector = PathSelector(alpha=1, margin_ms=5, margin_ratio=0, hold=1, half_life=600)
+    assert run(selector, 1, (10, 0), (20, 0)) == ['a']
+    assert run(selector, 1, (5000, 1), (20, 0), start=1) == ['b']
+    changes = []
+    for i in range(10):
+        fast, slow = (10, 0), (50, 0)
+        changes += run(selector, 1, *((fast, slow) if i % 2 else (slow, fast)), start=2 + i)
+    # Switches add penalty until the destination is suppressed
+    assert 0 < len(changes) < 5
+    assert selector.destinations['10.0.0.0/24'].suppressed
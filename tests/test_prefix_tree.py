@@ -0,0 +1,40 @@
+from platform_agent.lib.prefix_tree import PrefixTree
+
+
+def test_longest_match_and_owners():
+    tree = PrefixTree()
+    tree.insert('10.69.0.0/16', {'agent_id': 1}, key='a')
+    tree.insert('10.69.0.0/24', {'agent_id': 2}, key='b')
+    tree.insert('10.69.0.0/24', {'agent_id': 3}, key='c')
+    tree.insert('fd00::/64', {'agent_id': 4}, key='d')
+    assert str(tree.longest_match('10.69.0.11')[0]) == '10.69.0.0/24'
+    assert tree.longest_match('10.69.5.1')[1] == [{'agent_id': 1}]
+    assert tree.longest_match('10.70.0.1') == (None, [])
+    assert tree.longest_match('fd00::1')[1] == [{'agent_id': 4}]
+    assert tree.owners('10.69.0.0/24') == [{'agent_id': 2}, {'agent_id': 3}]
+    assert len(tree) == 3
+
+
+def test_overlap():
+    tree = PrefixTree()
+    tree.insert('192.168.151.0/24', {'agent_id': 1}, key='a')
+    tree.insert('172.17.0.0/16', {'agent_id': 2}, key='b')
+    # Exact prefix is not an overlap, supernets and subnets are
+    assert tree.find_overlap('192.168.151.0/24') == (None, [])
+    assert str(tree.find_overlap('192.168.0.0/16')[0]) == '192.168.151.0/24'
+    assert str(tree.find_overlap('172.17.3.0/24')[0]) == '172.17.0.0/16'
+    assert tree.find_overlap('192.168.152.0/24') == (None, [])
+    # A substring of another prefix does not match
+    assert tree.find_overlap('2.17.0.0/16') == (None, [])
+
+
+def test_remove_prunes():
+    tree = PrefixTree()
+    tree.insert('10.0.0.0/8', 'x', key='a')
+    tree.insert('10.1.0.0/16', 'y', key='b')
+    tree.remove('10.1.0.0/16', key='b')
+    tree.remove('10.1.0.0/16', key='missing')
+    assert len(tree) == 1
+    assert tree.find_overlap('10.1.0.0/16')[1] == ['x']
+    tree.remove('10.0.0.0/8', key='a')
+    assert tree.roots[4].children == [None, None]
@@ -0,0 +1,34 @@
+import mock
+
+from platform_agent.network.icmp import Target
+from platform_agent.network.probe_scheduler import ProbeScheduler
+
+
+def fake_engine():
+    engine = mock.Mock()
+    engine.probe.side_effect = lambda address, count, interval, timeout, callback: Target(
+        address, count, interval, timeout, callback
+    )
+    return engine
+
+
+def test_consumers_share_one_target_per_address():
+    engine = fake_engine()
+    scheduler = ProbeScheduler(engine)
+    scheduler.subscribe('rerouting', ['10.69.0.1', '10.69.0.2'], 1)
+    scheduler.subscribe('peer_watcher', ['10.69.0.1'], 15)
+    assert engine.probe.call_count == 2
+    assert scheduler.targets['10.69.0.1'].interval == 1
+
+    target = scheduler.targets['10.69.0.1']
+    target.callback(target, 2.0)
+    target.callback(target, None)
+    assert scheduler.stats('10.69.0.1', samples=2)['packet_loss'] == 0.5
+    assert scheduler.measure('peer_watcher', ['10.69.0.1'], 15, samples=2, timeout=0)['10.69.0.1']['latency_ms'] == 2.0
+    assert engine.probe.call_count == 2
+
+    # Only the slower consumer is left, the address is probed less often
+    scheduler.unsubscribe('rerouting')
+    engine.cancel.assert_any_call(target)
+    assert scheduler.targets['10.69.0.1'].interval == 15
+    assert '10.69.0.2' not in scheduler.targets
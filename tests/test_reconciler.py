@@ -0,0 +1,61 @@
+import mock
+
+from platform_agent.wireguard.firewall import FORWARD_RULES
+from platform_agent.wireguard.reconciler import Reconciler, ActualState, ROUTE_CACHE
+
+
+def actual_state(agent_dump):
+    links, devices, routes = {}, {}, {}
+    for index, cmd in enumerate(agent_dump['vpn']):
+        args = cmd['args']
+        if cmd['fn'] == 'create_interface':
+            links[args['ifname']] = {'index': index, 'up': True, 'addrs': {args['internal_ip']}}
+            devices[args['ifname']] = {'public_key': f"key-{args['ifname']}", 'listen_port': args['listen_port'], 'peers': []}
+            routes[args['ifname']] = set()
+        else:
+            devices[args['ifname']]['peers'].append({
+                'public_key': args['public_key'],
+                'allowed_ips': list(args['allowed_ips']),
+                'endpoint': f"{args['endpoint_ipv4']}:{args['endpoint_port']}",
+                'keep_alive_interval': 15,
+            })
+            routes[args['ifname']] |= set(args['allowed_ips'])
+    return ActualState(links, devices, routes, None)
+
+
+@mock.patch('platform_agent.wireguard.reconciler.Reconciler.public_key', staticmethod(lambda ifname: f"key-{ifname}"))
+def test_unchanged_config_has_no_changes(agent_dump):
+    reconciler = Reconciler(mock.Mock())
+    assert reconciler.diff(agent_dump['vpn'], actual_state(agent_dump)) == []
+
+
+@mock.patch('platform_agent.wireguard.reconciler.Reconciler.public_key', staticmethod(lambda ifname: f"key-{ifname}"))
+def test_diff_only_contains_delta(agent_dump):
+    state = actual_state(agent_dump)
+    state.links['p2p_1_gone'] = {'index': 99, 'up': True, 'addrs': set()}
+    state.routes['pmesh_51_eg0r'] |= {'172.16.0.0/24'}
+    state.routes['smesh_51_eyus'] -= {'10.69.0.13/32'}
+    agent_dump['vpn'][1]['args']['allowed_ips'].append('10.10.0.0/24')
+    changes = Reconciler(mock.Mock()).diff(agent_dump['vpn'], state)
+    assert [(change.action, change.ifname) for change in changes] == [
+        ('remove_interface', 'p2p_1_gone'),
+        ('delete_routes', 'pmesh_51_eg0r'),
+        ('add_peer', 'pmesh_51_eg0r'),
+        ('add_routes', 'smesh_51_eyus'),
+    ]
+    assert changes[1].args['ip_list'] == ['172.16.0.0/24']
+    assert changes[3].args['ip_list'] == ['10.69.0.13/32']
+
+
+@mock.patch.object(FORWARD_RULES, 'sources', {'10.69.0.11/32', '10.69.0.12/32'})
+@mock.patch.object(ROUTE_CACHE, 'refresh')
+@mock.patch('platform_agent.wireguard.firewall.subprocess.run')
+def test_forward_rules_read_from_the_kernel(patch_run, patch_refresh):
+    # The cached rules are stale, 10.69.0.12/32 was removed outside the agent
+    patch_run.return_value.stdout = '*filter\n-A FORWARD -s 10.69.0.11/32 -j ACCEPT\nCOMMIT\n'
+    wgconf = mock.Mock()
+    wgconf.routes.ip_route.get_links.return_value = []
+    wgconf.routes.ip_route.get_addr.return_value = []
+    state = Reconciler(wgconf).read_state()
+    assert state.forward == {'10.69.0.11/32'}
+    assert patch_run.call_args[0][0][0] == 'iptables-save'
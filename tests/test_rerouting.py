@@ -0,0 +1,37 @@
+import mock
+
+from platform_agent.lib.generation import CONFIG_GENERATION
+from platform_agent.network.iface_watcher import IFACE_STATE
+from platform_agent.rerouting import rerouting
+from platform_agent.rerouting.rerouting import RoutingModel
+
+
+@mock.patch.object(IFACE_STATE, 'watched', True)
+@mock.patch.object(rerouting, 'get_routing_info', return_value=({}, []))
+def test_routing_model_rebuilt_only_on_changes(patch_get_routing_info):
+    model = RoutingModel(mock.Mock(), max_age=60)
+    model.get()
+    model.get()
+    assert patch_get_routing_info.call_count == 1
+    CONFIG_GENERATION.bump()
+    model.get()
+    assert patch_get_routing_info.call_count == 2
+    with mock.patch.object(IFACE_STATE, 'version', IFACE_STATE.version + 1):
+        model.get()
+    assert patch_get_routing_info.call_count == 3
+
+
+@mock.patch.object(rerouting, 'failure_detection_enabled', return_value=True)
+@mock.patch.object(rerouting, 'FailureDetector')
+@mock.patch.object(rerouting, 'Routes')
+@mock.patch.object(rerouting, 'WireGuardRead')
+@mock.patch.object(rerouting, 'WireGuardNetlink')
+def test_failure_detector_runs_with_the_rerouting_thread(*patches):
+    detector = patches[3]
+    thread = rerouting.Rerouting(mock.Mock())
+    assert not detector.called
+    thread.stop_rerouting.set()
+    thread.run()
+    detector.assert_called_once_with(on_change=thread.peer_changed)
+    detector.return_value.start.assert_called_once_with()
+    detector.return_value.join.assert_called_once_with()
@@ -0,0 +1,31 @@
+import sys
+
+import mock
+
+from platform_agent.lib.startup import cached_device_id, network_watcher_class, run_parallel, start
+
+
+def test_device_id_is_generated_once(tmp_path):
+    path = str(tmp_path / 'device-id')
+    generate = mock.Mock(return_value='abc')
+    assert cached_device_id(generate, path) == 'abc'
+    assert cached_device_id(generate, path) == 'abc'
+    assert generate.call_count == 1
+
+
+def test_failing_step_does_not_stop_others():
+    def fail():
+        raise RuntimeError('boom')
+
+    assert run_parallel({'ok': lambda: 1, 'fail': fail}) == {'ok': 1, 'fail': None}
+
+
+def test_started_threads_are_kept():
+    thread = mock.Mock()
+    assert run_parallel({'thread': lambda: start(thread)}) == {'thread': thread}
+    thread.start.assert_called_once_with()
+
+
+def test_unused_network_api_is_not_imported():
+    assert network_watcher_class('') is None
+    assert 'platform_agent.network.kubernetes_watcher' not in sys.modules
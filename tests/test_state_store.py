@@ -0,0 +1,79 @@
+from platform_agent.files.state_store import StateStore
+
+
+def test_indexes(agent_dump, tmp_path):
+    store = StateStore(path=str(tmp_path / 'config_dump'))
+    store.replace(agent_dump)
+    public_key = agent_dump['vpn'][1]['args']['public_key']
+    assert store.peer_metadata(public_key) == agent_dump['vpn'][1]['metadata']
+    assert store.peers_metadata(identifier='ifname')['smesh_51_eyus'] == agent_dump['vpn'][3]['metadata']
+    assert store.interface('pmesh_51_eg0r') == agent_dump['vpn'][0]
+    assert [cmd['args']['public_key'] for cmd in store.interface_peers('pmesh_51_eg0r')] == [public_key]
+
+
+def test_journal_replay(agent_dump, tmp_path):
+    path = str(tmp_path / 'config_dump')
+    store = StateStore(path=path)
+    store.replace(agent_dump)
+    removed = agent_dump['vpn'][1]['args']
+    store.apply({'fn': 'remove_peer', 'args': {'ifname': removed['ifname'], 'public_key': removed['public_key']}})
+    store.apply({
+        'fn': 'add_peer',
+        'args': {'ifname': 'pmesh_51_eg0r', 'public_key': 'NEW_KEY', 'allowed_ips': ['10.69.0.20/32']},
+        'metadata': {'agent_id': 77},
+    })
+    assert store.journal_size == 2
+
+    reloaded = StateStore(path=path)
+    assert reloaded.peer_metadata(removed['public_key']) == {}
+    assert reloaded.agent_id('10.69.0.20/32') == 77
+    assert reloaded.dump() == store.dump()
+
+
+def test_compaction(agent_dump, tmp_path):
+    path = tmp_path / 'config_dump'
+    store = StateStore(path=str(path), compact_every=3)
+    for i in range(3):
+        store.apply({
+            'fn': 'add_peer',
+            'args': {'ifname': 'pmesh_51_eg0r', 'public_key': f'KEY_{i}', 'allowed_ips': [f'10.69.1.{i}/32']},
+            'metadata': {'agent_id': i},
+        })
+    assert store.journal_size == 0
+    assert (tmp_path / 'config_dump.journal').read_text() == ''
+    assert StateStore(path=str(path)).agent_peers(2)[0]['args']['public_key'] == 'KEY_2'
+
+
+def test_agent_id_longest_prefix(tmp_path):
+    store = StateStore(path=str(tmp_path / 'config_dump'))
+    store.apply({'fn': 'add_peer', 'args': {
+        'ifname': 'p2p_test', 'public_key': 'key', 'allowed_ips': ['10.69.0.0/16'],
+    }, 'metadata': {'agent_id': 12}})
+    assert store.agent_id('10.69.4.0/24') == 12
+    assert store.agent_id('10.70.0.0/24') == "UNKNOWN"
+    store.apply({'fn': 'remove_peer', 'args': {
+        'ifname': 'p2p_test', 'public_key': 'key', 'allowed_ips': ['10.69.0.0/16'],
+    }})
+    assert store.agent_id('10.69.4.0/24') == "UNKNOWN"
+
+
+def test_append_after_torn_journal(agent_dump, tmp_path):
+    path = tmp_path / 'config_dump'
+    store = StateStore(path=str(path))
+    store.replace(agent_dump)
+    store.apply({'fn': 'add_peer', 'args': {
+        'ifname': 'pmesh_51_eg0r', 'public_key': 'KEY_1', 'allowed_ips': ['10.69.1.1/32'],
+    }, 'metadata': {'agent_id': 1}})
+    with open(f"{path}.journal", 'a') as journal:
+        journal.write('{"fn": "add_peer", "args": {"ifn')
+
+    reloaded = StateStore(path=str(path))
+    assert reloaded.journal_size == 1
+    reloaded.apply({'fn': 'add_peer', 'args': {
+        'ifname': 'pmesh_51_eg0r', 'public_key': 'KEY_2', 'allowed_ips': ['10.69.1.2/32'],
+    }, 'metadata': {'agent_id': 2}})
+
+    again = StateStore(path=str(path))
+    assert again.journal_size == 2
+    assert again.agent_id('10.69.1.1/32') == 1
+    assert again.agent_id('10.69.1.2/32') == 2
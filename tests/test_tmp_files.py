@@ -1,10 +1,13 @@
+from platform_agent.files.state_store import StateStore
 from platform_agent.files.tmp_files import get_peer_metadata
 
 import mock
 
 
-@mock.patch('platform_agent.files.tmp_files.read_tmp_file')
-def test_config_info(patch_read_tmp_file, agent_dump, peer_file_read):
-    patch_read_tmp_file.return_value = agent_dump
+@mock.patch('platform_agent.files.tmp_files.get_state_store')
+def test_config_info(patch_get_state_store, agent_dump, peer_file_read, tmp_path):
+    store = StateStore(path=str(tmp_path / 'config_dump'))
+    store.replace(agent_dump)
+    patch_get_state_store.return_value = store
     peer_data = get_peer_metadata()
     assert peer_data == peer_file_read
@@ -0,0 +1,53 @@
+from platform_agent.lib.tsdb import TimeSeriesStore, Ring, Tier, RAW, MINUTE, HOUR
+
+
+def test_windows_and_tiers():
+    store = TimeSeriesStore(raw_points=60, minutes=10, hours=4)
+    start = 1_600_000_000 - 1_600_000_000 % 3600
+    for i in range(3600):
+        store.record('peer.A=.latency_ms', i % 100, ts=start + i)
+
+    recent = store.query(['peer.A=.latency_ms'], start + 3540, start + 3600)['peer.A=.latency_ms']
+    assert recent['tier'] == RAW
+    window, = recent['windows']
+    assert (window['min'], window['max'], window['count']) == (40, 99, 60)
+    assert window['p95'] == 96
+
+    minutes = store.query(['peer.A=.latency_ms'], start + 3000, start + 3600, step=300)['peer.A=.latency_ms']
+    assert minutes['tier'] == MINUTE
+    assert [window['count'] for window in minutes['windows']] == [300, 300]
+
+    hour = store.query(['peer.A=.latency_ms'], start, start + 3600)['peer.A=.latency_ms']
+    assert hour['tier'] == HOUR
+    assert hour['windows'][0]['count'] == 3600
+    assert hour['windows'][0]['avg'] == 49.5
+
+
+def test_bounded_series_and_memory():
+    store = TimeSeriesStore(max_series=2, raw_points=10, minutes=2, hours=2)
+    for name in ('a', 'b', 'c'):
+        for ts in range(1000):
+            store.record(name, 1.0, ts=ts)
+    memory = store.memory()
+    assert store.names() == ['a', 'b']
+    assert memory['series'] == 2
+    assert memory['bytes'] < 4096
+
+
+def test_ring_window_across_wrap():
+    ring = Ring(5, 'If')
+    for ts in range(100, 108):
+        ring.append(ts, ts / 10)
+    assert [ts for ts, _ in ring.rows()] == [103, 104, 105, 106, 107]
+    assert [ts for ts, _ in ring.rows(104, 107)] == [104, 105, 106]
+    assert [ts for ts, _ in ring.rows(106)] == [106, 107]
+    assert list(ring.rows(108)) == []
+
+
+def test_tier_sum_keeps_small_values():
+    tier = Tier(3600, 2)
+    for i in range(3600):
+        tier.add(i, 1_000_000 if i == 0 else 0.1)
+    total = tier.close()[3]
+    assert abs(total - 1_000_359.9) < 1e-6
+    assert next(tier.rows())[3] == total
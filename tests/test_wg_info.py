@@ -1,4 +1,7 @@
+from pyroute2.netlink.generic.wireguard import WireGuard, wgmsg
+
 from platform_agent.cmd.wg_info import WireGuardRead
+from platform_agent.wireguard.wg_netlink import merge_device_messages
 
 import mock
 
@@ -9,3 +12,54 @@ def test_wireguard_read(patch_cmd_read, mock_wg_show, wg_show_dict):
     wg = WireGuardRead()
     wg_info = wg.wg_info()
     assert wg_info == wg_show_dict
+
+
+def build_wg_message(attrs):
+    msg = wgmsg()
+    msg['attrs'] = attrs
+    msg.encode()
+    decoded = wgmsg(msg.data)
+    decoded.decode()
+    return decoded
+
+
+def test_merge_multipart_dump(wg_show_dict):
+    iface = wg_show_dict[0]
+    first, second = iface['peers'][0], iface['peers'][2]
+    messages = [
+        build_wg_message([
+            ['WGDEVICE_A_IFNAME', iface['interface']],
+            ['WGDEVICE_A_PUBLIC_KEY', iface['public_key']],
+            ['WGDEVICE_A_LISTEN_PORT', int(iface['listening_port'])],
+            ['WGDEVICE_A_PEERS', [
+                {'attrs': [
+                    ['WGPEER_A_PUBLIC_KEY', first['peer']],
+                    ['WGPEER_A_LAST_HANDSHAKE_TIME', {'tv_sec': 0, 'tv_nsec': 0}],
+                    ['WGPEER_A_ALLOWEDIPS', WireGuard._wg_build_allowedips(None, first['allowed_ips'])],
+                ]},
+                {'attrs': [
+                    ['WGPEER_A_PUBLIC_KEY', second['peer']],
+                    ['WGPEER_A_LAST_HANDSHAKE_TIME', {'tv_sec': 1600000000, 'tv_nsec': 0}],
+                    ['WGPEER_A_RX_BYTES', 100],
+                    ['WGPEER_A_ALLOWEDIPS', WireGuard._wg_build_allowedips(None, second['allowed_ips'][:2])],
+                ]},
+            ]],
+        ]),
+        # The kernel continues a peer whose allowed ips did not fit in the next message
+        build_wg_message([
+            ['WGDEVICE_A_IFNAME', iface['interface']],
+            ['WGDEVICE_A_PEERS', [
+                {'attrs': [
+                    ['WGPEER_A_PUBLIC_KEY', second['peer']],
+                    ['WGPEER_A_ALLOWEDIPS', WireGuard._wg_build_allowedips(None, second['allowed_ips'][2:])],
+                ]},
+            ]],
+        ]),
+    ]
+    device = merge_device_messages(messages)
+    assert device['public_key'] == iface['public_key']
+    assert device['listen_port'] == int(iface['listening_port'])
+    assert [peer['public_key'] for peer in device['peers']] == [first['peer'], second['peer']]
+    assert device['peers'][0]['last_handshake'] is None
+    assert device['peers'][1]['allowed_ips'] == second['allowed_ips']
+    assert device['peers'][1]['rx_bytes'] == 100
@@ -0,0 +1,84 @@
+import json
+
+import mock
+
+from platform_agent.executors.wg_plan import WgPlan
+
+
+def peer(fn, public_key, allowed_ips, ifname='p2p_test'):
+    return {'fn': fn, 'args': {'ifname': ifname, 'public_key': public_key, 'allowed_ips': allowed_ips}}
+
+
+def test_plan_coalesces_peer_operations():
+    plan = WgPlan()
+    plan.add(1, {'fn': 'create_interface', 'args': {'ifname': 'p2p_test', 'internal_ip': '10.69.0.1/24'}})
+    for i in range(10):
+        plan.add(1, peer('add_peer', 'key_a', [f"10.1.{i}.0/24"]))
+    plan.add(2, peer('add_peer', 'key_b', ['10.2.0.0/24']))
+    plan.add(2, peer('remove_peer', 'key_b', ['10.2.1.0/24']))
+    plan.add(3, peer('remove_peer', 'key_c', ['10.3.0.0/24']))
+    plan.add(3, peer('add_peer', 'key_c', ['10.3.1.0/24']))
+    steps = [(op.fn, op.args.get('public_key')) for op in plan.steps()]
+    assert steps == [
+        ('create_interface', None),
+        ('add_peer', 'key_a'),
+        ('remove_peer', 'key_b'),
+        ('remove_peer', 'key_c'),
+        ('add_peer', 'key_c'),
+    ]
+    assert plan.steps()[1].args['allowed_ips'] == ['10.1.9.0/24']
+    assert plan.steps()[2].args['allowed_ips'] == ['10.2.1.0/24', '10.2.0.0/24']
+    assert plan.requests[2][0].status == 'SUPERSEDED'
+
+
+def test_remove_interface_cancels_queued_peers():
+    plan = WgPlan()
+    plan.add(1, peer('add_peer', 'key_a', ['10.1.0.0/24']))
+    plan.add(1, peer('remove_peer', 'key_b', ['10.2.0.0/24']))
+    plan.add(2, {'fn': 'remove_interface', 'args': {'ifname': 'p2p_test'}})
+    assert [op.fn for op in plan.steps()] == ['remove_peer', 'remove_interface']
+    assert plan.requests[1][0].status == 'SUPERSEDED'
+
+
+@mock.patch('platform_agent.executors.wg_exec.update_tmp_config_dump')
+@mock.patch('platform_agent.executors.wg_exec.WgConf')
+def test_one_response_per_request(patch_wgconf, patch_update):
+    from platform_agent.executors.wg_exec import WgExecutor
+    client = mock.Mock()
+    executor = WgExecutor(client)
+    executor.wgconf.add_peer.return_value = None
+    executor.queue.put({'request_id': 1, 'data': [peer('add_peer', 'key_a', ['10.1.0.0/24'])] * 3})
+    executor.queue.put({'request_id': 2, 'data': peer('add_peer', 'key_a', ['10.1.1.0/24'])})
+    plan = executor.get_from_queue()
+    executor.execute_plan(plan)
+    for request_id, operations in plan.requests.items():
+        executor.send_response(request_id, operations)
+    assert executor.wgconf.add_peer.call_count == 1
+    responses = [json.loads(call.args[0]) for call in client.send.call_args_list]
+    assert [response['id'] for response in responses] == [1, 2]
+    assert [op['status'] for op in responses[0]['operations']] == ['OK'] * 3
+    assert responses[1]['data']['args']['allowed_ips'] == ['10.1.1.0/24']
+
+
+@mock.patch('platform_agent.executors.wg_exec.update_tmp_config_dump')
+@mock.patch('platform_agent.executors.wg_exec.WgConf')
+def test_unexpected_error_fails_only_its_request(patch_wgconf, patch_update):
+    from platform_agent.executors.wg_exec import WgExecutor
+    client = mock.Mock()
+    executor = WgExecutor(client)
+    executor.wgconf.add_peer.side_effect = lambda **args: None
+    executor.wgconf.remove_peer.side_effect = KeyError('p2p_other')
+    executor.queue.put({'request_id': 1, 'data': peer('add_peer', 'key_a', ['10.1.0.0/24'])})
+    executor.queue.put({'request_id': 2, 'data': peer('remove_peer', 'key_b', ['10.2.0.0/24'], ifname='p2p_other')})
+    executor.queue.put({'request_id': 3, 'data': peer('add_peer', 'key_c', ['10.3.0.0/24'])})
+    executor.stop_wg_executor.is_set = mock.Mock(side_effect=[False, True])
+    executor.run()
+    responses = {response['id']: response for response in (
+        json.loads(call.args[0]) for call in client.send.call_args_list
+    )}
+    assert sorted(responses) == [1, 2, 3]
+    assert [op['status'] for op in responses[1]['operations']] == ['OK']
+    assert [op['status'] for op in responses[3]['operations']] == ['OK']
+    assert responses[2]['operations'][0]['status'] == 'ERROR'
+    assert list(responses[2]['error'][0]) == ['remove_peer', 'args']
+    assert executor.wgconf.add_peer.call_count == 2